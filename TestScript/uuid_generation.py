@@ -40,6 +40,8 @@ def test_logger_log_file():
     logger = Logger()
     test_message = "TEST_LOG: Simulated error for UUID logging"
     logger.log(test_message)
+    # Wait for the background writer to write the record
+    logger.flush()
     # Ensure log file exists
     if not os.path.exists(ERROR_LOG_FILE):
         print("[ERROR] Log file does not exist.")
@@ -1,40 +1,779 @@
-from tkinter import messagebox
 import os
 import re
+import sys
 import csv
+import codecs
+import fnmatch
+import posixpath
+import queue
+import atexit
 import logging
-import requests
+import logging.handlers
+import signal
+import argparse
+import time
+import uuid
+import bisect
+import hashlib
+import sqlite3
+import calendar
+import threading
+import json
+import mmap
+import struct
 import ftplib
+import tempfile
+from array import array
+from collections import defaultdict, deque, namedtuple
+from contextlib import contextmanager
+from functools import partial, wraps
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from decimal import Decimal
 from datetime import datetime
-from tkinter import Button, Entry, END, Frame, messagebox, Listbox, Label, StringVar, Scrollbar, Tk
+from urllib.parse import quote
+
+try:
+    from re import _parser as regex_parser
+except ImportError:  # Python < 3.11
+    import sre_parse as regex_parser
 
 # === CONFIGURATION ===
 VALID_DIR = "valid_files"
 ERROR_LOG_DIR = "error_logs"
 ERROR_LOG_FILE = os.path.join(ERROR_LOG_DIR, "error_log.txt")
+FTP_TIMEOUT = 30  # seconds before a stalled control or data socket fails
+UUID_API = "https://www.uuidtools.com/api/generate/v1"
+UUID_API_TIMEOUT = 5
+LOGGER_NAME = "ftp_csv"
+LOG_FORMAT = "%(asctime)s - ERROR - [UUID: %(uuid)s] %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+LOG_BUFFER_SIZE = 1000  # most recent log lines kept in memory for the GUI
+LISTING_TTL = 30  # seconds a cached remote directory listing stays fresh
+LEDGER_FILE = "processed_files.db"
+BATCH_INDEX_FILE = "batch_ids.db"
+MAX_REPORTED_ERRORS = 1000  # default cap on errors collected per file
+UNIQUE_MEMORY_LIMIT = 64 * 1024 * 1024  # bytes per BatchIdSet
+PARALLEL_CHUNK_SIZE = 64 * 1024 * 1024  # bytes of one file per validation task
+ERROR_REPORT_FORMATS = ("jsonl", "csv")
+METRICS_PREFIX = "ftp_csv"
+METRICS_INTERVAL = 15  # seconds between rewrites of the metrics file
+# Upper bounds in seconds of the stage duration histogram buckets
+STAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
 EXPECTED_HEADERS = ["batch_id", "timestamp"] + \
     [f"reading{i}" for i in range(1, 11)]
 
+# One reading that is numeric, has at most three decimals and is <= 9.9.
+READING_PATTERN = r"0*(?:[0-8](?:\.[0-9]{1,3})?|9(?:\.(?:[0-8][0-9]{0,2}|90{0,2}))?)"
+VALID_READINGS = re.compile(",".join([READING_PATTERN] * 10))
+DECIMAL_FORMAT = re.compile(r"^\d+(\.\d{1,3})?$")
+# The rules above as a ValidationSchema definition; see ValidationSchema.
+DEFAULT_SCHEMA = {"columns": [
+    {"name": "batch_id", "unique": True},
+    {"name": "timestamp"},
+] + [{"name": name, "type": "decimal", "max": 9.9, "decimals": 3}
+     for name in EXPECTED_HEADERS[2:]]}
+
+
+class Metrics:
+    """
+    Process-wide registry of counters, gauges and stage timers, exported in
+    the Prometheus text format to a file or over HTTP. An update costs a
+    lock and a dict lookup, so hot paths add up their work per chunk or
+    per file and record it once. Stage durations are a histogram,
+    ftp_csv_stage_seconds, labelled by stage. Metrics recorded in
+    validation worker processes are sent back with drain() and added to
+    the parent's registry with merge().
+    """
 
-class FTPClient:
     def __init__(self):
-        # Initialize FTP client instance and store downloaded file names
-        self.ftp = None
-        self.downloaded_files = []
+        self.reset()
+
+    def reset(self):
+        """Discards every metric."""
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._stages = {}
+        self._gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        """Adds value to the counter ftp_csv_<name>_total."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name, value, **labels):
+        """
+        Sets the gauge ftp_csv_<name>. value may be a callable, which is
+        called on every export (e.g. a queue's qsize).
+        """
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, stage, seconds):
+        """Records one duration of a stage."""
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                # One count per bucket, the overflow bucket, then the sum
+                histogram = self._stages[stage] = [0] * (len(STAGE_BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, stage):
+        """Records the time spent in the enclosed block as one occurrence of stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorator recording every call of a function as one occurrence of stage."""
+        def decorate(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def drain(self):
+        """Returns the counters and stage timings recorded so far and resets them."""
+        with self._lock:
+            snapshot = (dict(self._counters), self._stages)
+            self._counters = defaultdict(float)
+            self._stages = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """Adds a snapshot returned by drain(), e.g. from another process."""
+        counters, stages = snapshot
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] += value
+            for stage, histogram in stages.items():
+                current = self._stages.setdefault(stage, [0] * len(histogram))
+                for i, value in enumerate(histogram):
+                    current[i] += value
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            stages = sorted((stage, list(h)) for stage, h in self._stages.items())
+            gauges = sorted(self._gauges.items(), key=lambda item: item[0])
+        lines = []
+        declared = set()
+
+        def declare(metric, kind):
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} {kind}")
+
+        for (name, labels), value in counters:
+            metric = f"{METRICS_PREFIX}_{name}_total"
+            declare(metric, "counter")
+            lines.append(f"{metric}{self._labels(labels)} {self._number(value)}")
+        for (name, labels), value in gauges:
+            metric = f"{METRICS_PREFIX}_{name}"
+            declare(metric, "gauge")
+            value = value() if callable(value) else value
+            lines.append(f"{metric}{self._labels(labels)} {self._number(value)}")
+        metric = f"{METRICS_PREFIX}_stage_seconds"
+        for stage, histogram in stages:
+            declare(metric, "histogram")
+            count = 0
+            for bound, bucket in zip(STAGE_BUCKETS + ("+Inf",), histogram):
+                count += bucket
+                labels = self._labels((("stage", stage), ("le", str(bound))))
+                lines.append(f"{metric}_bucket{labels} {count}")
+            labels = self._labels((("stage", stage),))
+            lines.append(f"{metric}_sum{labels} {self._number(histogram[-1])}")
+            lines.append(f"{metric}_count{labels} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Writes the metrics to a file, replacing it atomically so a reader
+        such as node_exporter's textfile collector never sees half a file.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+    def write_every(self, path, interval, stop):
+        """Rewrites the metrics file every interval seconds until the stop event is set."""
+        def run():
+            while not stop.wait(interval):
+                self.write(path)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def serve(self, port, host=""):
+        """
+        Serves the metrics at http://host:port/metrics from a background
+        thread. Returns the HTTP server; call shutdown() on it to stop.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes are not worth a log line
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                   for _, value in labels)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value
+                              in zip(labels, escaped)) + "}"
+
+    @staticmethod
+    def _number(value):
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+METRICS = Metrics()
+if hasattr(os, "register_at_fork"):
+    # A forked worker process starts with an empty registry and a new lock,
+    # even if another thread held the lock at the time of the fork.
+    os.register_at_fork(after_in_child=METRICS.reset)
+
+_promote_lock = threading.Lock()
+
+
+def valid_file_name():
+    """Returns the name under which a validated file is stored in VALID_DIR."""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    return f"MED_DATA_{timestamp}.csv"
+
+
+def promote_valid_file(tmp_path, dest_dir=VALID_DIR):
+    """
+    Atomically renames a validated temporary file into dest_dir.
+    Files promoted within the same second get a numeric suffix instead of
+    overwriting each other. Returns the new filename.
+    """
+    with _promote_lock:
+        new_filename = valid_file_name()
+        stem, ext = os.path.splitext(new_filename)
+        counter = 1
+        while os.path.exists(os.path.join(dest_dir, new_filename)):
+            new_filename = f"{stem}_{counter}{ext}"
+            counter += 1
+        os.replace(tmp_path, os.path.join(dest_dir, new_filename))
+    return new_filename
+
+
+def open_ftp_connection(host, user, password, port=0, timeout=FTP_TIMEOUT,
+                        retries=1, backoff=0.5):
+    """
+    Opens a logged-in FTP control connection, retrying failed attempts with
+    exponential backoff. Raises the last error if every attempt fails.
+    """
+    for attempt in range(retries):
+        ftp = ftplib.FTP(timeout=timeout)
+        try:
+            with METRICS.timer("connect"):
+                ftp.connect(host, port)
+                ftp.login(user, password)
+            METRICS.inc("connections_opened")
+            return ftp
+        except ftplib.all_errors:
+            METRICS.inc("connection_failures")
+            ftp.close()
+            if attempt == retries - 1:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def is_connection_error(error):
+    """Returns True if an ftplib error means the control connection is lost."""
+    if isinstance(error, ftplib.error_temp):
+        return str(error).startswith("421")
+    return isinstance(error, (OSError, EOFError))
+
+
+RemoteEntry = namedtuple("RemoteEntry", "name size mtime type")
+
+UNIX_LIST_LINE = re.compile(
+    r"^([-dlbcps])\S{9}\S*\s+\d+\s+\S+\s+(?:\S+\s+)?(\d+)\s+"
+    r"([A-Za-z]{3})\s+(\d{1,2})\s+(\d{1,2}:\d{2}|\d{4})\s(.+)$")
+DOS_LIST_LINE = re.compile(
+    r"^(\d{2})-(\d{2})-(\d{2,4})\s+(\d{1,2}):(\d{2})\s*([AP]M)?\s+"
+    r"(<DIR>|\d+)\s+(.+)$", re.IGNORECASE)
+LIST_TOTAL_LINE = re.compile(r"^total\s+\d+\s*$", re.IGNORECASE)
+LINE_BREAK = re.compile(rb"\r\n?|\n")
+MONTHS = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun",
+     "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
+
+def parse_mlsd_time(value):
+    """Converts an MLSD modify fact (YYYYMMDDHHMMSS[.sss], UTC) to epoch seconds."""
+    try:
+        return calendar.timegm(time.strptime(value[:14], "%Y%m%d%H%M%S"))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_list_line(line, now=None):
+    """
+    Parses one line of a Unix or DOS style LIST response.
+    Returns a RemoteEntry, or None if the line has an unknown format.
+    """
+    match = UNIX_LIST_LINE.match(line)
+    if match:
+        kind, size, month, day, time_or_year, name = match.groups()
+        month = MONTHS.get(month.lower())
+        if month is None:
+            return None
+        now = now or time.time()
+        if ":" in time_or_year:
+            # Recent files show a time instead of the year.
+            hour, minute = map(int, time_or_year.split(":"))
+            year = time.gmtime(now).tm_year
+            mtime = calendar.timegm((year, month, int(day), hour, minute, 0))
+            if mtime > now + 86400:
+                mtime = calendar.timegm(
+                    (year - 1, month, int(day), hour, minute, 0))
+        else:
+            mtime = calendar.timegm((int(time_or_year), month, int(day), 0, 0, 0))
+        if kind == "l":
+            name = name.split(" -> ")[0]
+        entry_type = {"-": "file", "d": "dir", "l": "link"}.get(kind, "other")
+        return RemoteEntry(name, int(size), mtime, entry_type)
+
+    match = DOS_LIST_LINE.match(line)
+    if match:
+        month, day, year, hour, minute, meridian, size, name = match.groups()
+        year = int(year)
+        year += 2000 if year < 70 else 1900 if year < 100 else 0
+        hour = int(hour)
+        if meridian:
+            hour = hour % 12 + (12 if meridian.upper() == "PM" else 0)
+        mtime = calendar.timegm(
+            (year, int(month), int(day), hour, int(minute), 0))
+        if size.upper() == "<DIR>":
+            return RemoteEntry(name, None, mtime, "dir")
+        return RemoteEntry(name, int(size), mtime, "file")
+    return None
+
+
+@METRICS.timed("list")
+def list_directory(ftp, path=""):
+    """
+    Lists a remote directory in a single round trip. Uses MLSD where the
+    server supports it, otherwise parses LIST, and falls back to NLST
+    (names only) as a last resort. Returns a list of RemoteEntry.
+    """
+    try:
+        entries = []
+        for name, facts in ftp.mlsd(path, facts=["type", "size", "modify"]):
+            entry_type = facts.get("type", "").lower()
+            if entry_type in ("cdir", "pdir"):
+                continue
+            size = facts.get("size")
+            entries.append(RemoteEntry(
+                name, int(size) if size is not None else None,
+                parse_mlsd_time(facts.get("modify")),
+                entry_type if entry_type in ("file", "dir") else "other"))
+        return entries
+    except ftplib.error_perm:
+        pass  # MLSD not supported
+
+    lines = []
+    try:
+        ftp.retrlines(f"LIST {path}".rstrip(), lines.append)
+        # Unix servers start the listing with a "total <blocks>" line.
+        entries = [parse_list_line(line) for line in lines
+                   if not LIST_TOTAL_LINE.match(line)]
+        if all(entries):
+            return [e for e in entries if e.name not in (".", "..")]
+    except ftplib.error_perm:
+        pass
+    return [RemoteEntry(os.path.basename(name), None, None, None)
+            for name in ftp.nlst(path) if name]
+
+
+class DirectoryCache:
+    """
+    Cached listing of one remote directory with the name, size, mtime and
+    type of each entry. The listing is refreshed once it is older than
+    `ttl` seconds or after invalidate(); refreshes update the cached
+    entries in place and bump `version` only when something changed.
+    """
+
+    def __init__(self, path="", ttl=LISTING_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.version = 0
+        self.fetched_at = None
+
+    def is_fresh(self):
+        return (self.fetched_at is not None and
+                time.monotonic() - self.fetched_at < self.ttl)
+
+    def get(self, ftp, refresh=False):
+        """
+        Returns the cached entries by name, listing the directory again
+        first if the cache is stale or refresh is True.
+        """
+        if refresh or not self.is_fresh():
+            self.refresh(ftp)
+        return self.entries
+
+    def refresh(self, ftp):
+        """
+        Lists the directory and applies the differences to the cache.
+        Returns a tuple (added, removed, changed) of entry names.
+        """
+        listed = {entry.name: entry for entry in list_directory(ftp, self.path)}
+        removed = [name for name in self.entries if name not in listed]
+        added, changed = [], []
+        for name in removed:
+            del self.entries[name]
+        for name, entry in listed.items():
+            previous = self.entries.get(name)
+            if previous is None:
+                added.append(name)
+            elif previous != entry:
+                changed.append(name)
+            else:
+                continue
+            self.entries[name] = entry
+        if added or removed or changed:
+            self.version += 1
+        self.fetched_at = time.monotonic()
+        return added, removed, changed
+
+    def invalidate(self):
+        """Forces the next get() to list the directory again."""
+        self.fetched_at = None
+
+    def files(self):
+        """Returns the names of all cached entries that are not directories."""
+        return [e.name for e in self.entries.values() if e.type != "dir"]
+
+    def size(self, name):
+        """Returns the cached size of a file, or None if it is not known."""
+        entry = self.entries.get(name)
+        return entry.size if entry is not None else None
+
+
+class RemoteCrawler:
+    """
+    Walks a remote directory tree, listing several directories at once
+    over the connections of an FTPConnectionPool. walk() yields the paths
+    of matching files as soon as their directory has been listed.
+
+    Paths are relative to the server's current directory. A file is
+    yielded if its path matches one of the include globs and none of the
+    exclude globs; a directory matching an exclude glob is not entered.
+    max_depth limits how many levels below root are walked (0 lists root
+    only, None has no limit).
+
+    The listing of every directory is cached between walks and reused
+    while younger than `ttl` seconds. A directory's modification time only
+    changes when entries are added to or removed from it, not deeper down,
+    so after that a listing is only reused without asking the server if it
+    has no subdirectories and its mtime, in a listing of its parent made
+    during this walk, is unchanged. Walking a large tree again thus lists
+    the directories above the leaves and the leaves that got new entries.
+    Files rewritten in place without changing their directory are seen
+    by walk(refresh=True). Directories that cannot be listed are skipped
+    and recorded in `errors` as (path, message).
+    """
+
+    def __init__(self, pool, root="", max_depth=None, include=("*.csv",),
+                 exclude=(), workers=None, ttl=LISTING_TTL):
+        self.pool = pool
+        self.root = root.strip("/")
+        self.max_depth = max_depth
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.workers = workers or pool.size
+        self.ttl = ttl
+        self.caches = {}  # DirectoryCache by directory path
+        self.errors = []
+        self._mtimes = {}  # directory mtimes as of their cached listing
+
+    def walk(self, refresh=False):
+        """
+        Yields the path of every matching file in the tree, in the order
+        directories finish listing. refresh lists every directory again.
+        """
+        self.errors = []
+        visited = set()
+        with ThreadPoolExecutor(self.workers) as listings:
+            pending = {listings.submit(self._list, self.root, None, refresh): (self.root, 0)}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path, depth = pending.pop(future)
+                        visited.add(path)
+                        entries, listed = future.result()
+                        for entry in entries:
+                            child = posixpath.join(path, entry.name)
+                            if self._matches(child, self.exclude):
+                                continue
+                            if entry.type == "dir":
+                                if self.max_depth is None or depth < self.max_depth:
+                                    # A cached listing may hold an old mtime.
+                                    mtime = entry.mtime if listed else None
+                                    pending[listings.submit(
+                                        self._list, child, mtime, refresh)] = (child, depth + 1)
+                            elif self._matches(child, self.include):
+                                yield child
+            finally:
+                for future in pending:
+                    future.cancel()
+        # Forget directories that are no longer in the tree.
+        for path in set(self.caches) - visited:
+            del self.caches[path]
+            self._mtimes.pop(path, None)
+
+    def entry(self, path):
+        """Returns the cached RemoteEntry of a file, or None if it is not known."""
+        directory, name = posixpath.split(path)
+        cache = self.caches.get(directory)
+        return cache.entries.get(name) if cache is not None else None
 
-    def connect(self, host, user, password):
+    @staticmethod
+    def _matches(path, patterns):
+        return any(fnmatch.fnmatchcase(path, pattern) for pattern in patterns)
+
+    def _list(self, path, mtime, refresh):
+        # Runs in a listing thread. Returns the entries of one directory and
+        # whether they were listed just now rather than taken from the cache.
+        cache = self.caches.setdefault(path, DirectoryCache(path, self.ttl))
+        unchanged = (mtime is not None and cache.fetched_at is not None
+                     and self._mtimes.get(path) == mtime
+                     and all(entry.type != "dir" for entry in cache.entries.values()))
+        if not refresh and (cache.is_fresh() or unchanged):
+            return list(cache.entries.values()), False
+        try:
+            # The pool retries on a new connection if this one dropped.
+            self.pool.call(cache.refresh)
+        except ftplib.all_errors as e:
+            self.errors.append((path, str(e) or type(e).__name__))
+            return [], False
+        self._mtimes[path] = mtime
+        return list(cache.entries.values()), True
+
+
+class FileIndex:
+    """
+    In-memory filename index over a list of RemoteEntry. A sorted name
+    array answers prefix queries with bisect, and a trigram index narrows
+    substring, glob and regex queries down to a few candidates before the
+    exact check. Results keep the listing order.
+    """
+
+    def __init__(self, entries=()):
+        self.entries = list(entries)
+        self._sorted = sorted(range(len(self.entries)),
+                              key=lambda i: self.entries[i].name)
+        self._sorted_names = [self.entries[i].name for i in self._sorted]
+        self._trigrams = defaultdict(set)
+        for position, entry in enumerate(self.entries):
+            name = entry.name
+            for i in range(len(name) - 2):
+                self._trigrams[name[i:i + 3]].add(position)
+
+    def search(self, query, mode="substring", min_size=None, max_size=None,
+               modified_after=None, modified_before=None):
+        """
+        Returns the names matching `query`, where mode is one of "prefix",
+        "substring", "glob" or "regex". Size and mtime filters drop entries
+        whose size or mtime is unknown.
+        """
+        if mode == "prefix":
+            positions = self._prefix(query)
+        elif mode == "substring":
+            positions = self._verify(self._candidates([query]),
+                                     lambda name: query in name)
+        elif mode == "glob":
+            positions = self._glob(query)
+        elif mode == "regex":
+            positions = self._regex(query)
+        else:
+            raise ValueError(f"Unknown search mode: {mode}")
+
+        results = []
+        for position in sorted(positions):
+            entry = self.entries[position]
+            if min_size is not None and (entry.size is None or entry.size < min_size):
+                continue
+            if max_size is not None and (entry.size is None or entry.size > max_size):
+                continue
+            if modified_after is not None and (entry.mtime is None or entry.mtime < modified_after):
+                continue
+            if modified_before is not None and (entry.mtime is None or entry.mtime > modified_before):
+                continue
+            results.append(entry.name)
+        return results
+
+    def _prefix(self, prefix):
+        start = bisect.bisect_left(self._sorted_names, prefix)
+        end = bisect.bisect_left(self._sorted_names, prefix + "\U0010ffff", start)
+        return self._sorted[start:end]
+
+    def _candidates(self, literals):
+        # Positions whose names contain every trigram of every literal, or
+        # None if the literals are too short to narrow anything down.
+        sets = [self._trigrams.get(literal[i:i + 3], set())
+                for literal in literals for i in range(len(literal) - 2)]
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def _verify(self, candidates, matches):
+        if candidates is None:
+            candidates = range(len(self.entries))
+        return [p for p in candidates if matches(self.entries[p].name)]
+
+    def _glob(self, pattern):
+        compiled = re.compile(fnmatch.translate(pattern))
+        # Only the text before the first character class is used as
+        # literals; fnmatch's bracket rules make the rest ambiguous.
+        head = pattern.split("[", 1)[0]
+        literals = [part for part in re.split(r"[*?]", head) if part]
+        prefix = re.match(r"[^*?]*", head).group()
+        candidates = self._candidates(literals)
+        if prefix and (candidates is None or len(prefix) >= 3):
+            in_prefix = self._prefix(prefix)
+            candidates = in_prefix if candidates is None else \
+                candidates.intersection(in_prefix)
+        return self._verify(candidates, lambda name: compiled.match(name))
+
+    def _regex(self, pattern):
+        compiled = re.compile(pattern)
+        return self._verify(self._candidates(required_literals(compiled)),
+                            lambda name: compiled.search(name))
+
+
+def required_literals(compiled):
+    """
+    Returns literal strings that every match of a compiled regex must
+    contain: runs of plain characters at the top level of the pattern.
+    """
+    if compiled.flags & re.IGNORECASE:
+        return []
+    literals, run = [], []
+    for op, arg in regex_parser.parse(compiled.pattern, compiled.flags):
+        if op is regex_parser.LITERAL:
+            run.append(chr(arg))
+            continue
+        if run:
+            literals.append("".join(run))
+            run = []
+    if run:
+        literals.append("".join(run))
+    return literals
+
+
+def spool_path_for(filename, dest_dir=VALID_DIR):
+    """
+    Returns the path of the partial download of a remote file in dest_dir.
+    The name is derived from the remote name so that an interrupted
+    transfer can be found and resumed later.
+    """
+    return os.path.join(dest_dir, f".{quote(filename, safe='')}.part")
+
+
+def discard_spool(spool_path):
+    """Removes a partial download together with its resume metadata."""
+    for path in (spool_path, spool_path + ".json"):
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+class FTPClient:
+    def __init__(self, ftp=None, on_error=None):
+        # Initialize FTP client instance.
+        # An already logged-in connection, e.g. one lent by
+        # FTPConnectionPool, can be wrapped directly.
+        # on_error(title, message) is called for errors the caller should
+        # show to the user; the GUI passes messagebox.showerror.
+        self.ftp = ftp
+        self.on_error = on_error
+        self.listing = DirectoryCache()
+        self._index = None
+        self._index_version = None
+        self._credentials = None
+
+    def connect(self, host, user, password, port=0, timeout=FTP_TIMEOUT):
         """
         Connects to the FTP server using provided credentials.
         Returns a tuple (status, message).
         """
         try:
-            self.ftp = ftplib.FTP()
-            self.ftp.connect(host)
-            self.ftp.login(user, password)
+            self.ftp = open_ftp_connection(host, user, password, port, timeout)
+            self._credentials = (host, user, password, port, timeout)
+            self.listing = DirectoryCache()
             return True, "Connected to FTP server"
         except ftplib.all_errors as e:
             return False, f"Failed to connect: {e}"
 
+    def reconnect(self, retries=3, backoff=0.5):
+        """
+        Replaces a dropped control connection with a new one, using the
+        credentials of the last successful connect.
+        """
+        if self._credentials is None:
+            raise ConnectionError("FTP client is not connected.")
+        if self.ftp is not None:
+            self.ftp.close()
+        host, user, password, port, timeout = self._credentials
+        self.ftp = open_ftp_connection(
+            host, user, password, port, timeout, retries, backoff)
+
+    def open_pool(self, size=4, **kwargs):
+        """
+        Returns an FTPConnectionPool that logs in with the same credentials
+        as this client.
+        """
+        if self._credentials is None:
+            raise ConnectionError("FTP client is not connected.")
+        host, user, password, port, timeout = self._credentials
+        return FTPConnectionPool(host, user, password, port=port, size=size,
+                                 timeout=timeout, **kwargs)
+
+    def _call(self, operation):
+        # Runs operation(ftp), reconnecting once if the server dropped the
+        # connection. Only used for commands that are safe to repeat.
+        try:
+            return operation(self.ftp)
+        except ftplib.all_errors as e:
+            if self._credentials is None or not is_connection_error(e):
+                raise
+            self.reconnect()
+            return operation(self.ftp)
+
     def disconnect(self):
         """
         Safely disconnects from the FTP server.
@@ -55,81 +794,1128 @@ class FTPClient:
         """
         return self.ftp is not None
 
-    def get_file_list(self):
+    def get_file_list(self, refresh=False):
         """
         Returns a list of all files in the current directory of the FTP server.
+        The listing is served from the directory cache while it is fresh.
         Returns an empty list if not connected or on error.
         """
         if not self.is_connected():
             return []
         try:
-            return self.ftp.nlst()  # List files and directories
+            self._call(lambda ftp: self.listing.get(ftp, refresh))
+            return self.listing.files()
         except ftplib.all_errors:
             return []
 
-    def search_files(self, keyword):
+    def get_size(self, filename):
+        """
+        Returns the size in bytes of the specified file on the FTP server,
+        from the directory cache when it is known there.
+        """
+        if not self.is_connected():
+            raise ConnectionError("FTP client is not connected.")
+        size = self.cached_size(filename)
+        if size is not None:
+            return size
+        with METRICS.timer("size"):
+            return self._call(lambda ftp: ftp.size(filename))
+
+    def file_version(self, filename):
         """
-        Searches files on the FTP server that contain the given keyword.
-        Shows an error message if no files are found.
-        Returns a list of matched files.
+        Returns (size, mtime) of a file from the cached listing, with None
+        for values that are not known.
         """
-        matched_files = [f for f in self.get_file_list() if keyword in f]
+        entry = self.listing.entries.get(filename)
+        return (entry.size, entry.mtime) if entry is not None else (None, None)
+
+    def cached_size(self, filename):
+        """
+        Returns the size of a file from a fresh directory listing, or None
+        if it is not known without asking the server.
+        """
+        return self.listing.size(filename) if self.listing.is_fresh() else None
+
+    def search_files(self, keyword, mode="substring", **filters):
+        """
+        Searches the cached listing for files matching the keyword, using
+        the in-memory filename index. mode is "substring", "prefix", "glob"
+        or "regex"; filters are the size and mtime filters of
+        FileIndex.search. Reports an error through on_error if no files are
+        found. Returns a list of matched files.
+        """
+        self.get_file_list()
+        matched_files = self.get_index().search(keyword, mode, **filters)
         if not matched_files:
-            messagebox.showerror('Error', "There is no file with this name!")
+            self._report_error('Error', "There is no file with this name!")
         return matched_files
 
+    def get_index(self):
+        """
+        Returns the FileIndex over the cached listing, rebuilding it only
+        when the listing has changed.
+        """
+        if self._index is None or self._index_version != (id(self.listing), self.listing.version):
+            self._index = FileIndex(
+                e for e in self.listing.entries.values() if e.type != "dir")
+            self._index_version = (id(self.listing), self.listing.version)
+        return self._index
+
     def download_file(self, filename):
         """
         Downloads the specified file from the FTP server and returns its content as a string.
-        Shows an error message if download fails.
+        Reports an error through on_error and returns "" if the download fails.
         """
         if not self.is_connected():
             raise ConnectionError("FTP client is not connected.")
 
         content = []
 
+        try:
+            with METRICS.timer("retr"):
+                self.ftp.retrbinary(f'RETR {filename}', callback=content.append)
+            # Decoded once, so characters split across chunks survive; bytes
+            # that are not UTF-8 show up as U+FFFD instead of vanishing.
+            return b''.join(content).decode("utf-8", errors="replace")
+        except ftplib.all_errors as e:
+            self._report_error(
+                'Download Error', f"Failed to download file: {e}")
+            return ""
+        finally:
+            METRICS.inc("bytes_received", sum(map(len, content)))
+
+    def _report_error(self, title, message):
+        if self.on_error is not None:
+            self.on_error(title, message)
+
+    def stream_validate(self, filename):
+        """
+        Validates the specified file while it is being downloaded, without
+        keeping its content in memory. The transfer is aborted on the first
+        invalid row. Returns a tuple (status, message).
+        """
+        if not self.is_connected():
+            raise ConnectionError("FTP client is not connected.")
+
+        validator = StreamValidator()
+        received = 0
+
         def handle_binary(data):
-            # Attempt to decode binary data into UTF-8 text
+            nonlocal received
+            received += len(data)
+            validator.feed(data)
+
+        try:
+            with METRICS.timer("retr"):
+                self.ftp.retrbinary(f'RETR {filename}', callback=handle_binary)
+        except ValidationAborted:
+            self._finish_aborted_transfer()
+        finally:
+            METRICS.inc("bytes_received", received)
+        return validator.close()
+
+    def save_valid_file(self, filename, dest_dir=VALID_DIR, progress=None,
+                        cancel=None, batch_index=None):
+        """
+        Streams the specified file straight to a spool file in dest_dir
+        while the same bytes are validated. A valid file is atomically renamed
+        to MED_DATA_<timestamp>.csv; an invalid one is deleted.
+        progress, if given, is called with the number of bytes received so
+        far; setting the cancel event aborts the transfer with
+        TransferCancelled. batch_index, if given, is the BatchIdIndex of
+        dest_dir: a file repeating a batch_id of an earlier file is rejected
+        and a promoted file is indexed. A transfer that fails because the
+        connection dropped leaves its spool file behind so the next call
+        resumes it. Returns a tuple (status, message, saved filename or None).
+        """
+        if not self.is_connected():
+            raise ConnectionError("FTP client is not connected.")
+
+        validator = StreamValidator()
+
+        def restart():
+            nonlocal validator
+            validator = StreamValidator()
+
+        spool_path = spool_path_for(filename, dest_dir)
+        keep_partial = False
+        try:
             try:
-                content.append(data.decode("utf-8"))
-            except UnicodeDecodeError:
-                # If decoding fails, ignore problematic characters
-                content.append(data.decode("utf-8", errors="ignore"))
+                self.retrieve(filename, spool_path,
+                              lambda data: validator.feed(data), restart,
+                              progress, cancel)
+            except ValidationAborted:
+                pass
+            except ftplib.all_errors as e:
+                keep_partial = is_connection_error(e)
+                raise
+
+            is_valid, msg = validator.close()
+            if not is_valid:
+                return False, msg, None
+            if batch_index is not None:
+                duplicate = batch_index.find_duplicate(spool_path)
+                if duplicate is not None:
+                    batch_id, row_num, other = duplicate
+                    return False, (f"Duplicate batch_id {batch_id} on row {row_num}, "
+                                   f"already in {other}"), None
+            new_filename = promote_valid_file(spool_path, dest_dir)
+            if batch_index is not None:
+                batch_index.add(new_filename)
+            return True, msg, new_filename
+        finally:
+            if not keep_partial:
+                discard_spool(spool_path)
+
+    def spool_file(self, filename, dest_dir=VALID_DIR):
+        """
+        Downloads the specified file unchanged into its spool file in
+        dest_dir and returns the path. The caller owns the spool file. A
+        transfer that fails because the connection dropped leaves the spool
+        file behind so the next call resumes it.
+        """
+        if not self.is_connected():
+            raise ConnectionError("FTP client is not connected.")
 
+        spool_path = spool_path_for(filename, dest_dir)
         try:
-            self.ftp.retrbinary(f'RETR {filename}', callback=handle_binary)
-            return ''.join(content)
+            self.retrieve(filename, spool_path)
         except ftplib.all_errors as e:
-            messagebox.showerror(
-                'Download Error', f"Failed to download file: {e}")
-            return ""
+            if not is_connection_error(e):
+                discard_spool(spool_path)
+            raise
+        except BaseException:
+            discard_spool(spool_path)
+            raise
+        return spool_path
+
+    def remote_version(self, filename):
+        """
+        Returns (size, mtime) of a remote file using SIZE and MDTM, with None
+        for values the server does not report.
+        """
+        try:
+            with METRICS.timer("size"):
+                size = int(self.ftp.size(filename))
+        except ftplib.error_perm:
+            size = None
+        try:
+            with METRICS.timer("mdtm"):
+                reply = self.ftp.voidcmd(f"MDTM {filename}")
+            mtime = parse_mlsd_time(reply[4:].strip())
+        except ftplib.error_perm:
+            mtime = None
+        return size, mtime
+
+    def retrieve(self, filename, spool_path, consume=None, restart=None,
+                 progress=None, cancel=None, retries=3):
+        """
+        Downloads a remote file into spool_path. If spool_path already holds
+        the start of the same file version from an interrupted attempt, only
+        the rest is fetched with REST. When the connection drops mid-transfer
+        the client reconnects and resumes, starting over instead if the
+        remote size or mtime changed in the meantime.
+
+        consume(chunk), if given, sees every byte of the file exactly once and
+        in order, including bytes replayed from the spool file; restart() is
+        called whenever the bytes consumed so far are discarded. progress and
+        cancel behave as in save_valid_file. ValidationAborted raised by
+        consume stops the transfer.
+        """
+        if not self.is_connected():
+            raise ConnectionError("FTP client is not connected.")
+
+        received = 0
+        transferred = 0
+        write_time = 0.0
+
+        def handle_binary(data):
+            nonlocal received, transferred, write_time
+            if cancel is not None and cancel.is_set():
+                raise TransferCancelled(f"Download of '{filename}' cancelled")
+            start = time.perf_counter()
+            spool.write(data)
+            write_time += time.perf_counter() - start
+            if consume is not None:
+                consume(data)
+            received += len(data)
+            transferred += len(data)
+            if progress is not None:
+                progress(received)
+
+        offset = self._resume_offset(filename, spool_path)
+        if offset and consume is not None:
+            # Replay the bytes spooled by an earlier attempt from disk.
+            with open(spool_path, "rb") as spooled:
+                for chunk in iter(lambda: spooled.read(1024 * 1024), b""):
+                    consume(chunk)
+                    received += len(chunk)
+        attempts = 0
+        try:
+            while True:
+                try:
+                    with open(spool_path, "ab") as spool:
+                        try:
+                            with METRICS.timer("retr"):
+                                self.ftp.retrbinary(f'RETR {filename}',
+                                                    callback=handle_binary,
+                                                    rest=offset or None)
+                        except (ValidationAborted, TransferCancelled):
+                            self._finish_aborted_transfer()
+                            raise
+                        spool.flush()
+                        os.fsync(spool.fileno())
+                    break
+                except ftplib.error_perm as e:
+                    if not offset or str(e)[:3] not in ("500", "502", "504"):
+                        raise
+                    # The server does not support REST: start over.
+                    offset = self._reset_spool(spool_path)
+                except ftplib.all_errors as e:
+                    if (not is_connection_error(e) or self._credentials is None
+                            or attempts >= retries):
+                        raise
+                    attempts += 1
+                    METRICS.inc("transfer_retries")
+                    self.reconnect()
+                    offset = self._resume_offset(filename, spool_path)
+                if offset == 0 and received:
+                    received = 0
+                    if restart is not None:
+                        restart()
+        finally:
+            METRICS.inc("bytes_received", transferred)
+            METRICS.observe("write", write_time)
+        os.unlink(spool_path + ".json")
+
+    def _resume_offset(self, filename, spool_path):
+        # Returns how many bytes of the current remote file version are
+        # already in spool_path, emptying it if it holds another version.
+        # The version always comes from SIZE and MDTM: a listing's mtime may
+        # only be precise to the minute, so it is never compared with them.
+        offset = os.path.getsize(spool_path) if os.path.exists(spool_path) else 0
+        meta_path = spool_path + ".json"
+        saved = None
+        if offset and os.path.exists(meta_path):
+            with open(meta_path) as meta:
+                saved = json.load(meta)
+        current = [None if v is None else int(v) for v in self.remote_version(filename)]
+        if offset and (saved != current or current[0] is None or offset > current[0]):
+            offset = self._reset_spool(spool_path)
+        with open(meta_path, "w") as meta:
+            json.dump(current, meta)
+        return offset
+
+    def _reset_spool(self, spool_path):
+        open(spool_path, "wb").close()
+        return 0
+
+    def _finish_aborted_transfer(self):
+        # The data connection was closed early; read the server's transfer
+        # reply so the control connection stays in sync.
+        try:
+            self.ftp.voidresp()
+        except ftplib.all_errors:
+            pass
+
+
+class PooledConnection:
+    """A pooled FTP control connection together with its usage statistics."""
+
+    def __init__(self, ftp):
+        self.ftp = ftp
+        self.created = time.time()
+        self.last_used = self.created
+        self.lends = 0
+        self.noops = 0
+        self.reconnects = 0
+        self.errors = 0
+        self.broken = False
+
+    def stats(self):
+        return {
+            "id": id(self),
+            "created": self.created,
+            "idle_seconds": time.time() - self.last_used,
+            "lends": self.lends,
+            "noops": self.noops,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+            "alive": self.ftp is not None and not self.broken,
+        }
+
+
+class FTPConnectionPool:
+    """
+    Keeps up to `size` logged-in FTP control connections that concurrent
+    transfers and listings can share. An idle connection is checked with
+    NOOP before it is lent out, and dropped connections are reopened
+    transparently with exponential backoff.
+    """
+
+    def __init__(self, host, user, password, port=0, size=4,
+                 timeout=FTP_TIMEOUT, retries=3, backoff=0.5,
+                 check_after=5.0, keepalive=None):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.check_after = check_after
+        self._available = threading.Condition()
+        self._idle = []
+        self._connections = []
+        self._closed = threading.Event()
+        if keepalive:
+            threading.Thread(target=self._keepalive, args=(keepalive,),
+                             daemon=True).start()
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends a healthy logged-in ftplib.FTP for the duration of the block,
+        waiting if all connections are in use. A connection that fails with
+        a connection-level error is reopened before it is lent out again.
+        """
+        conn = self._checkout()
+        try:
+            yield conn.ftp
+        except ftplib.all_errors as e:
+            conn.errors += 1
+            if is_connection_error(e):
+                conn.broken = True
+            raise
+        finally:
+            conn.last_used = time.time()
+            self._checkin([conn])
+
+    def call(self, operation):
+        """
+        Runs operation(ftp) on a pooled connection and retries it on another
+        connection if the server dropped the first one. Only use it for
+        commands that are safe to repeat.
+        """
+        for attempt in range(self.retries):
+            try:
+                with self.connection() as ftp:
+                    return operation(ftp)
+            except ftplib.all_errors as e:
+                if not is_connection_error(e) or attempt == self.retries - 1:
+                    raise
+
+    def stats(self):
+        """Returns a list with the usage statistics of every connection."""
+        with self._available:
+            return [conn.stats() for conn in self._connections]
+
+    def close(self):
+        """
+        Closes every idle connection and stops the keepalive thread.
+        Connections still lent out are closed when they are returned.
+        """
+        self._closed.set()
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for conn in idle:
+            self._quit(conn)
+
+    def _checkout(self):
+        with self._available:
+            while True:
+                if self._closed.is_set():
+                    raise ConnectionError("FTP connection pool is closed.")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if len(self._connections) < self.size:
+                    # Reserve the slot now, log in outside the lock.
+                    conn = PooledConnection(None)
+                    self._connections.append(conn)
+                    break
+                self._available.wait()
+        try:
+            if conn.ftp is None:
+                conn.ftp = self._open()
+            elif conn.broken or not self._is_healthy(conn):
+                self._quit(conn)
+                conn.ftp = self._open()
+                conn.reconnects += 1
+            conn.broken = False
+        except BaseException:
+            with self._available:
+                self._connections.remove(conn)
+                self._available.notify()
+            raise
+        conn.lends += 1
+        return conn
+
+    def _checkin(self, connections):
+        if self._closed.is_set():
+            for conn in connections:
+                self._quit(conn)
+            return
+        with self._available:
+            self._idle.extend(connections)
+            self._available.notify(len(connections))
+
+    def _is_healthy(self, conn):
+        if time.time() - conn.last_used < self.check_after:
+            return True
+        try:
+            conn.ftp.voidcmd("NOOP")
+            conn.noops += 1
+            return True
+        except ftplib.all_errors:
+            return False
+
+    def _open(self):
+        return open_ftp_connection(self.host, self.user, self.password,
+                                   self.port, self.timeout, self.retries,
+                                   self.backoff)
+
+    def _quit(self, conn):
+        if conn.ftp is None:
+            return
+        try:
+            conn.ftp.quit()
+        except ftplib.all_errors:
+            conn.ftp.close()
+        conn.ftp = None
+
+    def _keepalive(self, interval):
+        # Sends NOOP on connections that have been idle for a whole interval
+        # so the server does not drop them between transfers.
+        while not self._closed.wait(interval):
+            now = time.time()
+            with self._available:
+                stale = [conn for conn in self._idle
+                         if now - conn.last_used >= interval and not conn.broken]
+                self._idle = [conn for conn in self._idle if conn not in stale]
+            for conn in stale:
+                try:
+                    conn.ftp.voidcmd("NOOP")
+                    conn.noops += 1
+                    conn.last_used = time.time()
+                except ftplib.all_errors:
+                    conn.broken = True
+            self._checkin(stale)
+
+
+# One rule violation found in collect-all-errors mode. column is the
+# header name of the offending field, or None for row-level problems.
+ValidationIssue = namedtuple("ValidationIssue", "row column rule value message")
+
+
+def _digits_at_most(limit, leading_zero=True):
+    # Regex for digit strings as long as `limit` that are <= limit.
+    options = [limit]
+    for i, digit in enumerate(limit):
+        low = "0" if leading_zero or i else "1"
+        if digit > low:
+            high = chr(ord(digit) - 1)
+            rest = len(limit) - i - 1
+            options.append(limit[:i] + (low if low == high else f"[{low}-{high}]")
+                           + (f"[0-9]{{{rest}}}" if rest else ""))
+    return "|".join(options)
+
+
+def _integer_at_most(limit):
+    # Regex for integers in [0, limit], with any number of leading zeros.
+    text = str(limit)
+    options = ["0"]
+    if len(text) > 1:
+        options.append(f"[1-9][0-9]{{0,{len(text) - 2}}}")
+    if limit:
+        options.append(_digits_at_most(text, leading_zero=False))
+    return f"0*(?:{'|'.join(options)})"
+
+
+def decimal_range_pattern(maximum, decimals):
+    """
+    Returns a regex matching exactly the non-negative decimals with 1 to
+    `decimals` digits after an optional point that are <= maximum, so the
+    range check needs no float conversion. READING_PATTERN is the result
+    for maximum 9.9 and 3 decimals.
+    """
+    scale = 10 ** decimals
+    limit = int(Decimal(str(maximum)) * scale // 1)
+    whole, fraction = divmod(limit, scale)
+    fraction = str(fraction).zfill(decimals)
+    options = []
+    if whole:
+        options.append(f"{_integer_at_most(whole - 1)}(?:\\.[0-9]{{1,{decimals}}})?")
+    tails = "|".join(_digits_at_most(fraction[:k]) for k in range(1, decimals + 1))
+    options.append(f"0*{whole}(?:\\.(?:{tails}))?")
+    return "|".join(f"(?:{option})" for option in options)
+
+
+class ValidationSchema:
+    """
+    Describes a CSV format: its columns in order and the rules for each.
+    The definition is compiled once into Python source specialized to the
+    columns, so checking a row costs no more than hand-written code.
+
+    A definition is a mapping with a "columns" list. Each column has a
+    "name" and optionally:
+      type      "string" (default), "integer" or "decimal"
+      min, max  inclusive bounds for numeric columns
+      decimals  maximum digits after the point for decimal columns, at least 1
+      pattern   regex a string value must match in full
+      unique    true if a value may only appear once per file
+      nullable  whether an empty value is accepted without further checks;
+                defaults to true for strings and false for numbers
+    """
+
+    TYPES = ("string", "integer", "decimal")
+    INTEGER_FORMAT = re.compile(r"^\d+$")
+
+    def __init__(self, definition):
+        self.definition = definition
+        self.columns = [self._column(column) for column in definition["columns"]]
+        self.headers = [column["name"] for column in self.columns]
+        self._checkers = {collect: self._compile(collect) for collect in (False, True)}
+        self._line_patterns = {}
+
+    @classmethod
+    def load(cls, path):
+        """Loads a schema definition from a JSON or YAML file."""
+        with open(path, encoding="utf-8") as file:
+            if path.endswith((".yaml", ".yml")):
+                import yaml  # optional, only needed for YAML schemas
+                return cls(yaml.safe_load(file))
+            return cls(json.load(file))
+
+    def __reduce__(self):
+        # Compiled checkers cannot be pickled; validation worker processes
+        # compile the definition again.
+        return ValidationSchema, (self.definition,)
+
+    def row_checker(self, collect=False, seen=None, unique_set=set):
+        """
+        Returns a check(row, row_num) function for one file, with its own
+        record of the values of unique columns; seen optionally maps a
+        column name to the values already used, and unique_set builds the
+        set holding them (e.g. a BatchIdSet for huge files). check returns a
+        list of ValidationIssue records, empty for a valid row, holding only
+        the first problem unless collect is set.
+        """
+        return self._checkers[collect](seen or {}, unique_set)
+
+    def _column(self, column):
+        name = column.get("name")
+        kind = column.get("type", "string")
+        if not name or kind not in self.TYPES:
+            raise ValueError(f"Invalid schema column: {column}")
+        numeric = kind != "string"
+        if not numeric and any(key in column for key in ("min", "max", "decimals")):
+            raise ValueError(f"min, max and decimals need a numeric column: {name}")
+        if kind != "decimal" and "decimals" in column:
+            raise ValueError(f"decimals needs a decimal column: {name}")
+        for key in ("min", "max"):
+            value = column.get(key)
+            if value is not None and (isinstance(value, bool)
+                                      or not isinstance(value, (int, float))):
+                raise ValueError(f"{key} must be a number: {name}")
+        decimals = column.get("decimals")
+        if decimals is not None and (isinstance(decimals, bool)
+                                     or not isinstance(decimals, int) or decimals < 1):
+            raise ValueError(f"decimals must be a whole number of at least 1: {name}")
+        return {"name": name, "type": kind, "min": column.get("min"),
+                "max": column.get("max"), "decimals": column.get("decimals"),
+                "pattern": column.get("pattern"),
+                "unique": bool(column.get("unique", False)),
+                "nullable": bool(column.get("nullable", not numeric))}
+
+    def _fast_pattern(self, column):
+        # Regex accepting exactly the valid values of a numeric column, or
+        # None if the rules cannot be expressed that way.
+        if (column["type"] == "string" or column["unique"] or column["nullable"]
+                or (column["min"] is not None and column["min"] > 0)
+                or (column["max"] is not None and column["max"] < 0)):
+            return None
+        if column["type"] == "integer":
+            if column["max"] is None:
+                return "[0-9]+"
+            return _integer_at_most(int(column["max"] // 1))
+        if column["decimals"] is None:
+            return None
+        if column["max"] is None:
+            return f"[0-9]+(?:\\.[0-9]{{1,{column['decimals']}}})?"
+        return decimal_range_pattern(column["max"], column["decimals"])
+
+    def _compile(self, collect):
+        # Generates make(seen), which returns a check(row, row_num) function
+        # with straight-line code for each column.
+        namespace = {"Issue": ValidationIssue}
+        body = []
+
+        def message(prefix, shown=None):
+            code = f"{prefix!r} + str(row_num)"
+            return code + f" + ': ' + str({shown})" if shown else code
+
+        def report(indent, name, rule, text):
+            issue = f"Issue(row_num, {name!r}, {rule!r}, v, {text})"
+            body.append(indent + (f"issues.append({issue})" if collect
+                                  else f"return [{issue}]"))
+
+        def check_cell(i, column, indent, load=True):
+            name = column["name"]
+            if load:
+                body.append(f"{indent}v = row[{i}]")
+            if column["type"] == "string":
+                condition = "if v and"
+                if not column["nullable"]:
+                    body.append(f"{indent}if not v:")
+                    report(indent + "    ", name, "missing_value",
+                           message(f"Missing value in {name} on row "))
+                    condition = "elif"
+                if column["pattern"]:
+                    namespace[f"pattern_{i}"] = re.compile(column["pattern"])
+                    body.append(f"{indent}{condition} pattern_{i}.fullmatch(v) is None:")
+                    report(indent + "    ", name, "pattern",
+                           message(f"Invalid format in {name} on row ", "v"))
+                return
+            if column["nullable"]:
+                body.append(f"{indent}if v:")
+                indent += "    "
+            body.append(f"{indent}try:")
+            body.append(f"{indent}    x = {'float' if column['type'] == 'decimal' else 'int'}(v)")
+            body.append(f"{indent}except ValueError:")
+            report(indent + "    ", name, "non_numeric",
+                   message(f"Non-numeric {name} on row ", "v"))
+            checks = []
+            if column["max"] is not None:
+                namespace[f"max_{i}"] = column["max"]
+                checks.append((f"x > max_{i}", "value_exceeds", message(
+                    f"Value exceeds {column['max']} in {name} on row ", "x")))
+            if column["min"] is not None:
+                namespace[f"min_{i}"] = column["min"]
+                checks.append((f"x < min_{i}", "value_below", message(
+                    f"Value below {column['min']} in {name} on row ", "x")))
+            if column["type"] == "decimal":
+                digits = column["decimals"]
+                namespace[f"format_{i}"] = re.compile(
+                    rf"^\d+(\.\d{{1,{digits}}})?$" if digits is not None else r"^\d+(\.\d+)?$")
+                checks.append((f"format_{i}.match(v) is None", "decimal_format", message(
+                    f"Invalid decimal format in {name} on row ", "v")))
+            else:
+                namespace[f"format_{i}"] = self.INTEGER_FORMAT
+                checks.append((f"format_{i}.match(v) is None", "integer_format", message(
+                    f"Invalid integer format in {name} on row ", "v")))
+            body.append(f"{indent}else:")
+            for n, (condition, rule, text) in enumerate(checks):
+                body.append(f"{indent}    {'elif' if n else 'if'} {condition}:")
+                report(indent + "        ", name, rule, text)
+
+        count = len(self.columns)
+        body.append(f"if len(row) != {count}:")
+        body.append("    return [Issue(row_num, None, 'missing_columns', ','.join(row), "
+                    "'Row ' + str(row_num) + ' has missing columns')]")
+        if collect:
+            body.append("issues = []")
+        i = 0
+        while i < count:
+            column = self.columns[i]
+            if column["unique"]:
+                name = column["name"]
+                body.append(f"v = row[{i}]")
+                body.append(f"if v in seen_{i}:")
+                report("    ", name, f"duplicate_{name}",
+                       f"{'Duplicate ' + name + ' '!r} + v + ' on row ' + str(row_num)")
+                body.append(f"seen_{i}.add(v)")
+            # A run of columns that each have a single-regex form is checked
+            # with one match of the joined values; only on a miss are the
+            # cells checked one by one, to report the exact problem.
+            end = i
+            while end < count and self._fast_pattern(self.columns[end]) is not None:
+                end += 1
+            if end > i:
+                namespace[f"fast_{i}"] = re.compile(",".join(
+                    f"(?:{self._fast_pattern(c)})" for c in self.columns[i:end]))
+                joined = f"row[{i}]" if end == i + 1 else f"','.join(row[{i}:{end}])"
+                body.append(f"if fast_{i}.fullmatch({joined}) is None:")
+                for j in range(i, end):
+                    check_cell(j, self.columns[j], "    ")
+                i = end
+                continue
+            if column["type"] != "string" or not column["nullable"] or column["pattern"]:
+                check_cell(i, column, "", load=not column["unique"])
+            i += 1
+        body.append("return issues" if collect else "return ()")
+
+        source = "def make(seen, unique_set):\n"
+        for i, column in enumerate(self.columns):
+            if column["unique"]:
+                source += f"    seen_{i} = unique_set(seen.get({column['name']!r}, ()))\n"
+        source += "    def check(row, row_num):\n"
+        source += "".join(f"        {line}\n" for line in body)
+        source += "    return check\n"
+        exec(compile(source, "<validation schema>", "exec"), namespace)
+        return namespace["make"]
+
+    def line_pattern(self, limit=None):
+        """
+        Returns a compiled bytes regex matching exactly the valid rows of
+        plain ASCII without quotes, one line each, or None if a column's
+        rules cannot be expressed as a regex. The pattern has a group per
+        unique column, so findall over a block of lines returns the unique
+        values. With limit set, lines longer than limit do not match, as
+        csv.reader would reject a field that long.
+        """
+        if limit not in self._line_patterns:
+            cell = '[^,"\\x00\\n\\r\\x0b\\x0c\\x1c-\\x1e\\x80-\\xff]'
+            pieces = []
+            for column in self.columns:
+                if column["type"] == "string":
+                    if column["pattern"]:
+                        pieces = None
+                        break
+                    piece = cell + ("*" if column["nullable"] else "+")
+                else:
+                    piece = self._fast_pattern(dict(column, unique=False, nullable=False))
+                    if piece is None:
+                        pieces = None
+                        break
+                    piece = f"(?:{piece}){'?' if column['nullable'] else ''}"
+                pieces.append(f"({piece})" if column["unique"] else f"(?:{piece})")
+            pattern = None
+            if pieces is not None:
+                length = f"(?=[^\\n]{{0,{limit}}}$)" if limit is not None else ""
+                pattern = re.compile(
+                    f"(?m)^(?!\\r?$){length}{','.join(pieces)}\\r?$".encode("ascii"))
+            self._line_patterns[limit] = pattern
+        return self._line_patterns[limit]
+
+
+DEFAULT_VALIDATION_SCHEMA = ValidationSchema(DEFAULT_SCHEMA)
+
+
+class BatchIdSet:
+    """
+    Set of strings for duplicate detection in files too large for a Python
+    set, using at most about memory_limit bytes of RAM. Supports `in`,
+    `add` and `len` like a set, so it can stand in for one.
+
+    Every value is appended to a scratch file on disk and represented in
+    memory by a 64-bit hash and the value's offset in that file, in an
+    array-backed open-addressing table. When the table fills up it is
+    written to disk and memory-mapped as a run, and a new one is started.
+    Every MERGE_RUNS runs of the same size are merged into one, so there
+    are only O(log n) runs to probe. Each run has its own Bloom filter,
+    sized for it, that lets most lookups skip it; runs whose filter would
+    not fit in the memory budget are always probed. A hash match is always
+    confirmed by comparing the value stored on disk, so a value is never
+    reported as seen when it was not.
+    """
+
+    BLOOM_HASHES = 4
+    BLOOM_BITS = 10  # Bloom filter bits per value of a run
+    MERGE_RUNS = 4  # runs of the same size merged into one
+
+    def __init__(self, values=(), memory_limit=UNIQUE_MEMORY_LIMIT, directory=None):
+        # Half the budget goes to the table (16 bytes per slot, filled to at
+        # most half), the other half to the Bloom filters of the runs.
+        half = max(memory_limit // 2, 16 * 1024)
+        self._capacity = 1 << ((half // 16).bit_length() - 1)
+        self._bloom_budget = half
+        self._directory = directory
+        self._values = tempfile.TemporaryFile(dir=directory)
+        self._end = 0
+        self._flushed = True
+        self._runs = []  # (table, Bloom filter or None), oldest first
+        self._count = 0
+        self._absent = None
+        self._new_table()
+        for value in values:
+            self.add(value)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, value):
+        h = self._hash(value)
+        found = self._find(self._table, h, value) or any(
+            (bloom is None or self._bloom_has(bloom, h)) and self._find(run, h, value)
+            for run, bloom in self._runs)
+        # add() usually follows a failed lookup; skip repeating it.
+        self._absent = None if found else (value, h)
+        return bool(found)
+
+    def add(self, value):
+        if self._absent is not None and self._absent[0] == value:
+            h = self._absent[1]
+        elif value in self:
+            return
+        else:
+            h = self._absent[1]
+        self._absent = None
+        data = value.encode("utf-8")
+        self._values.write(struct.pack("<I", len(data)) + data)
+        self._flushed = False
+        slot = self._slot(self._table, h)
+        self._table[2 * slot] = h
+        self._table[2 * slot + 1] = self._end
+        self._end += 4 + len(data)
+        self._count += 1
+        self._entries += 1
+        if self._entries * 2 >= self._capacity:
+            self._spill()
+
+    def close(self):
+        """Releases the scratch files."""
+        for run, _ in self._runs:
+            run.release()
+        self._runs = []
+        self._values.close()
+
+    def _hash(self, value):
+        # 0 marks an empty slot, so it is never used as a hash.
+        return hash(value) & 0xFFFFFFFFFFFFFFFF or 1
+
+    def _bloom_bits(self, bloom, h):
+        mask = len(bloom) * 8 - 1
+        step = (h >> 32) | 1
+        return [(h + i * step) & mask for i in range(self.BLOOM_HASHES)]
+
+    def _bloom_has(self, bloom, h):
+        return all(bloom[bit >> 3] & (1 << (bit & 7)) for bit in self._bloom_bits(bloom, h))
+
+    def _slot(self, table, h):
+        # Returns the first empty slot in the probe sequence of hash h.
+        mask = len(table) // 2 - 1
+        slot = h & mask
+        while table[2 * slot]:
+            slot = (slot + 1) & mask
+        return slot
+
+    def _find(self, table, h, value):
+        mask = len(table) // 2 - 1
+        slot = h & mask
+        while table[2 * slot]:
+            if table[2 * slot] == h and self._value_at(table[2 * slot + 1]) == value:
+                return True
+            slot = (slot + 1) & mask
+        return False
+
+    def _value_at(self, offset):
+        if not self._flushed:
+            self._values.flush()
+            self._flushed = True
+        fd = self._values.fileno()
+        size, = struct.unpack("<I", os.pread(fd, 4, offset))
+        return os.pread(fd, size, offset + 4).decode("utf-8")
+
+    def _new_table(self):
+        self._table = array("Q", bytes(16 * self._capacity))
+        self._entries = 0
+
+    def _spill(self):
+        with tempfile.TemporaryFile(dir=self._directory) as file:
+            self._table.tofile(file)
+            file.flush()
+            run = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        run = memoryview(run).cast("Q")
+        self._runs.append((run, self._new_bloom(run, self._entries)))
+        self._new_table()
+        # Runs are merged MERGE_RUNS at a time, so run sizes grow
+        # geometrically and each value is rewritten O(log n) times.
+        merge = self._runs[-self.MERGE_RUNS:]
+        while len(merge) == self.MERGE_RUNS and len({len(run) for run, _ in merge}) == 1:
+            self._merge_runs(merge)
+            merge = self._runs[-self.MERGE_RUNS:]
+
+    def _merge_runs(self, merge):
+        # Replaces the newest runs by one table as large as all of them,
+        # built directly in a memory-mapped scratch file.
+        del self._runs[-len(merge):]
+        for _, bloom in merge:
+            if bloom is not None:
+                self._bloom_budget += len(bloom)
+        size = sum(len(run) for run, _ in merge)
+        with tempfile.TemporaryFile(dir=self._directory) as file:
+            file.truncate(8 * size)
+            merged = memoryview(mmap.mmap(file.fileno(), 0)).cast("Q")
+        mask = size // 2 - 1
+        entries = 0
+        for run, _ in merge:
+            for i in range(0, len(run), 2):
+                h = run[i]
+                if h:
+                    slot = h & mask
+                    while merged[2 * slot]:
+                        slot = (slot + 1) & mask
+                    merged[2 * slot] = h
+                    merged[2 * slot + 1] = run[i + 1]
+                    entries += 1
+            run.release()
+        self._runs.append((merged, self._new_bloom(merged, entries)))
+
+    def _new_bloom(self, run, entries):
+        # Returns a Bloom filter of the hashes in run, or None if it would
+        # not fit in what is left of the memory budget.
+        size = 1 << max((entries * self.BLOOM_BITS // 8).bit_length(), 3)
+        if size > self._bloom_budget:
+            return None
+        self._bloom_budget -= size
+        bloom = bytearray(size)
+        mask = size * 8 - 1
+        for h in run[::2]:
+            if h:
+                step = (h >> 32) | 1
+                for i in range(self.BLOOM_HASHES):
+                    bit = (h + i * step) & mask
+                    bloom[bit >> 3] |= 1 << (bit & 7)
+        return bloom
 
 
 class FileValidator:
     @staticmethod
-    def validate(file_content):
+    def validate(file_content, schema=None):
+        schema = schema or DEFAULT_VALIDATION_SCHEMA
         try:
             reader = csv.reader(file_content.splitlines())
             headers = next(reader, None)
 
-            if not FileValidator.validate_headers(headers):
+            if headers != schema.headers:
                 return False, f"Incorrect or missing headers: {headers}"
 
-            batch_ids = set()
+            check = schema.row_checker()
             for row_num, row in enumerate(reader, start=2):
-                if not FileValidator.validate_row_length(row):
-                    return False, f"Row {row_num} has missing columns"
-                if not FileValidator.validate_unique_batch_id(row[0], batch_ids):
-                    return False, f"Duplicate batch_id {row[0]} on row {row_num}"
-                is_valid, msg = FileValidator.validate_readings(
-                    row[2:], row_num)
-                if not is_valid:
-                    return False, msg
+                issues = check(row, row_num)
+                if issues:
+                    return False, issues[0].message
 
         except Exception as e:
             return False, f"Malformed file error: {str(e)}"
         return True, "Valid"
 
+    @staticmethod
+    def collect_errors(file_content, max_errors=MAX_REPORTED_ERRORS, schema=None):
+        """
+        Checks the whole content instead of stopping at the first problem.
+        Returns a list of up to max_errors ValidationIssue records.
+        """
+        validator = StreamValidator(max_errors=max_errors, schema=schema)
+        try:
+            validator.feed(file_content.encode("utf-8"))
+        except ValidationAborted:
+            pass
+        validator.close()
+        return validator.issues
+
+    @staticmethod
+    def validate_file(path, chunk_size=1024 * 1024, digest=None, columnar=False,
+                      errors=None, max_errors=MAX_REPORTED_ERRORS, schema=None,
+                      unique_memory=None):
+        """
+        Validates a CSV file on disk chunk by chunk, without loading it
+        into memory. digest, if given, is a hashlib object that is updated
+        with every chunk read. columnar selects the NumPy block validator,
+        which is much faster on large files and gives the same results.
+        errors, if given, is a list that receives a ValidationIssue for
+        every violation, up to max_errors, instead of stopping at the first.
+        schema is the ValidationSchema to check against, by default the
+        built-in rules. unique_memory, in bytes, bounds the memory used to
+        detect duplicate values (see BatchIdSet).
+        Returns a tuple (status, message).
+        """
+        if errors is not None:
+            validator = StreamValidator(max_errors=max_errors, schema=schema,
+                                        unique_memory=unique_memory)
+        elif columnar:
+            validator = ColumnarValidator(schema=schema, unique_memory=unique_memory)
+        else:
+            validator = StreamValidator(schema=schema, unique_memory=unique_memory)
+        try:
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(chunk_size), b""):
+                    if digest is not None:
+                        digest.update(chunk)
+                    validator.feed(chunk)
+        except ValidationAborted:
+            pass
+        result = validator.close()
+        if errors is not None:
+            errors.extend(validator.issues)
+        return result
+
+    @staticmethod
+    def validate_parallel(path, workers=None, chunk_size=PARALLEL_CHUNK_SIZE,
+                          schema=None, executor=None):
+        """
+        Validates one large CSV file on several cores. The memory-mapped
+        file is cut at line breaks into ranges of about chunk_size bytes,
+        each checked in a worker process of executor (or of a new pool of
+        `workers` processes). The ranges' unique values are merged in file
+        order for the duplicate check, so the result, including row numbers,
+        is the same as validate_file's. Files with quoted fields, whose rows
+        may span line breaks, are validated sequentially instead.
+        Returns a tuple (status, message).
+        """
+        schema = schema or DEFAULT_VALIDATION_SCHEMA
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size <= chunk_size:
+                return FileValidator.validate_file(path, schema=schema)
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data.find(b'"') != -1:
+                    return FileValidator.validate_file(path, schema=schema)
+                ranges = []
+                start = 0
+                while start < size:
+                    line_break = LINE_BREAK.search(data, start + chunk_size)
+                    end = line_break.end() if line_break else size
+                    ranges.append((start, end))
+                    start = end
+
+        start_time = time.perf_counter()
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(workers)
+        futures = [executor.submit(validate_range, path, start, end, schema)
+                   for start, end in ranges]
+        names = [column["name"] for column in schema.columns if column["unique"]]
+        seen = {name: set() for name in names}
+        row_num = 0
+        try:
+            for (start, end), future in zip(ranges, futures):
+                result, rule, rows, values = future.result()
+                if result[0] and all(seen[name].isdisjoint(part)
+                                     for name, part in zip(names, values)):
+                    for name, part in zip(names, values):
+                        seen[name].update(part)
+                    row_num += rows
+                    continue
+                # The first range with a problem: check it again here,
+                # after the ranges before it, for the exact first error.
+                result, rule, row_num, _ = validate_range(
+                    path, start, end, schema, row_num if start else None, seen)
+                break
+        finally:
+            for future in futures:
+                future.cancel()
+            if own_executor:
+                executor.shutdown()
+        record_validation(result, rule, row_num - 1, None,
+                          time.perf_counter() - start_time)
+        return result
+
+    @staticmethod
+    def validate_row(row, row_num, batch_ids):
+        """
+        Runs every row-level check against a single data row.
+        Returns a tuple (status, message).
+        """
+        if not FileValidator.validate_row_length(row):
+            return False, f"Row {row_num} has missing columns"
+        if not FileValidator.validate_unique_batch_id(row[0], batch_ids):
+            return False, f"Duplicate batch_id {row[0]} on row {row_num}"
+        return FileValidator.validate_readings(row[2:], row_num)
+
     @staticmethod
     def validate_headers(headers):
         return headers == EXPECTED_HEADERS
@@ -147,374 +1933,1691 @@ class FileValidator:
 
     @staticmethod
     def validate_readings(readings, row_num):
+        # Fast path: a single precompiled match checks the format and the
+        # 9.9 bound of all ten readings without converting them to float.
+        if len(readings) == 10 and VALID_READINGS.fullmatch(",".join(readings)):
+            return True, None
+        # Slow path, only taken for invalid rows, to report the exact error.
         for i, reading in enumerate(readings, start=1):
-            try:
-                value = float(reading)
-                if value > 9.9:
-                    return False, f"Value exceeds 9.9 in reading{i} on row {row_num}: {value}"
-                if not re.match(r"^\d+(\.\d{1,3})?$", reading):
-                    return False, f"Invalid decimal format in reading{i} on row {row_num}: {reading}"
-            except ValueError:
-                return False, f"Non-numeric reading{i} on row {row_num}: {reading}"
+            error = FileValidator.reading_error(reading, i, row_num)
+            if error is not None:
+                return False, error[1]
         return True, None
 
+    @staticmethod
+    def reading_error(reading, index, row_num):
+        """
+        Checks a single reading. Returns a tuple (rule, message), or None if
+        the reading is valid.
+        """
+        try:
+            value = float(reading)
+            if value > 9.9:
+                return ("value_exceeds",
+                        f"Value exceeds 9.9 in reading{index} on row {row_num}: {value}")
+            if not DECIMAL_FORMAT.match(reading):
+                return ("decimal_format",
+                        f"Invalid decimal format in reading{index} on row {row_num}: {reading}")
+        except ValueError:
+            return ("non_numeric",
+                    f"Non-numeric reading{index} on row {row_num}: {reading}")
+        return None
+
+
+class ValidationAborted(Exception):
+    """Raised from a transfer callback to stop the download on the first invalid row."""
+
+
+class TransferCancelled(Exception):
+    """Raised from a transfer callback when the user cancels the download."""
+
+
+class _LineBuffer:
+    """
+    Line iterator that can be refilled after it runs dry, so a single
+    csv.reader can keep consuming lines as download chunks arrive.
+    """
 
-class Logger:
     def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.lines:
+            return self.lines.popleft()
+        raise StopIteration
+
+
+def record_validation(result, rule, rows, decode_time, validate_time):
+    """
+    Adds the outcome of validating one file to METRICS. decode_time is None
+    for validators that work on raw bytes.
+    """
+    METRICS.inc("rows_validated", rows)
+    if decode_time is not None:
+        METRICS.observe("decode", decode_time)
+    METRICS.observe("validate", validate_time)
+    if result is None or result[0]:
+        METRICS.inc("files_validated", result="valid")
+    else:
+        METRICS.inc("files_validated", result="invalid")
+        METRICS.inc("validation_failures", rule=rule)
+
+
+class StreamValidator:
+    """
+    Validates CSV data incrementally, one transfer chunk at a time.
+    Pass `feed` as the retrbinary callback and call `close` once the transfer
+    ends. Only the current partial line is kept in memory, and the results
+    match FileValidator.validate for the same content.
+
+    Data is validated in blocks of whole lines. A block of plain ASCII
+    lines (no quotes) that are all valid rows is recognized by a single
+    bytes regex from the schema, without decoding or CSV parsing; other
+    blocks are decoded and checked row by row. Bytes that are not valid in
+    the encoding are reported as an "encoding" error rather than dropped.
+
+    With max_errors set, validation continues past the first problem and
+    every violation is recorded in `issues` as a ValidationIssue; the
+    transfer is only aborted once max_errors issues have been collected.
+    schema is the ValidationSchema to check against, by default the
+    built-in rules. With unique_memory set, values of unique columns are
+    tracked in a BatchIdSet using at most about that many bytes each.
+
+    To validate part of a file, set has_headers to False for data that
+    does not start with the header row, first_row to the number of the
+    first row fed, and seen to map unique columns to the values already
+    used before it. With record_metrics False, close() leaves METRICS to
+    the caller.
+    """
+
+    def __init__(self, encoding="utf-8", max_errors=None, schema=None, unique_memory=None,
+                 has_headers=True, first_row=None, seen=None, record_metrics=True):
+        self.encoding = encoding
+        # Encodings in which line breaks and commas are single ASCII bytes
+        # can be cut into lines before decoding; others (UTF-16, ...) are
+        # decoded as a stream.
+        self._whole_lines = "\n,".encode(encoding) == b"\n,"
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._carry = b""
+        self._tail = ""
+        self._held = []
+        self._open_quote = False
+        self._lines = _LineBuffer()
+        self._reader = csv.reader(self._lines)
+        self.schema = schema or DEFAULT_VALIDATION_SCHEMA
+        self.unique_set = set
+        if unique_memory is not None:
+            self.unique_set = partial(BatchIdSet, memory_limit=unique_memory)
+        self.max_errors = max_errors
+        self._set_checker(seen)
+        self._fast = self._whole_lines and unique_memory is None
+        # Number of the last row checked; the header row is row 1.
+        if first_row is None:
+            first_row = 2 if has_headers else 1
+        self._row_num = first_row - 1
+        self._headers_checked = not has_headers
+        self.issues = []
+        self.result = None
+        # Work done on this file, added to METRICS once it is closed
+        self._rule = None
+        self._decode_time = 0.0
+        self._validate_time = 0.0
+        self._recorded = not record_metrics
+
+    @property
+    def rule(self):
+        """The rule of the first problem found, or None."""
+        return self._rule
+
+    @property
+    def last_row(self):
+        """The number of the last row checked."""
+        return self._row_num
+
+    @property
+    def unique_sets(self):
+        """The sets of values seen in each unique column, in column order."""
+        return self._unique_sets
+
+    def feed(self, data):
+        """
+        Consumes the next chunk of raw bytes.
+        Raises ValidationAborted as soon as the data is known to be invalid.
+        """
+        if self.result is not None:
+            raise ValidationAborted(self.result[1])
+        start = time.perf_counter()
+        try:
+            if not self._whole_lines:
+                self._feed_text(self._decode_stream(data))
+                return
+            if self._carry:
+                data = self._carry + data
+            # Cut after the last line break, "\n" or a lone "\r" (old Mac
+            # files), so only a partial line is carried. A final "\r" may
+            # be the first half of "\r\n" and stays in the carry.
+            cut = max(data.rfind(b"\n"), data.rfind(b"\r", 0, len(data) - 1)) + 1
+            self._carry = data[cut:]
+            if cut:
+                self._feed_block(data[:cut] if cut < len(data) else data)
+        finally:
+            self._validate_time += time.perf_counter() - start
+
+    def close(self):
+        """
+        Flushes any buffered data and returns the final tuple (status, message).
+        """
+        if self.result is None:
+            try:
+                if self._carry:
+                    # The last line has no line break.
+                    carry, self._carry = self._carry, b""
+                    self._feed_block(carry)
+                text = self._tail
+                if not self._whole_lines:
+                    text += self._decode_stream(b"", final=True)
+                self._tail = ""
+                self._push_lines(text.splitlines())
+                self._release_held()
+                self._consume()
+            except ValidationAborted:
+                pass
+        if self.result is None and not self._headers_checked:
+            self._issue(ValidationIssue(1, None, "headers", None,
+                                        "Incorrect or missing headers: None"))
+        if self.result is None and self.issues:
+            self.result = (False, self.issues[0].message)
+        if not self._recorded:
+            self._recorded = True
+            record_validation(self.result, self._rule, self._row_num - 1,
+                              self._decode_time, self._validate_time - self._decode_time)
+        return self.result or (True, "Valid")
+
+    def _set_checker(self, seen=None):
+        # Compiles the row checker, keeping hold of its sets of unique
+        # values so the bytes fast path can check and extend them too.
+        self._unique_sets = []
+
+        def unique_set(values):
+            created = self.unique_set(values)
+            self._unique_sets.append(created)
+            return created
+
+        self._check = self.schema.row_checker(
+            collect=self.max_errors is not None, seen=seen, unique_set=unique_set)
+
+    def _feed_block(self, block):
+        # Validates a block of whole lines.
+        if (self._fast and self._headers_checked and not self._held
+                and not self._tail and self._feed_ascii_rows(block)):
+            return
+        start = time.perf_counter()
+        try:
+            text = block.decode(self.encoding)
+        except UnicodeDecodeError as e:
+            self._decode_time += time.perf_counter() - start
+            return self._feed_invalid_bytes(block, e)
+        self._decode_time += time.perf_counter() - start
+        self._feed_text(text)
+
+    def _feed_ascii_rows(self, block):
+        # Checks a block of lines as bytes with the schema's line pattern.
+        # Returns True if every line is a valid row, having recorded them,
+        # and False, having changed nothing, otherwise.
+        limit = csv.field_size_limit()
+        pattern = self.schema.line_pattern(limit if len(block) > limit else None)
+        if pattern is None:
+            self._fast = False
+            return False
+        found = pattern.findall(block)
+        if len(found) != block.count(b"\n") + (not block.endswith(b"\n")):
+            return False
+        if len(self._unique_sets) == 1:
+            columns = [found]
+        else:
+            columns = list(zip(*found)) if found else [()] * len(self._unique_sets)
+        updates = []
+        for seen, column in zip(self._unique_sets, columns):
+            values = b"\n".join(column).decode("ascii").split("\n") if column else []
+            distinct = set(values)
+            if len(distinct) != len(values) or not seen.isdisjoint(distinct):
+                return False  # the row checks find the duplicate
+            updates.append((seen, distinct))
+        for seen, distinct in updates:
+            seen.update(distinct)
+        self._row_num += len(found)
+        return True
+
+    def _feed_invalid_bytes(self, block, error):
+        # Checks the lines before the first undecodable one, reports that
+        # line, then checks it (decoded with replacement characters) and
+        # the rest of the block.
+        start = block.rfind(b"\n", 0, error.start) + 1
+        end = block.find(b"\n", error.end) + 1 or len(block)
+        if start:
+            self._feed_block(block[:start])
+        row_num = self._row_num + self._headers_checked
+        self._encoding_issue(row_num, block[error.start:error.end])
+        self._feed_text(block[start:end].decode(self.encoding, errors="replace"))
+        if end < len(block):
+            self._feed_block(block[end:])
+
+    def _decode_stream(self, data, final=False):
+        # Decodes data in an encoding that cannot be cut into lines first.
+        start = time.perf_counter()
+        try:
+            return self._decoder.decode(data, final)
+        except UnicodeDecodeError as e:
+            self._encoding_issue(self._row_num + self._headers_checked,
+                                 e.object[e.start:e.end])
+            self._decoder.reset()
+            return codecs.decode(data, self.encoding, errors="replace")
+        finally:
+            self._decode_time += time.perf_counter() - start
+
+    def _encoding_issue(self, row_num, data):
+        self._issue(ValidationIssue(
+            row_num, None, "encoding", data.hex(),
+            f"Invalid {self.encoding} data on row {row_num}: {data!r}"))
+        if self.result is not None:
+            raise ValidationAborted(self.result[1])
+
+    def _feed_text(self, text):
+        text = self._tail + text
+        self._tail = ""
+        lines = text.splitlines(keepends=True)
+        if lines:
+            last = lines[-1]
+            # Keep an unterminated line, or a trailing "\r" that may be
+            # the first half of "\r\n", until the next chunk arrives.
+            if last.endswith("\r") or last.splitlines() == [last]:
+                self._tail = last
+                text = text[:-len(last)]
+        self._push_lines(text.splitlines())
+        self._consume()
+
+    def _issue(self, issue):
+        # Records a violation; stops validation in first-error mode or once
+        # max_errors issues have been collected.
+        if self._rule is None:
+            self._rule = issue.rule
+        if self.max_errors is None:
+            self.result = (False, issue.message)
+            return
+        self.issues.append(issue)
+        if len(self.issues) >= self.max_errors:
+            self.result = (False, self.issues[0].message)
+
+    def _push_lines(self, lines):
+        for line in lines:
+            self._held.append(line)
+            if line.count('"') % 2:
+                self._open_quote = not self._open_quote
+            # A quoted field may span lines; csv.reader must see all of them
+            # together or it would end the row early.
+            if not self._open_quote:
+                self._release_held()
+
+    def _release_held(self):
+        self._lines.lines.extend(self._held)
+        self._held = []
+
+    def _consume(self):
+        try:
+            for row in self._reader:
+                if not self._headers_checked:
+                    self._headers_checked = True
+                    if row != self.schema.headers:
+                        self._issue(ValidationIssue(
+                            1, None, "headers", ",".join(row),
+                            f"Incorrect or missing headers: {row}"))
+                else:
+                    self._row_num += 1
+                    for issue in self._check(row, self._row_num):
+                        self._issue(issue)
+                        if self.result is not None:
+                            break
+                if self.result is not None:
+                    break
+        except Exception as e:
+            message = f"Malformed file error: {str(e)}"
+            self._issue(ValidationIssue(self._row_num + 1, None, "malformed",
+                                        None, message))
+            if self.result is None:
+                # The reader cannot be trusted past a parse error.
+                self.result = (False, self.issues[0].message)
+        if self.result is not None:
+            raise ValidationAborted(self.result[1])
+
+
+class ColumnarValidator:
+    """
+    Validates CSV data in large blocks using NumPy array operations in place
+    of a Python loop over rows. Column counts and readings are checked for
+    a whole block at once, and duplicate batch_ids are found by sorting.
+    Only rows flagged by these checks are parsed in Python, so results,
+    including which error is reported first, match FileValidator.
+    Has the same feed/close interface as StreamValidator. It hands over to
+    StreamValidator for data the array parser does not model exactly
+    (quotes, non-ASCII bytes, unusual line breaks), if NumPy is missing,
+    for a schema other than the built-in rules, or when unique_memory
+    bounds the memory used for duplicate detection, since the sort keeps
+    every batch_id in memory.
+    """
+
+    # Blocks small enough for the intermediate arrays to stay in cache
+    BLOCK_SIZE = 1024 * 1024
+    # Bytes the array parser does not handle: quotes, NUL, line breaks other
+    # than "\n" and "\r\n", and anything outside ASCII.
+    UNSUPPORTED = b'"\x00\x0b\x0c\x1c\x1d\x1e' + bytes(range(128, 256))
+    # ValidationIssue rule of each message the built-in checks produce
+    RULES = (("Incorrect or missing headers", "headers"),
+             ("Malformed file error", "malformed"),
+             ("Duplicate batch_id", "duplicate_batch_id"),
+             ("Value exceeds", "value_exceeds"),
+             ("Invalid decimal format", "decimal_format"),
+             ("Non-numeric", "non_numeric"))
+
+    def __init__(self, block_size=BLOCK_SIZE, schema=None, unique_memory=None):
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if schema is not None and schema.definition == DEFAULT_SCHEMA:
+            schema = None
+        self._np = numpy
+        self.block_size = block_size
+        self._pending = bytearray()
+        self._fallback = None
+        if numpy is None or schema is not None or unique_memory is not None:
+            self._fallback = StreamValidator(schema=schema, unique_memory=unique_memory)
+        self._row_num = 1
+        self._headers_checked = False
+        # batch_ids of up to 8 bytes are packed into uint64 keys; longer
+        # ones, which never equal a short one, are kept as byte strings.
+        self._keys = {"short": [], "long": []}
+        self._rows = {"short": [], "long": []}
+        if numpy is not None:
+            self._unsupported = numpy.zeros(256, dtype=bool)
+            self._unsupported[list(self.UNSUPPORTED)] = True
+        self.result = None
+        self._validate_time = 0.0
+        self._recorded = False
+
+    @classmethod
+    def validate(cls, data, block_size=BLOCK_SIZE, schema=None):
+        """Validates CSV content held in memory. Returns (status, message)."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        validator = cls(block_size, schema)
+        try:
+            for i in range(0, len(data), block_size):
+                validator.feed(data[i:i + block_size])
+        except ValidationAborted:
+            pass
+        return validator.close()
+
+    def feed(self, data):
+        """
+        Consumes the next chunk of raw bytes and validates every complete
+        block. Raises ValidationAborted once the data is known to be invalid.
+        """
+        if self.result is not None:
+            raise ValidationAborted(self.result[1])
+        if self._fallback is not None:
+            return self._forward(data)
+        self._pending += data
+        while len(self._pending) >= self.block_size and self._fallback is None:
+            cut = self._pending.rfind(b"\n", 0, self.block_size) + 1
+            if not cut:
+                cut = self._pending.find(b"\n") + 1
+                if not cut:
+                    return
+            block = bytes(self._pending[:cut])
+            del self._pending[:cut]
+            self._timed_process(block)
+        if self._fallback is not None and self._pending:
+            pending, self._pending = bytes(self._pending), bytearray()
+            self._forward(pending)
+
+    def close(self):
+        """
+        Validates any buffered data and returns the final tuple (status, message).
+        """
+        if self.result is None and self._fallback is None:
+            try:
+                if self._pending:
+                    block, self._pending = bytes(self._pending), bytearray()
+                    self._timed_process(block)
+                if self._fallback is None:
+                    if not self._headers_checked:
+                        self.result = (False, "Incorrect or missing headers: None")
+                    else:
+                        self._finish()
+            except ValidationAborted:
+                pass
+        if self._fallback is not None:
+            self.result = self._fallback.close()
+        elif not self._recorded:
+            self._recorded = True
+            rule = self.result and next(
+                (rule for prefix, rule in self.RULES if self.result[1].startswith(prefix)),
+                "missing_columns")
+            record_validation(self.result, rule, self._row_num - 1, None,
+                              self._validate_time)
+        return self.result or (True, "Valid")
+
+    def _timed_process(self, block):
+        start = time.perf_counter()
+        try:
+            self._process(block)
+        finally:
+            self._validate_time += time.perf_counter() - start
+
+    def _forward(self, data):
+        try:
+            self._fallback.feed(data)
+        except ValidationAborted:
+            self.result = self._fallback.result
+            raise
+
+    def _process(self, block):
+        np = self._np
+        b = np.frombuffer(block, dtype=np.uint8)
+        cr = np.flatnonzero(b == 13)
+        if self._unsupported[b].any() or (
+                len(cr) and (cr[-1] + 1 == len(b) or (b[cr + 1] != 10).any())):
+            return self._switch(block)
+
+        newlines = np.flatnonzero(b == 10)
+        ends = newlines if block.endswith(b"\n") else np.append(newlines, len(b))
+        starts = np.concatenate(([0], newlines + 1))[:len(ends)]
+        ends = ends - ((ends > starts) & (b[ends - 1] == 13))
+        if not self._headers_checked:
+            if not len(starts):
+                return
+            self._headers_checked = True
+            headers, error = self._parse(block, starts[0], ends[0])
+            if error is None and not FileValidator.validate_headers(headers):
+                error = f"Incorrect or missing headers: {headers}"
+            if error is not None:
+                self.result = (False, error)
+                raise ValidationAborted(error)
+            starts, ends = starts[1:], ends[1:]
+        if not len(starts):
+            return
+        first_row = self._row_num + 1
+
+        commas = np.append(np.flatnonzero(b == 44), len(b))
+        first_comma = np.searchsorted(commas, starts)
+        id_ends = np.minimum(commas[first_comma], ends)
+        columns_ok = np.searchsorted(commas, ends) - first_comma == 11
+        flagged = ~columns_ok | (ends - starts > csv.field_size_limit())
+        rows = np.flatnonzero(columns_ok)
+        if len(rows):
+            # Readings follow the second comma up to the end of the line.
+            flagged[rows] |= ~self._readings_ok(
+                b, commas[first_comma[rows] + 1] + 1, ends[rows])
+
+        # Only flagged rows are parsed; they are confirmed, in order, by the
+        # same row checks the Python validators run.
+        error = None
+        for i in np.flatnonzero(flagged):
+            row, message = self._parse(block, starts[i], ends[i])
+            if message is None:
+                valid, message = FileValidator.validate_row(
+                    row, first_row + i, set())
+                if valid:
+                    continue
+            error = (first_row + i, row, message)
+            starts, id_ends = starts[:i + 1], id_ends[:i + 1]
+            break
+
+        self._add_keys(b, starts, id_ends, first_row)
+        self._row_num += len(starts)
+        if error is not None:
+            self._finish(*error)
+
+    def _readings_ok(self, b, starts, ends):
+        # Vectorized READING_PATTERN over the readings of each row, which
+        # span starts[i]:ends[i]. Every byte is checked against its next few
+        # neighbours, so no per-field loop is needed: a dot needs a digit
+        # before it and 1-3 digits then a separator after it, a non-zero
+        # integer digit must be the last one, and 9.9 may only be followed
+        # by zeros.
+        np = self._np
+        n = len(b)
+        x = np.concatenate((b, np.full(4, 10, dtype=np.uint8)))
+        digit = (x >= 48) & (x <= 57)
+        nonzero = digit & (x != 48)
+        sep = (x == 44) | (x == 10) | (x == 13)
+        dot = b == 46
+        comma = b == 44
+
+        def ahead(mask, k):
+            return mask[k:n + k]
+
+        def behind(mask, k):
+            return np.concatenate((np.zeros(k, dtype=bool), mask[:n - k]))
+
+        after_digit = behind(ahead(digit, 0), 1)
+        fraction = behind(dot, 1) | after_digit & (
+            behind(dot, 2) | behind(ahead(digit, 0), 2) & behind(dot, 3))
+        bad = ~(ahead(digit, 0) | dot | comma)
+        bad |= dot & ~(after_digit & ahead(digit, 1) & (
+            ahead(sep, 2) | ahead(digit, 2) & (
+                ahead(sep, 3) | ahead(digit, 3) & ahead(sep, 4))))
+        bad |= comma & behind(comma, 1)
+        bad |= ahead(nonzero, 0) & ahead(digit, 1) & ~fraction
+        bad |= ((b == 57) & ahead(x == 46, 1) & ahead(x == 57, 2)
+                & (ahead(nonzero, 3) | ahead(digit, 3) & ahead(nonzero, 4)))
+        bad &= self._spans(n, starts, ends)
+
+        ok = b[ends - 1] != 44
+        hits = np.flatnonzero(bad)
+        ok[np.searchsorted(starts, hits, side="right") - 1] = False
+        return ok
+
+    def _spans(self, n, starts, ends):
+        # Boolean mask of the bytes covered by the sorted, disjoint,
+        # non-adjacent spans: the mask toggles at every span boundary.
+        toggles = self._np.zeros(n + 1, dtype=bool)
+        toggles[starts] = True
+        toggles[ends] = True
+        return self._np.logical_xor.accumulate(toggles[:n])
+
+    def _add_keys(self, b, starts, ends, first_row):
+        np = self._np
+        lengths = ends - starts
+        short = lengths <= 8
+        columns = np.arange(8)
+        index = np.minimum(starts[short, None] + columns, len(b) - 1)
+        packed = np.where(columns < lengths[short, None], b[index], 0)
+        self._keys["short"].append(
+            np.ascontiguousarray(packed, dtype=np.uint8).view(">u8").ravel())
+        self._rows["short"].append(first_row + np.flatnonzero(short))
+        long_rows = np.flatnonzero(~short)
+        if len(long_rows):
+            self._keys["long"].append(np.array(
+                [b[starts[i]:ends[i]].tobytes() for i in long_rows]))
+            self._rows["long"].append(first_row + long_rows)
+
+    def _batch_id(self, kind, key):
+        if kind == "short":
+            return int(key).to_bytes(8, "big").rstrip(b"\0").decode("ascii")
+        return bytes(key).decode("ascii")
+
+    def _first_duplicate(self):
+        # Returns (row number, batch_id) of the first row whose batch_id
+        # repeats an earlier one, or None.
+        np = self._np
+        first = None
+        for kind, keys in self._keys.items():
+            if not keys:
+                continue
+            keys = np.concatenate(keys)
+            rows = np.concatenate(self._rows[kind])
+            order = np.argsort(keys, kind="stable")
+            ordered = keys[order]
+            repeats = order[1:][ordered[1:] == ordered[:-1]]
+            if len(repeats):
+                i = repeats.min()
+                if first is None or rows[i] < first[0]:
+                    first = (int(rows[i]), self._batch_id(kind, keys[i]))
+        return first
+
+    def _finish(self, row_num=None, row=None, message=None):
+        duplicate = self._first_duplicate()
+        if duplicate is not None and (row_num is None or duplicate[0] < row_num):
+            message = f"Duplicate batch_id {duplicate[1]} on row {duplicate[0]}"
+        elif duplicate is not None and duplicate[0] == row_num and row is not None:
+            # An empty row collides with an empty batch_id but has no cells.
+            message = FileValidator.validate_row(
+                row, row_num, {row[0]} if row else set())[1]
+        if message is not None:
+            self.result = (False, message)
+            raise ValidationAborted(message)
+
+    def _switch(self, block):
+        # Continues with StreamValidator from the start of this block.
+        self._finish()
+        self._fallback = StreamValidator(
+            has_headers=not self._headers_checked, first_row=self._row_num + 1,
+            seen={"batch_id": {self._batch_id(kind, key) for kind, keys in self._keys.items()
+                               for part in keys for key in part}})
+        self._keys = self._rows = None
+        self._forward(block)
+
+    def _parse(self, block, start, end):
+        # Parses one line like csv.reader; returns (row, error message).
+        try:
+            return next(csv.reader([block[start:end].decode("ascii")]), []), None
+        except Exception as e:
+            return None, f"Malformed file error: {str(e)}"
+
+
+class LocalUUIDProvider:
+    """Generates log UUIDs locally with uuid4, without any network access."""
+
+    def __call__(self):
+        return str(uuid.uuid4())
+
+
+class RemoteUUIDPool:
+    """
+    Serves log UUIDs from the remote UUID API out of a prefetched pool.
+    The pool is refilled in batches by a background thread once it runs
+    low, and an empty pool falls back to a local uuid4, so a call never
+    waits on the network.
+    """
+
+    def __init__(self, url=UUID_API, batch_size=100, low_water=20,
+                 timeout=UUID_API_TIMEOUT, retry_after=60):
+        self.url = url
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._uuids = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._next_attempt = 0.0
+
+    def __call__(self):
+        try:
+            value = self._uuids.popleft()
+        except IndexError:
+            value = str(uuid.uuid4())
+        if len(self._uuids) < self.low_water:
+            self._start_refill()
+        return value
+
+    def prefetch(self):
+        """
+        Fetches one batch of UUIDs from the API into the pool.
+        Returns the number of UUIDs added.
+        """
+        import requests  # imported on first use to keep startup fast
+        response = requests.get(
+            f"{self.url}/count/{self.batch_size}", timeout=self.timeout)
+        response.raise_for_status()
+        uuids = [value for value in response.json() if isinstance(value, str)]
+        self._uuids.extend(uuids)
+        return len(uuids)
+
+    def _start_refill(self):
+        with self._lock:
+            if self._refilling or time.time() < self._next_attempt:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        try:
+            self.prefetch()
+        except Exception:
+            # Unreachable API, e.g. on an air-gapped network: keep serving
+            # local UUIDs and try again later.
+            self._next_attempt = time.time() + self.retry_after
+        finally:
+            with self._lock:
+                self._refilling = False
+
+
+class LogRingBuffer(logging.Handler):
+    """
+    Keeps the most recent formatted log lines in memory so the GUI can show
+    new records without re-reading the log file.
+    """
+
+    def __init__(self, capacity=LOG_BUFFER_SIZE):
+        super().__init__()
+        self.lines = deque(maxlen=capacity)
+        self.count = 0  # total number of lines ever recorded
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.lines.append(line)
+        self.count += 1
+
+    def since(self, count):
+        """
+        Returns the lines recorded after the first `count` lines, oldest
+        first, together with the new total count.
+        """
+        with self.lock:
+            new = min(self.count - count, len(self.lines))
+            lines = [self.lines[-i] for i in range(new, 0, -1)]
+            return lines, self.count
+
+
+class _DeferredFlushFileHandler(logging.FileHandler):
+    # Writes records without flushing; _BatchingQueueListener flushes once
+    # the queue is drained.
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class _BatchingQueueListener(logging.handlers.QueueListener):
+    # Flushes the handlers once per burst of records instead of per record.
+    def handle(self, record):
+        with METRICS.timer("log_write"):
+            super().handle(record)
+            if self.queue.empty():
+                for handler in self.handlers:
+                    handler.flush()
+        METRICS.inc("log_records")
+
+
+class Logger:
+    # Background writer shared by all Logger instances; a new Logger
+    # replaces the previous one.
+    _listener = None
+
+    def __init__(self, uuid_provider=None):
+        # uuid_provider is any callable returning a UUID string
+        self.uuid_provider = uuid_provider or LocalUUIDProvider()
         self.ensure_directories()
         # Clear the error log file at startup
         if os.path.exists(ERROR_LOG_FILE):
             # Truncate the file to clear old logs
             open(ERROR_LOG_FILE, 'w').close()
-        logging.basicConfig(
-            filename=ERROR_LOG_FILE,
-            filemode='a',  # Append mode ensures new logs are added
-            level=logging.ERROR,
-            format="%(asctime)s - ERROR - [UUID: %(uuid)s] %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S"
-        )
+        self.buffer = LogRingBuffer()
+        self._queue = queue.Queue()
+        METRICS.set_gauge("log_queue_depth", self._queue.qsize)
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._start_writer()
+
+    def _start_writer(self):
+        formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+        Logger.stop()
+        for handler in self._logger.handlers[:]:
+            self._logger.removeHandler(handler)
+
+        # Append mode ensures new logs are added
+        file_handler = _DeferredFlushFileHandler(ERROR_LOG_FILE, mode='a')
+        file_handler.setFormatter(formatter)
+        Logger._listener = _BatchingQueueListener(self._queue, file_handler)
+        Logger._listener.start()
+
+        # The ring buffer is filled synchronously so the GUI sees a record
+        # as soon as log() returns; only the file write is deferred.
+        self.buffer.setFormatter(formatter)
+        self._logger.addHandler(logging.handlers.QueueHandler(self._queue))
+        self._logger.addHandler(self.buffer)
+        self._logger.setLevel(logging.ERROR)
+        self._logger.propagate = False
+
+    @staticmethod
+    def stop():
+        """Writes out all queued records and stops the background writer."""
+        listener, Logger._listener = Logger._listener, None
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
 
     def ensure_directories(self):
         os.makedirs(VALID_DIR, exist_ok=True)
         os.makedirs(ERROR_LOG_DIR, exist_ok=True)
 
     def get_uuid(self):
+        """Fetches a single UUID from the remote UUID API."""
         try:
-            response = requests.get(
-                "https://www.uuidtools.com/api/generate/v1")
+            import requests  # imported on first use to keep startup fast
+            response = requests.get(UUID_API, timeout=UUID_API_TIMEOUT)
             response.raise_for_status()
             uuid_list = response.json()
             return uuid_list[0] if uuid_list else "unknown_uuid"
         except Exception as e:
-            logging.error(f"UUID generation failed: {str(e)}", extra={
-                          "uuid": "unknown_uuid"})
+            self._logger.error(f"UUID generation failed: {str(e)}", extra={
+                "uuid": "unknown_uuid"})
             return "unknown_uuid"
 
     def log(self, message):
-        uuid = self.get_uuid()
-        logging.error(message, extra={"uuid": uuid})
-
-
-class App:
-    def __init__(self, root):
-        self.root = root
-        self.files = None
-        self.file_listbox = None
-        self.valid_files_listbox = None
-        self.error_logs_listbox = None
-        self.search_var = StringVar()
-        self.ftp_client = FTPClient()
-        self.logger = Logger()
-        self.build_gui()
-
-    def ftp_client_connect(self):
-        try:
-            status, message = self.ftp_client.connect(
-                self.host_var.get(), self.user_var.get(), self.pass_var.get())
-
-            if status is True:
-                # Change entry state to disabled
-                self.host_entry.config(state='disabled')
-                self.user_entry.config(state='disabled')
-                self.pass_entry.config(state='disabled')
-
-                # Connection Button
-                self.ftp_connect_btn.config(
-                    text="Disconnect", bg='red', command=self.ftp_client_disconnect)
-                messagebox.showinfo("Success", "Connected to FTP Server")
-
-                self.list_files()
-            else:
-                messagebox.showerror("Error", message)
-        except Exception as e:
-            messagebox.showerror("Error", f"FTP connection failed: {e}")
-
-    def ftp_client_disconnect(self):
-        try:
-            self.ftp_client.disconnect()
-            # Change state to normal to type again
-            self.host_entry.config(state='normal')
-            self.user_entry.config(state='normal')
-            self.pass_entry.config(state='normal')
-            # Clear entry values
-            self.host_var.set("")
-            self.user_var.set("")
-            self.pass_var.set("")
-
-            self.search_var.set('')
+        self._logger.error(message, extra={"uuid": self.uuid_provider()})
+
+    def flush(self):
+        """Blocks until every record logged so far is written to the file."""
+        self._queue.join()
+
+    def pending(self):
+        """Returns the number of records waiting to be written."""
+        return self._queue.qsize()
+
+
+atexit.register(Logger.stop)
+
+
+class ProcessedLedger:
+    """
+    Durable record of processed remote files, stored in SQLite and keyed
+    by remote path, size and mtime. An in-memory index of the keys makes
+    the already-processed check O(1); a file whose size or mtime changed
+    has a new key and is processed again. Outcomes other than "valid",
+    "invalid" and "rejected" (e.g. transfer errors) do not count as
+    processed, so those files are retried.
+    """
+
+    FINAL_OUTCOMES = ("valid", "invalid", "rejected")
+
+    def __init__(self, path=LEDGER_FILE):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            " remote_path TEXT NOT NULL, size INTEGER NOT NULL,"
+            " mtime INTEGER NOT NULL, content_hash TEXT, outcome TEXT NOT NULL,"
+            " message TEXT, duration REAL, output TEXT, processed_at REAL,"
+            " PRIMARY KEY (remote_path, size, mtime))")
+        self._db.commit()
+        self._outcomes = {
+            (path, size, mtime): outcome for path, size, mtime, outcome in
+            self._db.execute(
+                "SELECT remote_path, size, mtime, outcome FROM processed")}
 
-            # Connection Button
-            self.ftp_connect_btn.config(
-                text="Connect to FTP", command=self.ftp_client_connect, bg='teal')
-            messagebox.showinfo(
-                "Disconnected", "Disconnected from FTP Server")
+    @staticmethod
+    def _key(remote_path, size, mtime):
+        # Unknown size or mtime are stored as -1 so they still form a key.
+        return (remote_path,
+                -1 if size is None else int(size),
+                -1 if mtime is None else int(mtime))
+
+    def seen(self, remote_path, size=None, mtime=None):
+        """Returns True if this version of the file was already processed."""
+        outcome = self._outcomes.get(self._key(remote_path, size, mtime))
+        return outcome in self.FINAL_OUTCOMES
+
+    def record(self, remote_path, size, mtime, outcome, message=None,
+               duration=None, output=None, content_hash=None):
+        """Stores the outcome of processing one version of a remote file."""
+        key = self._key(remote_path, size, mtime)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, content_hash, outcome, message, duration, output,
+                 time.time()))
+            self._db.commit()
+            self._outcomes[key] = outcome
+
+    def get(self, remote_path, size=None, mtime=None):
+        """Returns the stored row for this version of a file as a dict, or None."""
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT * FROM processed WHERE remote_path = ? AND size = ? AND mtime = ?",
+                self._key(remote_path, size, mtime))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class BatchIdIndex:
+    """
+    Persistent index of the batch_ids in every CSV file promoted to a
+    directory, stored in SQLite, so a new file can be checked against all
+    earlier ones without re-reading them. batch_id is the primary key of a
+    WITHOUT ROWID table, making each lookup a single B-tree search. The
+    directory is scanned on opening: files added, changed or removed by
+    other means are re-indexed or forgotten, keyed by size and mtime.
+    """
+
+    def __init__(self, path=BATCH_INDEX_FILE, directory=VALID_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS batch_ids ("
+            " batch_id TEXT PRIMARY KEY, file TEXT NOT NULL) WITHOUT ROWID")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS batch_ids_file ON batch_ids (file)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " file TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL)")
+        # Holds the batch_ids of the file being checked, for a bulk join.
+        self._db.execute(
+            "CREATE TEMP TABLE incoming (row INTEGER PRIMARY KEY, batch_id TEXT NOT NULL)")
+        self._db.commit()
+        self.sync()
 
-            self.remove_files()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to disconnect: {e}")
+    @staticmethod
+    def batch_ids(path):
+        """Yields (row number, batch_id) for every data row of a CSV file."""
+        with open(path, newline="", encoding="utf-8", errors="ignore") as file:
+            reader = csv.reader(file)
+            headers = next(reader, None) or []
+            if "batch_id" not in headers:
+                return
+            column = headers.index("batch_id")
+            for row_num, row in enumerate(reader, start=2):
+                if len(row) > column:
+                    yield row_num, row[column]
+
+    def sync(self):
+        """Indexes new or changed CSV files in the directory and forgets removed ones."""
+        current = {}
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.lower().endswith(".csv"):
+                    stat = entry.stat()
+                    current[entry.name] = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            indexed = {file: (size, mtime) for file, size, mtime in
+                       self._db.execute("SELECT file, size, mtime FROM files")}
+            for file in indexed.keys() - current.keys():
+                self._forget(file)
+            for file, version in current.items():
+                if indexed.get(file) != version:
+                    self._forget(file)
+                    self._insert(file, version)
+            self._db.commit()
+
+    def find_duplicate(self, path):
+        """
+        Checks the batch_ids of the CSV file at path against the index in
+        bulk. Returns (batch_id, row number, indexed file) for the first row
+        whose batch_id is already indexed, or None.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM incoming")
+            self._db.executemany("INSERT INTO incoming VALUES (?, ?)",
+                                 self.batch_ids(path))
+            duplicate = self._db.execute(
+                "SELECT incoming.batch_id, incoming.row, batch_ids.file"
+                " FROM incoming JOIN batch_ids USING (batch_id)"
+                " ORDER BY incoming.row LIMIT 1").fetchone()
+            self._db.execute("DELETE FROM incoming")
+            self._db.commit()
+        return duplicate
+
+    def add(self, file):
+        """Indexes a file just promoted to the directory, given its name."""
+        stat = os.stat(os.path.join(self.directory, file))
+        with self._lock:
+            self._insert(file, (stat.st_size, stat.st_mtime))
+            self._db.commit()
+
+    def __contains__(self, batch_id):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM batch_ids WHERE batch_id = ?",
+                (batch_id,)).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _insert(self, file, version):
+        # A batch_id already indexed stays with the file that had it first.
+        self._db.executemany(
+            "INSERT OR IGNORE INTO batch_ids VALUES (?, ?)",
+            ((batch_id, file) for _, batch_id in
+             self.batch_ids(os.path.join(self.directory, file))))
+        self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                         (file, *version))
+
+    def _forget(self, file):
+        self._db.execute("DELETE FROM batch_ids WHERE file = ?", (file,))
+        self._db.execute("DELETE FROM files WHERE file = ?", (file,))
+
+
+def write_error_report(source, issues, report_format="jsonl",
+                       directory=ERROR_LOG_DIR):
+    """
+    Writes the ValidationIssue records found in `source` to a JSONL or CSV
+    report in `directory`, next to the error log. Returns the report path.
+    """
+    if report_format not in ERROR_REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format: {report_format}")
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.splitext(os.path.basename(source))[0]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    path = os.path.join(directory, f"{name}_{timestamp}_errors.{report_format}")
+    with open(path, "w", newline="", encoding="utf-8") as report:
+        if report_format == "jsonl":
+            for issue in issues:
+                report.write(json.dumps({"file": source, **issue._asdict()}) + "\n")
+        else:
+            writer = csv.writer(report)
+            writer.writerow(("file",) + ValidationIssue._fields)
+            writer.writerows((source,) + tuple(issue) for issue in issues)
+    return path
+
+
+def validate_spooled_file(path, max_errors=None, schema=None, unique_memory=None):
+    """
+    Validates a spooled file and hashes it in the same pass. Runs in a
+    validation worker process. With max_errors set, all violations up to
+    that many are collected instead of stopping at the first. unique_memory
+    bounds the memory used for duplicate detection. Returns a tuple
+    (status, message, SHA-256 hex digest, list of ValidationIssue, metrics),
+    where metrics is what the worker recorded, as returned by Metrics.drain().
+    """
+    digest = hashlib.sha256()
+    errors = [] if max_errors else None
+    with METRICS.timer("hash_and_validate"):
+        is_valid, msg = FileValidator.validate_file(
+            path, digest=digest, columnar=True, errors=errors,
+            max_errors=max_errors, schema=schema, unique_memory=unique_memory)
+    return (is_valid, msg, digest.hexdigest() if is_valid else None, errors or [],
+            METRICS.drain())
+
+
+def validate_range(path, start, end, schema=None, row_num=None, seen=None):
+    """
+    Validates the lines of a file between byte offsets start and end, which
+    must be line boundaries; only the range at offset 0 has headers. Runs
+    in a validation worker process for FileValidator.validate_parallel.
+    Rows are numbered from row_num, by default from the start of the range,
+    and seen optionally maps unique columns to values already used.
+    Returns a tuple ((status, message), rule of the first issue, number of
+    the last row checked, list of the sets of values of unique columns).
+    """
+    # METRICS are recorded once for the whole file.
+    validator = StreamValidator(
+        schema=schema, has_headers=start == 0, seen=seen, record_metrics=False,
+        first_row=row_num + 1 if row_num is not None else None)
+    with open(path, "rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        try:
+            for offset in range(start, end, 1024 * 1024):
+                validator.feed(data[offset:min(offset + 1024 * 1024, end)])
+        except ValidationAborted:
+            pass
+    result = validator.close()
+    return result, validator.rule, validator.last_row, validator.unique_sets
+
+
+BatchResult = namedtuple(
+    "BatchResult", "filename valid message saved_as outcome duration report",
+    defaults=(None, None, None))
+
+
+class BatchProcessor:
+    """
+    Downloads and validates many remote files concurrently.
+    Transfers run over a small pool of FTP connections, while the CPU-bound
+    validation of each spooled file runs in a process pool.
+    """
+
+    def __init__(self, host, user, password, port=0, connections=4,
+                 workers=None, dest_dir=VALID_DIR, logger=None, ledger=None,
+                 retries=3, report=None, max_errors=MAX_REPORTED_ERRORS,
+                 schema=None, unique_memory=None, batch_index=None):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.connections = connections
+        self.workers = workers
+        self.dest_dir = dest_dir
+        self.logger = logger
+        self.retries = retries
+        # With a report format, invalid files are checked in full and their
+        # errors written to a report next to the error log.
+        self.report = report
+        self.max_errors = max_errors
+        self.schema = schema
+        self.unique_memory = unique_memory
+        # With a BatchIdIndex, a valid file is only promoted if none of its
+        # batch_ids appear in a file promoted before.
+        self.batch_index = batch_index
+        # Without a ledger file, processed files are only remembered for
+        # the lifetime of this processor.
+        self.ledger = ledger or ProcessedLedger(":memory:")
+        self.pool = None
+        self.listing = DirectoryCache()
+        self.crawler = None  # RemoteCrawler of the last discover()
+        self._hashes = {}  # content hashes of validated files, by filename
+
+    def resolve(self, patterns):
+        """
+        Expands glob patterns against the remote file list.
+        Returns the matching filenames in listing order, without duplicates.
+        """
+        self._get_pool().call(lambda ftp: self.listing.refresh(ftp))
+        listing = self.listing.files()
+        matched = {}
+        for pattern in patterns:
+            for name in listing:
+                if fnmatch.fnmatchcase(name, pattern):
+                    matched[name] = None
+        return list(matched)
+
+    def pending(self, filenames):
+        """
+        Returns the filenames whose current version, by the size and mtime
+        in the latest listing, is not recorded in the ledger yet.
+        """
+        return [f for f in filenames if not self.ledger.seen(f, *self._version(f))]
 
-    def list_files(self):
+    def run(self, filenames):
+        """
+        Processes the given remote files and yields a BatchResult for each
+        one as soon as it is finished, in completion order. Every result is
+        recorded in the ledger. filenames may be a generator, e.g. from
+        discover(); each file is queued for download as soon as it is
+        produced, while earlier files are transferred and validated.
+        """
+        pending = {}
+        started = {}
+        names = iter(filenames)
         try:
-            self.files = self.ftp_client.get_file_list()
-            self.file_listbox.delete(0, END)
-            for file in self.files:
-                self.file_listbox.insert(END, file)
+            with ThreadPoolExecutor(self.connections) as downloads, \
+                    ProcessPoolExecutor(self.workers) as validations, \
+                    ThreadPoolExecutor(1) as discovery:
+                pending[discovery.submit(next, names, None)] = (None, None)
+                queued = {"download": 0, "validation": 0}
+
+                while pending:
+                    for stage, depth in queued.items():
+                        METRICS.set_gauge("queue_depth", depth, queue=stage)
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        filename, tmp_path = pending.pop(future)
+                        if filename is None:
+                            filename = future.result()
+                            if filename is not None:
+                                started[filename] = time.monotonic()
+                                future = downloads.submit(self._download, filename)
+                                pending[future] = (filename, None)
+                                queued["download"] += 1
+                                pending[discovery.submit(next, names, None)] = (None, None)
+                            continue
+                        if tmp_path is None:
+                            queued["download"] -= 1
+                            result = self._downloaded(
+                                future, filename, validations, pending)
+                            if result is None:
+                                queued["validation"] += 1
+                        else:
+                            queued["validation"] -= 1
+                            result = self._validated(
+                                future, filename, tmp_path)
+                        if result is not None:
+                            result = result._replace(
+                                duration=time.monotonic() - started[filename])
+                            self._record(result)
+                            yield result
+        finally:
+            for stage in ("download", "validation"):
+                METRICS.set_gauge("queue_depth", 0, queue=stage)
+            for future, (filename, tmp_path) in pending.items():
+                future.cancel()
+                if tmp_path is not None:
+                    discard_spool(tmp_path)
+
+    def discover(self, root="", max_depth=None, include=("*.csv",), exclude=(),
+                 reprocess=False):
+        """
+        Walks the remote tree below root with a RemoteCrawler on the pooled
+        connections and yields the paths of matching files as they are
+        found, skipping versions already in the ledger unless reprocess
+        is set. Pass the generator to run() to download and validate
+        files while the crawl goes on. The crawler, with its per-directory
+        listing cache, is kept for the next call with the same settings.
+        """
+        settings = (root.strip("/"), max_depth, list(include), list(exclude))
+        if self.crawler is None or (self.crawler.root, self.crawler.max_depth,
+                                    self.crawler.include, self.crawler.exclude) != settings:
+            self.crawler = RemoteCrawler(
+                self._get_pool(), root, max_depth, include, exclude)
+        for path in self.crawler.walk():
+            if reprocess or not self.ledger.seen(path, *self._version(path)):
+                yield path
+        for path, message in self.crawler.errors:
+            if self.logger is not None:
+                self.logger.log(f"Listing Error: cannot list '{path}': {message}")
+
+    def close(self):
+        """
+        Closes the pooled FTP connections. They are kept open between runs
+        so repeated polls reuse the same sessions.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def _version(self, filename):
+        entry = self.listing.entries.get(filename)
+        if entry is None and self.crawler is not None:
+            entry = self.crawler.entry(filename)
+        return (entry.size, entry.mtime) if entry is not None else (None, None)
+
+    def _record(self, result):
+        METRICS.inc("files_processed", outcome=result.outcome)
+        size, mtime = self._version(result.filename)
+        self.ledger.record(result.filename, size, mtime, result.outcome,
+                           result.message, result.duration, result.saved_as,
+                           self._hashes.pop(result.filename, None))
+
+    def _get_pool(self):
+        if self.pool is None:
+            self.pool = FTPConnectionPool(
+                self.host, self.user, self.password, port=self.port,
+                size=self.connections)
+        return self.pool
+
+    @METRICS.timed("download")
+    def _download(self, filename):
+        # Runs in a download thread. Returns a BatchResult when the file is
+        # rejected before transfer, otherwise the path of the spooled file.
+        if not filename.lower().endswith('.csv'):
+            return self._failure(
+                filename,
+                f"Invalid file extension for '{filename}'. Only '.csv' files are allowed.",
+                outcome="rejected")
+        pool = self._get_pool()
+        try:
+            size = self._version(filename)[0]
+            if size is None:
+                with METRICS.timer("size"):
+                    size = pool.call(lambda ftp: ftp.size(filename))
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to list files: {e}")
-
-    def remove_files(self):
-        self.files = None
-        self.file_listbox.delete(0, END)
-
-    def download_file(self):
-        if not self.ftp_client.is_connected():
-            messagebox.showerror("Error", "Not connected to FTP")
-            return
-
-        selected_file = self.file_listbox.curselection()
-        if not selected_file:
-            messagebox.showerror("Error", "No file selected")
-            return
-
-        filename = self.file_listbox.get(selected_file)
-        if filename in self.ftp_client.downloaded_files:
-            messagebox.showwarning(
-                "Warning", f"File '{filename}' already downloaded or attempted.")
-            return
-
-        self.download_status.config(text="Downloading...", foreground="blue")
-        self.download_btn.config(state="disabled", bg="white")
-
-        def after_delay():
-            if not filename.lower().endswith('.csv'):
-                self.download_status.config(
-                    text="Fail", foreground="red")
-                error_msg = f"Invalid file extension for '{filename}'. Only '.csv' files are allowed."
-                self.logger.log(error_msg)
-                self.load_error_logs()
-                messagebox.showerror("Invalid File", error_msg)
-                self.ftp_client.downloaded_files.append(filename)
-                self.download_status.config(text="Idle", foreground="black")
-                self.download_btn.config(state="normal", bg="teal")
-                return
-
+            return self._failure(
+                filename, f"Download size check error: {str(e)}",
+                outcome="error")
+        if size == 0:
+            return self._failure(
+                filename, f"File '{filename}' is empty (zero size).",
+                outcome="rejected")
+        for attempt in range(self.retries + 1):
             try:
-                size = self.ftp_client.ftp.size(filename)
-                if size == 0:
-                    self.download_status.config(
-                        text="Fail", foreground="red")
-                    error_msg = f"File '{filename}' is empty (zero size)."
-                    self.logger.log(error_msg)
-                    self.load_error_logs()
-                    messagebox.showwarning("Warning", error_msg)
-                    self.ftp_client.downloaded_files.append(filename)
-                    self.download_status.config(
-                        text="Idle", foreground="black")
-                    self.download_btn.config(state="normal", bg="teal")
-                    return
-            except Exception as e:
-                self.download_status.config(
-                    text="Fail", foreground="red")
-                self.logger.log(f"Download size check error: {str(e)}")
-                self.load_error_logs()
-                self.ftp_client.downloaded_files.append(filename)
-                self.download_status.config(text="Idle", foreground="black")
-                self.download_btn.config(state="normal", bg="teal")
-                return
-
-            try:
-                content = self.ftp_client.download_file(filename)
-                valid, msg = FileValidator.validate(content)
-                if valid:
-                    self.download_status.config(
-                        text="Success", foreground="green")
-                    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                    new_filename = f"MED_DATA_{timestamp}.csv"
-                    path = os.path.join(VALID_DIR, new_filename)
-                    with open(path, 'w') as f:
-                        f.write(content)
-                    self.valid_files_listbox.insert(END, new_filename)
-                    self.valid_files_listbox.see(END)
-                    self.valid_files_listbox.selection_clear(0, END)
-                    self.valid_files_listbox.selection_set(END)
-                    messagebox.showinfo(
-                        "Success", f"File saved as '{new_filename}' in '{VALID_DIR}'.")
-                else:
-                    self.download_status.config(
-                        text="Fail", foreground="red")
-                    self.logger.log(
-                        f"Validation failed for '{filename}': {msg}")
-                    self.load_error_logs()
-                    messagebox.showerror("Validation Error",
-                                         f"Validation failed:\n{msg}")
-            except Exception as e:
-                self.download_status.config(
-                    text="Fail", foreground="red")
-                self.logger.log(f"Download error: {str(e)}")
-                self.load_error_logs()
-                messagebox.showerror(
-                    "Download Error", f"Failed to download/process file:\n{e}")
-            finally:
-                self.ftp_client.downloaded_files.append(filename)
-                self.download_status.config(text="Idle", foreground="black")
-                self.download_btn.config(state="normal", bg="teal")
-
-        self.download_status.after(
-            3000, after_delay)
-
-    def load_error_logs(self):
-        """Load error logs from the file and update the error_logs_listbox."""
-        try:
-            if os.path.exists(ERROR_LOG_FILE):
-                with open(ERROR_LOG_FILE, "r") as file:
-                    logs = file.readlines()
-                self.error_logs_listbox.delete(0, END)
-                for log in logs:
-                    self.error_logs_listbox.insert(END, log.strip())
+                with pool.connection() as ftp:
+                    return FTPClient(ftp).spool_file(filename, self.dest_dir)
+            except ftplib.all_errors as e:
+                # The pool reopens the dropped connection and spool_file
+                # resumes from the bytes already received.
+                if not is_connection_error(e) or attempt == self.retries:
+                    raise
+
+    def _downloaded(self, future, filename, validations, pending):
+        try:
+            outcome = future.result()
+        except Exception as e:
+            return self._failure(filename, f"Download error: {str(e)}",
+                                 outcome="error")
+        if isinstance(outcome, BatchResult):
+            return outcome
+        validation = validations.submit(
+            validate_spooled_file, outcome,
+            self.max_errors if self.report else None, self.schema,
+            self.unique_memory)
+        pending[validation] = (filename, outcome)
+        return None
+
+    def _validated(self, future, filename, tmp_path):
+        try:
+            is_valid, msg, content_hash, issues, metrics = future.result()
+            METRICS.merge(metrics)
+            if is_valid and self.batch_index is not None:
+                duplicate = self.batch_index.find_duplicate(tmp_path)
+                if duplicate is not None:
+                    batch_id, row_num, other = duplicate
+                    msg = f"Duplicate batch_id {batch_id} on row {row_num}, already in {other}"
+                    return self._failure(
+                        filename, msg, f"Validation failed for '{filename}': {msg}")
+            if is_valid:
+                saved_as = promote_valid_file(tmp_path, self.dest_dir)
+                if self.batch_index is not None:
+                    self.batch_index.add(saved_as)
+                self._hashes[filename] = content_hash
+                return BatchResult(filename, True, msg, saved_as, "valid")
+            report = None
+            if issues:
+                report = write_error_report(filename, issues, self.report)
+                msg = f"{msg} ({len(issues)} errors found)"
+            return self._failure(
+                filename, msg, f"Validation failed for '{filename}': {msg}",
+                report=report)
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load error logs: {e}")
+            return self._failure(filename, f"Validation error: {str(e)}",
+                                 outcome="error")
+        finally:
+            discard_spool(tmp_path)
+
+    def _failure(self, filename, message, log_message=None, outcome="invalid",
+                 report=None):
+        if self.logger is not None:
+            self.logger.log(log_message or message)
+        return BatchResult(filename, False, message, None, outcome, report=report)
+
+
+TransferOutcome = namedtuple(
+    "TransferOutcome", "status dialog title message saved_as")
+
+
+class TransferWorker(threading.Thread):
+    """
+    Checks, downloads and validates one file on a background thread using
+    a connection from `pool`. Progress and the final TransferOutcome are
+    posted to `events`, which the GUI polls with after(), so Tk is only
+    ever touched from the main thread.
+
+    Events are ("progress", received, total, bytes_per_second) and
+    ("finished", TransferOutcome). The outcome status is "success", "fail"
+    for a file that was checked and rejected, "error" for a transfer that
+    failed and can be retried, or "cancelled". A transfer interrupted by a
+    dropped connection is resumed on a fresh pooled connection up to
+    `retries` times. With batch_index, files repeating a batch_id already
+    in dest_dir are rejected, as in save_valid_file.
+    """
+
+    PROGRESS_INTERVAL = 0.1  # seconds between progress events
+
+    def __init__(self, pool, filename, logger, dest_dir=VALID_DIR, size=None,
+                 retries=3, batch_index=None):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.filename = filename
+        self.retries = retries
+        # Known size, e.g. from a directory listing
+        self.size = size
+        self.logger = logger
+        self.dest_dir = dest_dir
+        self.batch_index = batch_index
+        self.events = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """Asks the worker to abort the transfer at the next received chunk."""
+        self.cancelled.set()
+
+    def run(self):
+        self.events.put(("finished", self._transfer()))
+
+    def _transfer(self):
+        filename = self.filename
+        try:
+            total = self.size
+            if total is None:
+                total = self.pool.call(lambda ftp: ftp.size(filename))
+        except Exception as e:
+            return self._failure(
+                None, "Error", f"Download size check error: {str(e)}", "error")
+        if total == 0:
+            error_msg = f"File '{filename}' is empty (zero size)."
+            return self._failure("warning", "Warning", error_msg)
+
+        started = last_report = time.monotonic()
+
+        def progress(received):
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report >= self.PROGRESS_INTERVAL or received == total:
+                last_report = now
+                rate = received / max(now - started, 1e-6)
+                self.events.put(("progress", received, total, rate))
 
-    def searchFileName(self):
-        if not self.ftp_client.is_connected():
-            messagebox.showerror("Error", "Not connected to FTP")
-            return
-        search_value = self.search_var.get().strip()
-        if not search_value:
-            messagebox.showerror("Error", "Please enter search keyword")
-            return
         try:
-            found_files = self.ftp_client.search_files(search_value)
-            self.file_listbox.delete(0, END)
-            for file in found_files:
-                self.file_listbox.insert(END, file)
+            for attempt in range(self.retries + 1):
+                try:
+                    with self.pool.connection() as ftp:
+                        valid, msg, new_filename = FTPClient(ftp).save_valid_file(
+                            filename, self.dest_dir, progress, self.cancelled,
+                            self.batch_index)
+                    break
+                except ftplib.all_errors as e:
+                    # The pool reopens the dropped connection and
+                    # save_valid_file resumes from the bytes already received.
+                    if not is_connection_error(e) or attempt == self.retries:
+                        raise
+        except TransferCancelled as e:
+            return TransferOutcome("cancelled", "info", "Cancelled", str(e), None)
         except Exception as e:
-            messagebox.showerror("Error", f"Search failed: {e}")
-
-    def clearSearch(self):
-        self.search_var.set('')
-        self.list_files()
-
-    def build_gui(self):
-        self.root.title("FTP CSV Validator")
-        self.root.geometry("800x600")
-
-        main_frame = Frame(self.root)
-        main_frame.pack(padx=10, pady=10, fill="both", expand=True)
-
-        # Connection Frame
-        navbar_header = Frame(main_frame)
-        navbar_header.pack(fill="x")
-
-        # Header
-        Label(navbar_header, text="FTP Connection",
-              font=("Arial", 12, "bold")).pack(side="left")
-        navbar_frame = Frame(main_frame)
-        navbar_frame.pack(fill="x", pady=15)
-
-        # Hostname Entry
-        Label(navbar_frame, text="Hostname").pack(side="left")
-        self.host_var = StringVar()
-        self.host_entry = Entry(navbar_frame, textvariable=self.host_var)
-        self.host_entry.pack(side="left", padx=10)
-
-        # Username Entry
-        Label(navbar_frame, text="Username").pack(side="left")
-        self.user_var = StringVar()
-        self.user_entry = Entry(navbar_frame, textvariable=self.user_var)
-        self.user_entry.pack(side="left", padx=10)
-
-        # Password Entry
-        Label(navbar_frame, text="Password").pack(side="left")
-        self.pass_var = StringVar()
-        self.pass_entry = Entry(
-            navbar_frame, textvariable=self.pass_var, show='*')
-        self.pass_entry.pack(side="left", padx=10)
-
-        # FTP Server Connection Button
-        self.ftp_connect_btn = Button(
-            navbar_frame,
-            text="Connect to FTP",
-            command=self.ftp_client_connect,
-            width=20,
-            background='teal',
-            foreground='white',
-            activeforeground='teal'
-        )
-        self.ftp_connect_btn.pack(side="right")
-
-        # File List Header Frame
-        file_header_frame = Frame(main_frame)
-        file_header_frame.pack(fill="both", expand=True, pady=10)
-        Label(file_header_frame, text="Available Files",
-              font=("Arial", 12, "bold")).pack(side="left")
-        # Search Entry and Buttons
-        Button(file_header_frame, command=self.clearSearch, text="Clear Search", width=10, pady=0, foreground='teal',
-               ).pack(side="right")
-        Button(file_header_frame, command=self.searchFileName, text="Search", width=10, pady=0, foreground='teal'
-               ).pack(side="right", padx=3)
-        self.search_entry = Entry(file_header_frame, textvariable=self.search_var,
-                                  width=30)
-        self.search_entry.pack(side="right")
-
-        # Bind the <Return> key to the search function
-        self.search_entry.bind("<Return>", lambda event: self.searchFileName())
-
-        # File Lists
-        file_frame = Frame(main_frame)
-        file_frame.pack(fill="both", expand=True, pady=5)
-        self.file_listbox = Listbox(file_frame, width=60, height=10)
-        self.file_listbox.pack(side="left", fill="both", expand=True)
-
-        scrollbar = Scrollbar(file_frame)
-        scrollbar.pack(side="right", fill="y")
-        self.file_listbox.config(yscrollcommand=scrollbar.set)
-        scrollbar.config(command=self.file_listbox.yview)
-
-        # File Lists Footer
-        file_footer_frame = Frame(main_frame)
-        file_footer_frame.pack(fill="x", expand=True)
-
-        # Download Status
-        Label(file_footer_frame, text="Download Status:", font=("Arial", 10)).pack(
-            side="left")
-        self.download_status = Label(
-            file_footer_frame, text="Idle", foreground="black")
-        self.download_status.pack(side="left")
-
-        # Download Button
-        self.download_btn = Button(file_footer_frame, command=self.download_file, text="Download File", width=20, pady=3, foreground='white', background='teal',
-                                   )
-        self.download_btn.pack(side="right")
-
-        # Valid Files Frame
-        valid_files_frame = Frame(main_frame)
-        valid_files_frame.pack(fill="both", expand=True, pady=5)
-        Label(valid_files_frame, text="Valid Files", font=(
-            "Arial", 12, "bold")).pack(anchor="w", pady=5)
-        self.valid_files_listbox = Listbox(
-            valid_files_frame, width=60, height=5)
-        self.valid_files_listbox.pack(side="left", fill="both", expand=True)
-
-        valid_scrollbar = Scrollbar(valid_files_frame)
-        valid_scrollbar.pack(side="right", fill="y")
-        self.valid_files_listbox.config(yscrollcommand=valid_scrollbar.set)
-        valid_scrollbar.config(command=self.valid_files_listbox.yview)
-
-        # Error Logs Frame
-        error_logs_frame = Frame(main_frame)
-        error_logs_frame.pack(fill="both", expand=True, pady=5)
-        Label(error_logs_frame, text="Error Logs", font=(
-            "Arial", 12, "bold")).pack(anchor="w", pady=5)
-        self.error_logs_listbox = Listbox(error_logs_frame, width=60, height=5)
-        self.error_logs_listbox.pack(side="left", fill="both", expand=True)
-
-        error_scrollbar = Scrollbar(error_logs_frame)
-        error_scrollbar.pack(side="right", fill="y")
-        self.error_logs_listbox.config(yscrollcommand=error_scrollbar.set)
-        error_scrollbar.config(command=self.error_logs_listbox.yview)
+            self.logger.log(f"Download error: {str(e)}")
+            return TransferOutcome(
+                "error", "error", "Download Error",
+                f"Failed to download/process file:\n{e}", None)
+        if valid:
+            return TransferOutcome(
+                "success", "info", "Success",
+                f"File saved as '{new_filename}' in '{self.dest_dir}'.",
+                new_filename)
+        self.logger.log(f"Validation failed for '{filename}': {msg}")
+        return TransferOutcome(
+            "fail", "error", "Validation Error", f"Validation failed:\n{msg}", None)
+
+    def _failure(self, dialog, title, message, status="fail"):
+        self.logger.log(message)
+        return TransferOutcome(status, dialog, title, message, None)
+
+
+def print_result(result):
+    if result.valid:
+        print(f"OK    {result.filename} -> {result.saved_as}", flush=True)
+    else:
+        print(f"FAIL  {result.filename}: {result.message}", flush=True)
+        if result.report:
+            print(f"      errors written to {result.report}", flush=True)
+
+
+def watch(processor, patterns, interval, stop, crawl=None):
+    """
+    Polls the server every `interval` seconds and processes matching files
+    whose current version is not in the processor's ledger yet, until the
+    `stop` event is set. crawl, if given, holds the discover() arguments
+    for walking a directory tree instead of matching patterns in the
+    current directory.
+    """
+    while not stop.is_set():
+        try:
+            if crawl is not None:
+                filenames = processor.discover(**crawl)
+            else:
+                filenames = processor.pending(processor.resolve(patterns))
+            for result in processor.run(filenames):
+                print_result(result)
+        except ftplib.all_errors as e:
+            # The server may be down for a while; keep polling.
+            print(f"Poll failed: {e}", file=sys.stderr, flush=True)
+            processor.close()
+        stop.wait(interval)
+
+
+def run_ingest(args):
+    """Runs a headless batch download and validation. Returns the exit code."""
+    processor = BatchProcessor(
+        args.host, args.user, args.password, port=args.port,
+        connections=args.connections, workers=args.workers,
+        logger=Logger(RemoteUUIDPool() if args.remote_uuids else None),
+        ledger=ProcessedLedger(args.ledger) if args.ledger else None,
+        report=args.report, max_errors=args.max_errors,
+        schema=ValidationSchema.load(args.schema) if args.schema else None,
+        unique_memory=args.unique_memory * 1024 * 1024 if args.unique_memory else None,
+        batch_index=BatchIdIndex(args.batch_index) if args.batch_index else None)
+    crawl = None
+    if args.recursive:
+        crawl = {"root": args.root, "max_depth": args.max_depth,
+                 "include": args.pattern, "exclude": args.exclude or []}
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = METRICS.serve(args.metrics_port)
+    exported = threading.Event()
+    if args.metrics_file:
+        METRICS.write_every(args.metrics_file, METRICS_INTERVAL, exported)
+    try:
+        with profiled(args.profile):
+            if args.watch:
+                stop = threading.Event()
+                for signum in (signal.SIGINT, signal.SIGTERM):
+                    signal.signal(signum, lambda *_: stop.set())
+                watch(processor, args.pattern, args.interval, stop, crawl)
+                return 0
+
+            if crawl is not None and not args.files:
+                filenames = processor.discover(reprocess=args.reprocess, **crawl)
+            else:
+                filenames = args.files or processor.resolve(args.pattern)
+                if not args.reprocess:
+                    filenames = processor.pending(filenames)
+            processed = failures = 0
+            for result in processor.run(filenames):
+                processed += 1
+                failures += not result.valid
+                print_result(result)
+            print(f"{processed - failures} valid, {failures} failed")
+            return 1 if failures else 0
+    finally:
+        processor.close()
+        exported.set()
+        if args.metrics_file:
+            METRICS.write(args.metrics_file)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+
+def run_validate(args):
+    """Validates local files with FileValidator.validate_parallel. Returns the exit code."""
+    schema = ValidationSchema.load(args.schema) if args.schema else None
+    failures = 0
+    with ProcessPoolExecutor(args.workers) as executor:
+        for path in args.files:
+            is_valid, msg = FileValidator.validate_parallel(
+                path, chunk_size=int(args.chunk_size * 1024 * 1024), schema=schema,
+                executor=executor)
+            failures += not is_valid
+            print(f"OK    {path}" if is_valid else f"FAIL  {path}: {msg}", flush=True)
+    return 1 if failures else 0
+
+
+@contextmanager
+def profiled(path):
+    """
+    Profiles the enclosed block when path is set: with pyinstrument, as an
+    HTML report, if path ends in .html, otherwise with cProfile, as stats
+    for pstats or snakeviz. Only the calling thread is profiled; time spent
+    in download threads and validation processes shows in the stage timers
+    of METRICS instead.
+    """
+    if not path:
+        yield
+        return
+    if path.endswith(".html"):
+        from pyinstrument import Profiler  # optional, only needed for HTML
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, "w", encoding="utf-8") as report:
+                report.write(profiler.output_html())
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FTP CSV Validator")
+    subparsers = parser.add_subparsers(dest="command")
+    ingest = subparsers.add_parser(
+        "ingest", help="download and validate files without the GUI")
+    ingest.add_argument("files", nargs="*",
+                        help="remote filenames (default: match --pattern)")
+    ingest.add_argument("--host", required=True)
+    ingest.add_argument("--port", type=int, default=0)
+    ingest.add_argument("--user", default="anonymous")
+    ingest.add_argument("--password",
+                        default=os.environ.get("FTP_PASSWORD", ""),
+                        help="defaults to the FTP_PASSWORD environment variable")
+    ingest.add_argument("--pattern", action="append",
+                        help="glob for remote filenames, may be repeated (default: *.csv)")
+    ingest.add_argument("--recursive", action="store_true",
+                        help="walk the directory tree below --root; --pattern then "
+                             "matches paths relative to the current directory")
+    ingest.add_argument("--root", default="",
+                        help="directory to walk with --recursive (default: current)")
+    ingest.add_argument("--max-depth", type=int, default=None,
+                        help="directory levels below --root to walk (default: all)")
+    ingest.add_argument("--exclude", action="append",
+                        help="glob for paths to skip with --recursive, may be repeated")
+    ingest.add_argument("--connections", type=int, default=4,
+                        help="number of concurrent FTP connections")
+    ingest.add_argument("--workers", type=int, default=None,
+                        help="validation processes (default: one per CPU)")
+    ingest.add_argument("--remote-uuids", action="store_true",
+                        help="tag log lines with UUIDs prefetched from the UUID API")
+    ingest.add_argument("--ledger", default=LEDGER_FILE,
+                        help=f"SQLite ledger of processed files (default: {LEDGER_FILE}); "
+                             "pass an empty string to disable")
+    ingest.add_argument("--reprocess", action="store_true",
+                        help="process files even if the ledger already has them")
+    ingest.add_argument("--batch-index", default=BATCH_INDEX_FILE,
+                        help="SQLite index of the batch_ids in every file in "
+                             f"{VALID_DIR}/ (default: {BATCH_INDEX_FILE}), used to reject "
+                             "files repeating a batch already saved; "
+                             "pass an empty string to disable")
+    ingest.add_argument("--schema",
+                        help="JSON or YAML file describing the expected columns "
+                             "(default: the built-in rules)")
+    ingest.add_argument("--report", choices=ERROR_REPORT_FORMATS,
+                        help="check invalid files in full and write every error "
+                             f"to a report in {ERROR_LOG_DIR}/")
+    ingest.add_argument("--max-errors", type=int, default=MAX_REPORTED_ERRORS,
+                        help="errors collected per file with --report "
+                             f"(default: {MAX_REPORTED_ERRORS})")
+    ingest.add_argument("--unique-memory", type=int, metavar="MB",
+                        help="cap the memory used to find duplicate batch_ids "
+                             "per file, spilling to disk beyond it (for very large files)")
+    ingest.add_argument("--metrics-file",
+                        help="write Prometheus metrics to this file every "
+                             f"{METRICS_INTERVAL}s and on exit (e.g. for node_exporter)")
+    ingest.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics at http://localhost:PORT/metrics")
+    ingest.add_argument("--profile", metavar="FILE",
+                        help="profile the run with cProfile, or with pyinstrument "
+                             "if FILE ends in .html")
+    ingest.add_argument("--watch", action="store_true",
+                        help="keep polling the server for new files until stopped")
+    ingest.add_argument("--interval", type=float, default=60,
+                        help="seconds between polls in --watch mode (default: 60)")
+    check = subparsers.add_parser(
+        "validate", help="validate local CSV files, each on several cores")
+    check.add_argument("files", nargs="+")
+    check.add_argument("--workers", type=int, default=None,
+                       help="validation processes (default: one per CPU)")
+    check.add_argument("--chunk-size", type=float, default=PARALLEL_CHUNK_SIZE / (1024 * 1024),
+                       metavar="MB", help="bytes of a file checked per task (default: 64 MB)")
+    check.add_argument("--schema",
+                       help="JSON or YAML validation schema (default: built-in rules)")
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        args.pattern = args.pattern or ["*.csv"]
+        return run_ingest(args)
+    if args.command == "validate":
+        return run_validate(args)
+
+    # Imported here so headless runs never load tkinter.
+    from ftp_csv_gui import run_gui
+    run_gui()
+    return 0
 
 
 if __name__ == "__main__":
-    root = Tk()
-    app = App(root)
-    root.mainloop()
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import re
+import ftplib
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+
+from ftp_csv import (FTP_TIMEOUT, METRICS, RemoteEntry, StreamValidator,
+                     ValidationAborted, is_connection_error, parse_mlsd_time)
+
+ASYNC_CONNECTIONS = 16  # concurrent control connections per AsyncFTPClient
+ASYNC_CHUNK_SIZE = 64 * 1024  # bytes read from a data connection at a time
+EPSV_REPLY = re.compile(r"\(([!-~])\1\1(\d+)\1\)")
+PASV_REPLY = re.compile(r"(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)")
+
+
+class AsyncFTPConnection:
+    """
+    One logged-in FTP control connection driven by asyncio streams, in
+    binary mode with passive data connections. Replies are checked like
+    ftplib does: 4xx raises ftplib.error_temp and 5xx ftplib.error_perm,
+    so the same error handling works for both clients.
+    """
+
+    def __init__(self, reader, writer, timeout=FTP_TIMEOUT):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.host = writer.get_extra_info("peername")[0]
+
+    @classmethod
+    async def open(cls, host, user, password, port=0, timeout=FTP_TIMEOUT):
+        """Connects, logs in and switches to binary mode."""
+        with METRICS.timer("connect"):
+            try:
+                async with asyncio.timeout(timeout):
+                    reader, writer = await asyncio.open_connection(host, port or ftplib.FTP_PORT)
+            except OSError:
+                METRICS.inc("connection_failures")
+                raise
+            conn = cls(reader, writer, timeout)
+            try:
+                await conn.reply()
+                if (await conn.command(f"USER {user}")).startswith("3"):
+                    await conn.command(f"PASS {password}")
+                await conn.command("TYPE I")
+            except BaseException:
+                METRICS.inc("connection_failures")
+                conn.close()
+                raise
+        METRICS.inc("connections_opened")
+        return conn
+
+    async def command(self, line):
+        """Sends a command and returns its reply, raising on errors."""
+        self.writer.write(f"{line}\r\n".encode("utf-8"))
+        return await self.reply()
+
+    async def reply(self):
+        """Reads one (possibly multi-line) reply, raising on errors."""
+        lines = [await self._readline()]
+        if lines[0][3:4] == "-":
+            code = lines[0][:3]
+            while not (lines[-1][:3] == code and lines[-1][3:4] != "-"):
+                lines.append(await self._readline())
+        response = "\n".join(lines)
+        if response[:1] == "4":
+            raise ftplib.error_temp(response)
+        if response[:1] == "5":
+            raise ftplib.error_perm(response)
+        if response[:1] not in "123":
+            raise ftplib.error_proto(response)
+        return response
+
+    async def transfer(self, command, rest=None, chunk_size=ASYNC_CHUNK_SIZE):
+        """
+        Runs a command that sends data, such as RETR or MLSD, and yields
+        the received chunks. Closing the iterator early abandons the
+        transfer and reads the server's reply, so the connection can be
+        used again.
+        """
+        reader, writer = await self._open_data()
+        started = finished = False
+        try:
+            if rest:
+                await self.command(f"REST {rest}")
+            response = await self.command(command)
+            if response[:1] == "2":
+                # Like ftplib, tolerate servers that send 200 before the 1xx.
+                response = await self.reply()
+            if response[:1] != "1":
+                raise ftplib.error_reply(response)
+            started = True
+            while True:
+                async with asyncio.timeout(self.timeout):
+                    chunk = await reader.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            finished = True
+        finally:
+            writer.close()
+            if finished:
+                await self.reply()
+            elif started:
+                # Aborted: the server answers 426, or 226 if it had
+                # already sent everything.
+                try:
+                    await self.reply()
+                except ftplib.all_errors:
+                    pass
+
+    async def retrieve(self, filename, rest=None, chunk_size=ASYNC_CHUNK_SIZE):
+        """Yields the content of a file chunk by chunk."""
+        async with aclosing(self.transfer(f"RETR {filename}", rest, chunk_size)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    async def list_directory(self, path=""):
+        """
+        Lists a remote directory. Uses MLSD where the server supports it,
+        otherwise NLST (names only). Returns a list of RemoteEntry.
+        """
+        with METRICS.timer("list"):
+            try:
+                lines = await self._lines(f"MLSD {path}".rstrip())
+            except ftplib.error_perm:
+                names = await self._lines(f"NLST {path}".rstrip())
+                return [RemoteEntry(name.rsplit("/", 1)[-1], None, None, None)
+                        for name in names if name]
+        entries = []
+        for line in lines:
+            facts, _, name = line.partition(" ")
+            facts = dict(fact.split("=", 1) for fact in facts.split(";") if "=" in fact)
+            entry_type = facts.get("type", "").lower()
+            if entry_type in ("cdir", "pdir"):
+                continue
+            size = facts.get("size")
+            entries.append(RemoteEntry(
+                name, int(size) if size is not None else None,
+                parse_mlsd_time(facts.get("modify")),
+                entry_type if entry_type in ("file", "dir") else "other"))
+        return entries
+
+    async def size(self, filename):
+        """Returns the size of a file in bytes."""
+        with METRICS.timer("size"):
+            return int((await self.command(f"SIZE {filename}"))[3:].strip())
+
+    async def quit(self):
+        try:
+            await self.command("QUIT")
+        finally:
+            self.close()
+
+    def close(self):
+        self.writer.close()
+
+    async def _readline(self):
+        async with asyncio.timeout(self.timeout):
+            line = await self.reader.readline()
+        if not line:
+            raise EOFError("Connection closed by the server")
+        return line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+    async def _open_data(self):
+        # Opens a passive data connection, with EPSV or else PASV. Like
+        # ftplib, the address in a PASV reply is ignored in favour of the
+        # control connection's peer.
+        try:
+            match = EPSV_REPLY.search(await self.command("EPSV"))
+        except ftplib.error_perm:
+            match = None
+        if match is not None:
+            port = int(match.group(2))
+        else:
+            numbers = PASV_REPLY.search(await self.command("PASV"))
+            if numbers is None:
+                raise ftplib.error_proto("Cannot parse the PASV reply")
+            port = int(numbers.group(5)) << 8 | int(numbers.group(6))
+        async with asyncio.timeout(self.timeout):
+            return await asyncio.open_connection(self.host, port)
+
+    async def _lines(self, command):
+        data = bytearray()
+        async with aclosing(self.transfer(command)) as chunks:
+            async for chunk in chunks:
+                data += chunk
+        return data.decode("utf-8", errors="replace").splitlines()
+
+
+class AsyncFTPClient:
+    """
+    asyncio counterpart of FTPClient for many concurrent transfers in one
+    thread. Operations borrow one of up to `connections` control
+    connections, opened on demand and kept for reuse, so a bounded number
+    of transfers run at once however many coroutines are waiting. Chunks
+    can be consumed as they arrive with iter_file, e.g. to feed a
+    StreamValidator, or whole files fetched with download_file.
+    """
+
+    def __init__(self, connections=ASYNC_CONNECTIONS, on_error=None):
+        self.connections = connections
+        self.on_error = on_error
+        self.entries = {}
+        self._credentials = None
+        self._idle = []
+        self._semaphore = asyncio.BoundedSemaphore(connections)
+
+    async def connect(self, host, user, password, port=0, timeout=FTP_TIMEOUT):
+        """
+        Connects to the FTP server using provided credentials.
+        Returns a tuple (status, message).
+        """
+        try:
+            conn = await AsyncFTPConnection.open(host, user, password, port, timeout)
+        except ftplib.all_errors as e:
+            return False, f"Failed to connect: {e}"
+        await self.disconnect()
+        self._credentials = (host, user, password, port, timeout)
+        self._idle.append(conn)
+        return True, "Connected to FTP server"
+
+    async def disconnect(self):
+        """
+        Closes every idle connection; connections in use are closed when
+        their operation ends. Returns a tuple (status, message).
+        """
+        self._credentials = None
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                await conn.quit()
+            except ftplib.all_errors:
+                pass
+        return False, "Disconnected from FTP server"
+
+    def is_connected(self):
+        """
+        Returns True if the client is currently connected to the FTP server.
+        """
+        return self._credentials is not None
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Lends a logged-in AsyncFTPConnection for the duration of the block,
+        waiting while `connections` of them are in use. A connection that
+        fails with a connection error is closed instead of reused.
+        """
+        if not self.is_connected():
+            raise ConnectionError("FTP client is not connected.")
+        async with self._semaphore:
+            conn = self._idle.pop() if self._idle else await AsyncFTPConnection.open(
+                *self._credentials)
+            try:
+                yield conn
+            except BaseException as e:
+                # After a cancelled command or a garbled reply the connection
+                # may be out of step with the server.
+                if is_connection_error(e) or isinstance(
+                        e, (asyncio.CancelledError, ftplib.error_reply, ftplib.error_proto)):
+                    conn.close()
+                    conn = None
+                raise
+            finally:
+                if conn is not None:
+                    if self.is_connected():
+                        self._idle.append(conn)
+                    else:
+                        conn.close()
+
+    async def get_file_list(self):
+        """
+        Returns a list of all files in the current directory of the FTP server.
+        Returns an empty list if not connected or on error.
+        """
+        if not self.is_connected():
+            return []
+        try:
+            async with self.connection() as conn:
+                entries = await conn.list_directory()
+        except ftplib.all_errors:
+            return []
+        self.entries = {entry.name: entry for entry in entries}
+        return [entry.name for entry in entries if entry.type != "dir"]
+
+    async def get_size(self, filename):
+        """
+        Returns the size in bytes of the specified file on the FTP server,
+        from the last listing when it is known there.
+        """
+        entry = self.entries.get(filename)
+        if entry is not None and entry.size is not None:
+            return entry.size
+        async with self.connection() as conn:
+            return await conn.size(filename)
+
+    async def iter_file(self, filename, rest=None, chunk_size=ASYNC_CHUNK_SIZE):
+        """
+        Asynchronously yields the content of the specified file in chunks
+        of bytes as they are received, starting at byte offset rest. The
+        connection is held until the iterator is exhausted or closed; use
+        contextlib.aclosing to release it at once when stopping early.
+        """
+        received = 0
+        try:
+            async with self.connection() as conn:
+                with METRICS.timer("retr"):
+                    async with aclosing(conn.retrieve(filename, rest, chunk_size)) as chunks:
+                        async for chunk in chunks:
+                            received += len(chunk)
+                            yield chunk
+        finally:
+            METRICS.inc("bytes_received", received)
+
+    async def download_file(self, filename):
+        """
+        Downloads the specified file from the FTP server and returns its content as a string.
+        Reports an error through on_error and returns "" if the download fails.
+        """
+        content = []
+        try:
+            async with aclosing(self.iter_file(filename)) as chunks:
+                async for chunk in chunks:
+                    content.append(chunk)
+        except ftplib.all_errors as e:
+            self._report_error('Download Error', f"Failed to download file: {e}")
+            return ""
+        return b"".join(content).decode("utf-8", errors="replace")
+
+    async def stream_validate(self, filename, schema=None):
+        """
+        Validates the specified file while it is being downloaded, without
+        keeping its content in memory. The transfer is abandoned on the
+        first invalid row. Returns a tuple (status, message).
+        """
+        validator = StreamValidator(schema=schema)
+        try:
+            async with aclosing(self.iter_file(filename)) as chunks:
+                async for chunk in chunks:
+                    validator.feed(chunk)
+        except ValidationAborted:
+            pass
+        except ftplib.all_errors as e:
+            return False, f"Download error: {e}"
+        return validator.close()
+
+    async def validate_files(self, filenames, schema=None):
+        """
+        Validates many files concurrently with stream_validate, at most
+        `connections` at a time. Returns a dict of filename -> (status, message).
+        """
+        results = await asyncio.gather(
+            *(self.stream_validate(name, schema) for name in filenames))
+        return dict(zip(filenames, results))
+
+    def _report_error(self, title, message):
+        if self.on_error is not None:
+            self.on_error(title, message)
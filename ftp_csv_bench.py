@@ -0,0 +1,490 @@
+import os
+import re
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import posixpath
+import platform
+import tempfile
+import threading
+import subprocess
+import socketserver
+from datetime import datetime
+
+from ftp_csv import EXPECTED_HEADERS, FTPClient, FileValidator
+
+BENCH_OUTPUT = "bench_results.json"
+BENCH_FILENAME = "bench.csv"
+ERROR_KINDS = ("decimal_format", "value_exceeds", "non_numeric",
+               "missing_columns", "duplicate_batch_id")
+ROW_NUMBER = re.compile(r"\b[Rr]ow (\d+)")
+DATA_CHUNK = 64 * 1024  # bytes per send on the data connection
+DATA_TIMEOUT = 10  # seconds the server waits for the client's data connection
+
+
+def generate_csv(rows, error_rate=0.0, error_position=0.0, error_kinds=ERROR_KINDS,
+                 seed=0, line_ending="\n"):
+    """
+    Returns the bytes of a synthetic CSV file shaped like EXPECTED_HEADERS
+    with the given number of data rows. A fraction error_rate of the rows
+    is made invalid, picked at random from the rows after error_position
+    (a fraction of the file, 0.0 for anywhere, 0.9 for the last tenth),
+    with each error drawn from error_kinds. The same seed always produces
+    the same file.
+    """
+    rnd = random.Random(seed)
+    readings = [f"{value / 1000:.3f}" for value in range(0, 9900, 7)]
+    first = min(rows, int(rows * error_position))
+    bad_rows = set(rnd.sample(range(first, rows), round((rows - first) * error_rate)))
+    lines = [",".join(EXPECTED_HEADERS)]
+    for i in range(rows):
+        cells = [str(i + 1), f"2023-01-01T{i // 3600 % 24:02}:{i // 60 % 60:02}:{i % 60:02}"]
+        cells += rnd.choices(readings, k=len(EXPECTED_HEADERS) - 2)
+        if i in bad_rows:
+            kind = rnd.choice(error_kinds)
+            column = rnd.randrange(2, len(EXPECTED_HEADERS))
+            if kind == "decimal_format":
+                cells[column] = "1.2345"
+            elif kind == "value_exceeds":
+                cells[column] = "10.5"
+            elif kind == "non_numeric":
+                cells[column] = "n/a"
+            elif kind == "missing_columns":
+                cells = cells[:column]
+            elif kind == "duplicate_batch_id" and i > 0:
+                cells[0] = str(rnd.randrange(1, i + 1))
+        lines.append(",".join(cells))
+    return (line_ending.join(lines) + line_ending).encode("utf-8")
+
+
+class _FTPHandler(socketserver.StreamRequestHandler):
+    # One control connection. Implements the subset of RFC 959 and RFC 3659
+    # used by ftplib and FTPClient, in passive mode only.
+
+    # Replies are small writes; without TCP_NODELAY each one can wait on
+    # the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.user = None
+        self.logged_in = False
+        self.rest = 0
+        self.passive = None
+
+    def handle(self):
+        self.reply("220 Local FTP server ready")
+        try:
+            for line in self.rfile:
+                command, _, arg = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+                command = command.upper()
+                handler = getattr(self, f"ftp_{command}", None)
+                if handler is None:
+                    self.reply(f"502 {command} not implemented")
+                elif not self.logged_in and command not in ("USER", "PASS", "QUIT"):
+                    self.reply("530 Please log in with USER and PASS")
+                elif handler(arg) is False:
+                    break
+        except OSError:
+            pass  # client went away
+        finally:
+            self._close_passive()
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("utf-8"))
+
+    def ftp_USER(self, arg):
+        self.user = arg
+        self.reply("331 Password required")
+
+    def ftp_PASS(self, arg):
+        owner = self.server.owner
+        self.logged_in = (self.user, arg) == (owner.user, owner.password)
+        self.reply("230 Logged in" if self.logged_in else "530 Login incorrect")
+
+    def ftp_QUIT(self, arg):
+        self.reply("221 Goodbye")
+        return False
+
+    def ftp_SYST(self, arg):
+        self.reply("215 UNIX Type: L8")
+
+    def ftp_FEAT(self, arg):
+        self.reply("211-Features:\r\n MDTM\r\n MLST type*;size*;modify*;\r\n"
+                   " REST STREAM\r\n SIZE\r\n211 End")
+
+    def ftp_OPTS(self, arg):
+        self.reply("200 OK")
+
+    def ftp_TYPE(self, arg):
+        self.reply("200 Type set")
+
+    def ftp_NOOP(self, arg):
+        self.reply("200 NOOP ok")
+
+    def ftp_PWD(self, arg):
+        self.reply('257 "/" is the current directory')
+
+    def ftp_CWD(self, arg):
+        self.reply("250 Directory changed")
+
+    def ftp_ABOR(self, arg):
+        self.reply("225 No transfer to abort")
+
+    def ftp_PASV(self, arg):
+        host, port = self._open_passive()
+        self.reply(f"227 Entering Passive Mode "
+                   f"({host.replace('.', ',')},{port >> 8},{port & 255})")
+
+    def ftp_EPSV(self, arg):
+        _, port = self._open_passive()
+        self.reply(f"229 Entering Extended Passive Mode (|||{port}|)")
+
+    def ftp_SIZE(self, arg):
+        data = self._file(arg)
+        if data is not None:
+            self.reply(f"213 {len(data)}")
+
+    def ftp_MDTM(self, arg):
+        if self._file(arg) is not None:
+            self.reply(f"213 {self._timestamp(arg.strip('/'))}")
+
+    def ftp_REST(self, arg):
+        if not arg.isdigit():
+            self.reply("501 Invalid restart offset")
+            return
+        self.rest = int(arg)
+        self.reply(f"350 Restarting at {self.rest}")
+
+    def ftp_RETR(self, arg):
+        data = self._file(arg)
+        offset, self.rest = self.rest, 0
+        if data is not None:
+            self._send(memoryview(data)[offset:])
+
+    def ftp_MLSD(self, arg):
+        entries = self._directory(arg)
+        if entries is not None:
+            lines = []
+            for name, data in entries.items():
+                timestamp = self._timestamp(posixpath.join(arg.strip("/"), name))
+                lines.append(f"type=dir;modify={timestamp}; {name}\r\n" if data is None else
+                             f"type=file;size={len(data)};modify={timestamp}; {name}\r\n")
+            self._send("".join(lines).encode("utf-8"))
+
+    def ftp_NLST(self, arg):
+        entries = self._directory(arg)
+        if entries is not None:
+            self._send("".join(f"{name}\r\n" for name in entries).encode("utf-8"))
+
+    def _directory(self, path):
+        # Entries directly in a directory, as name -> bytes, or None for
+        # subdirectories.
+        prefix = path.strip("/")
+        prefix += "/" if prefix else ""
+        entries = {}
+        for name, data in list(self.server.owner.files.items()):
+            if name.startswith(prefix):
+                child, _, rest = name[len(prefix):].partition("/")
+                entries[child] = None if rest else data
+        if prefix and not entries:
+            self.reply(f"550 {path}: No such directory")
+            return None
+        return entries
+
+    def _file(self, name):
+        data = self.server.owner.files.get(name.lstrip("/"))
+        if data is None:
+            self.reply(f"550 {name}: No such file")
+        return data
+
+    def _timestamp(self, path):
+        owner = self.server.owner
+        return time.strftime("%Y%m%d%H%M%S", time.gmtime(owner.mtimes.get(path, owner.mtime)))
+
+    def _open_passive(self):
+        self._close_passive()
+        host = self.server.server_address[0]
+        self.passive = socket.create_server((host, 0))
+        self.passive.settimeout(DATA_TIMEOUT)
+        return host, self.passive.getsockname()[1]
+
+    def _close_passive(self):
+        if self.passive is not None:
+            self.passive.close()
+            self.passive = None
+
+    def _send(self, data):
+        if self.passive is None:
+            self.reply("425 Use PASV or EPSV first")
+            return
+        listener, self.passive = self.passive, None
+        self.reply("150 Opening BINARY mode data connection")
+        try:
+            with listener:
+                conn, _ = listener.accept()
+            with conn:
+                for i in range(0, len(data), DATA_CHUNK):
+                    conn.sendall(data[i:i + DATA_CHUNK])
+        except OSError:
+            # The client closed the data connection early, e.g. after
+            # finding the file invalid.
+            self.reply("426 Connection closed; transfer aborted")
+            return
+        self.reply("226 Transfer complete")
+
+
+class _ThreadingFTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalFTPServer:
+    """
+    Minimal FTP server that runs in a background thread and serves the
+    files in a dict of name -> bytes, so benchmarks and tests can exercise
+    FTPClient over real sockets without an external server. Names with
+    slashes ("site/2024/01/a.csv") put files in subdirectories. Supports
+    login, PASV/EPSV, SIZE, MDTM, MLSD, NLST and RETR with REST. `files`
+    can be changed while the server runs. Every entry is reported as
+    modified at `mtime`, unless `mtimes` has another time for its path.
+    """
+
+    def __init__(self, files=None, user="user", password="password",
+                 host="127.0.0.1", port=0):
+        self.files = files if files is not None else {}
+        self.user = user
+        self.password = password
+        self.mtime = time.time()
+        self.mtimes = {}  # modification times by file or directory path
+        self._server = _ThreadingFTPServer((host, port), _FTPHandler)
+        self._server.owner = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def percentile(values, fraction):
+    """Returns the fraction-th percentile of values, interpolating between ranks."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in bytes, or None."""
+    try:
+        import resource
+    except ImportError:
+        return None  # not available on Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(name, operation, rows, size, repeat, processed=None):
+    """
+    Runs operation() repeat times and returns a dict of throughput and
+    latency figures. Throughput uses the median run. processed, if given,
+    maps the outcome to the (rows, bytes) the operation actually got
+    through, for operations that may stop early. peak_rss_bytes is the
+    peak of the whole process so far, so cases are best run from the
+    cheapest to the most memory-hungry.
+    """
+    outcome = None
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outcome = operation()
+        latencies.append(time.perf_counter() - start)
+    if processed is not None:
+        rows, size = processed(outcome)
+    median = percentile(latencies, 0.5)
+    return {
+        "name": name,
+        "rows": rows,
+        "bytes": size,
+        "repeat": repeat,
+        "rows_per_s": rows / median,
+        "mb_per_s": size / median / 1e6,
+        "latency_ms": {f"p{p}": percentile(latencies, p / 100) * 1000
+                       for p in (50, 90, 99)},
+        "min_ms": min(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "peak_rss_bytes": peak_rss(),
+        "outcome": outcome,
+    }
+
+
+def git_commit():
+    """Returns the commit of the working tree, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(rows=100000, repeat=5, error_rate=0.0, error_position=0.0, seed=0):
+    """
+    Generates a synthetic file and times validating it in memory and on
+    disk, and downloading it from a LocalFTPServer, both in full with
+    FTPClient.download_file and streamed with save_valid_file. Returns a
+    JSON-serializable dict of results with the parameters and environment.
+    Validation stops at the first invalid row, so the throughput of the
+    validating cases counts the rows and bytes up to that row only.
+    """
+    data = generate_csv(rows, error_rate, error_position, seed=seed)
+    text = data.decode("utf-8")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, BENCH_FILENAME)
+        with open(path, "wb") as file:
+            file.write(data)
+        saved_dir = os.path.join(workdir, "valid")
+        os.makedirs(saved_dir)
+
+        def validated(outcome):
+            # Rows and bytes up to and including the row the validation
+            # stopped at; a headers problem stops it at row 1.
+            is_valid, message = outcome
+            if is_valid:
+                return rows, len(data)
+            match = ROW_NUMBER.search(message)
+            row_num = int(match.group(1)) if match else 1
+            end = -1
+            for _ in range(row_num):
+                end = data.find(b"\n", end + 1)
+                if end == -1:
+                    return rows, len(data)
+            return row_num - 1, end + 1
+
+        def save_valid_file():
+            is_valid, message, saved = client.save_valid_file(BENCH_FILENAME, saved_dir)
+            if saved is not None:
+                os.remove(os.path.join(saved_dir, saved))
+            return [is_valid, message]
+
+        with LocalFTPServer({BENCH_FILENAME: data}) as server:
+            client = FTPClient()
+            is_connected, message = client.connect(
+                server.host, server.user, server.password, server.port)
+            if not is_connected:
+                raise ConnectionError(message)
+            try:
+                cases = [
+                    ("validate_file", lambda: list(FileValidator.validate_file(path)),
+                     validated),
+                    ("validate_file_columnar",
+                     lambda: list(FileValidator.validate_file(path, columnar=True)),
+                     validated),
+                    ("save_valid_file", save_valid_file, validated),
+                    ("validate", lambda: list(FileValidator.validate(text)), validated),
+                    ("download_file", lambda: len(client.download_file(BENCH_FILENAME)),
+                     None),
+                ]
+                for name, operation, processed in cases:
+                    results.append(measure(name, operation, rows, len(data), repeat,
+                                           processed))
+            finally:
+                client.disconnect()
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"rows": rows, "repeat": repeat, "error_rate": error_rate,
+                       "error_position": error_position, "seed": seed},
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """
+    Returns (name, baseline rows/s, current rows/s, change in percent) for
+    every case present in both benchmark results.
+    """
+    before = {result["name"]: result["rows_per_s"] for result in baseline["results"]}
+    return [(result["name"], before[result["name"]], result["rows_per_s"],
+             (result["rows_per_s"] / before[result["name"]] - 1) * 100)
+            for result in current["results"] if result["name"] in before]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark CSV validation and FTP transfers on synthetic data")
+    parser.add_argument("--rows", type=int, default=100000,
+                        help="data rows in the generated file (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="timed runs per case (default: 5)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of rows made invalid (default: 0)")
+    parser.add_argument("--error-position", type=float, default=0.0,
+                        help="fraction of the file before the first invalid row (default: 0)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed of the generated file (default: 0)")
+    parser.add_argument("--output", default=BENCH_OUTPUT,
+                        help=f"JSON file the results are written to (default: {BENCH_OUTPUT})")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="earlier results file to compare throughput against")
+    parser.add_argument("--max-regression", type=float, metavar="PERCENT",
+                        help="with --compare, exit with status 1 if any case got "
+                             "slower by more than this")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.rows, args.repeat, args.error_rate,
+                            args.error_position, args.seed)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    for result in report["results"]:
+        print(f"{result['name']:<24} {result['rows_per_s']:>12,.0f} rows/s "
+              f"{result['mb_per_s']:>8.1f} MB/s  p50 {result['latency_ms']['p50']:.1f} ms  "
+              f"p99 {result['latency_ms']['p99']:.1f} ms")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("parameters") != report["parameters"]:
+            print("Note: the baseline was run with different parameters")
+        regressed = False
+        for name, before, after, change in compare(baseline, report):
+            print(f"{name:<24} {before:>12,.0f} -> {after:>12,.0f} rows/s ({change:+.1f}%)")
+            if args.max_regression is not None and change < -args.max_regression:
+                regressed = True
+        if regressed:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
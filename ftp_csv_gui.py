@@ -0,0 +1,355 @@
+import time
+import queue
+from tkinter import Button, Entry, END, Frame, messagebox, Listbox, Label, StringVar, Scrollbar, Tk
+
+from ftp_csv import LOG_BUFFER_SIZE, BatchIdIndex, FTPClient, Logger, ProcessedLedger, TransferWorker
+
+
+class App:
+    def __init__(self, root):
+        self.root = root
+        self.files = None
+        self.file_listbox = None
+        self.valid_files_listbox = None
+        self.error_logs_listbox = None
+        self.search_var = StringVar()
+        self.ftp_client = FTPClient(on_error=messagebox.showerror)
+        self.logger = Logger()
+        self.log_count = 0
+        self.transfer = None
+        self.transfer_pool = None
+        self.transfer_version = (None, None)
+        self.transfer_started = None
+        self.ledger = ProcessedLedger()
+        # batch_ids of the files in valid_files/, checked before saving another
+        self.batch_index = BatchIdIndex()
+        self.build_gui()
+
+    def ftp_client_connect(self):
+        try:
+            status, message = self.ftp_client.connect(
+                self.host_var.get(), self.user_var.get(), self.pass_var.get())
+
+            if status is True:
+                # Change entry state to disabled
+                self.host_entry.config(state='disabled')
+                self.user_entry.config(state='disabled')
+                self.pass_entry.config(state='disabled')
+
+                # Connection Button
+                self.ftp_connect_btn.config(
+                    text="Disconnect", bg='red', command=self.ftp_client_disconnect)
+                messagebox.showinfo("Success", "Connected to FTP Server")
+
+                self.list_files()
+            else:
+                messagebox.showerror("Error", message)
+        except Exception as e:
+            messagebox.showerror("Error", f"FTP connection failed: {e}")
+
+    def ftp_client_disconnect(self):
+        try:
+            if self.transfer is not None:
+                self.transfer.cancel()
+            if self.transfer_pool is not None:
+                self.transfer_pool.close()
+                self.transfer_pool = None
+            self.ftp_client.disconnect()
+            # Change state to normal to type again
+            self.host_entry.config(state='normal')
+            self.user_entry.config(state='normal')
+            self.pass_entry.config(state='normal')
+            # Clear entry values
+            self.host_var.set("")
+            self.user_var.set("")
+            self.pass_var.set("")
+
+            self.search_var.set('')
+
+            # Connection Button
+            self.ftp_connect_btn.config(
+                text="Connect to FTP", command=self.ftp_client_connect, bg='teal')
+            messagebox.showinfo(
+                "Disconnected", "Disconnected from FTP Server")
+
+            self.remove_files()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to disconnect: {e}")
+
+    def list_files(self):
+        try:
+            self.files = self.ftp_client.get_file_list()
+            self.file_listbox.delete(0, END)
+            for file in self.files:
+                self.file_listbox.insert(END, file)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to list files: {e}")
+
+    def remove_files(self):
+        self.files = None
+        self.file_listbox.delete(0, END)
+
+    def download_file(self):
+        if not self.ftp_client.is_connected():
+            messagebox.showerror("Error", "Not connected to FTP")
+            return
+
+        selected_file = self.file_listbox.curselection()
+        if not selected_file:
+            messagebox.showerror("Error", "No file selected")
+            return
+
+        filename = self.file_listbox.get(selected_file)
+        version = self.ftp_client.file_version(filename)
+        if self.ledger.seen(filename, *version):
+            messagebox.showwarning(
+                "Warning", f"File '{filename}' already downloaded or attempted.")
+            return
+
+        if not filename.lower().endswith('.csv'):
+            self.download_status.config(text="Fail", foreground="red")
+            error_msg = f"Invalid file extension for '{filename}'. Only '.csv' files are allowed."
+            self.logger.log(error_msg)
+            self.load_error_logs()
+            messagebox.showerror("Invalid File", error_msg)
+            self.ledger.record(filename, *version, "rejected", error_msg)
+            self.download_status.config(text="Idle", foreground="black")
+            return
+
+        if self.transfer_pool is None:
+            self.transfer_pool = self.ftp_client.open_pool(
+                size=1, keepalive=60)
+        self.download_status.config(text="Downloading...", foreground="blue")
+        self.download_btn.config(state="disabled", bg="white")
+        self.cancel_btn.config(state="normal")
+        self.transfer = TransferWorker(
+            self.transfer_pool, filename, self.logger,
+            size=self.ftp_client.cached_size(filename), batch_index=self.batch_index)
+        self.transfer_version = version
+        self.transfer_started = time.monotonic()
+        self.transfer.start()
+        self.root.after(100, self.poll_transfer)
+
+    def poll_transfer(self):
+        """Applies queued progress events from the transfer worker to the GUI."""
+        transfer = self.transfer
+        if transfer is None:
+            return
+        try:
+            while True:
+                event = transfer.events.get_nowait()
+                if event[0] == "progress":
+                    _, received, total, rate = event
+                    self.download_status.config(
+                        text=f"Downloading... {received * 100 // total}% "
+                             f"({received / 1048576:.1f} of {total / 1048576:.1f} MB, "
+                             f"{rate / 1048576:.1f} MB/s)",
+                        foreground="blue")
+                else:
+                    self.finish_transfer(event[1])
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self.poll_transfer)
+
+    def finish_transfer(self, outcome):
+        filename = self.transfer.filename
+        self.transfer = None
+        if outcome.status != "cancelled":
+            # "error" is not a final outcome, so the file can be tried again.
+            self.ledger.record(
+                filename, *self.transfer_version,
+                {"success": "valid", "fail": "invalid"}.get(outcome.status, "error"),
+                outcome.message, time.monotonic() - self.transfer_started,
+                outcome.saved_as)
+        self.cancel_btn.config(state="disabled")
+        if outcome.status == "success":
+            self.download_status.config(text="Success", foreground="green")
+            self.valid_files_listbox.insert(END, outcome.saved_as)
+            self.valid_files_listbox.see(END)
+            self.valid_files_listbox.selection_clear(0, END)
+            self.valid_files_listbox.selection_set(END)
+        elif outcome.status == "cancelled":
+            self.download_status.config(text="Cancelled", foreground="black")
+        else:
+            self.download_status.config(text="Fail", foreground="red")
+            self.load_error_logs()
+        dialogs = {"info": messagebox.showinfo, "warning": messagebox.showwarning,
+                   "error": messagebox.showerror}
+        if outcome.dialog in dialogs:
+            dialogs[outcome.dialog](outcome.title, outcome.message)
+        self.download_status.config(text="Idle", foreground="black")
+        self.download_btn.config(state="normal", bg="teal")
+
+    def cancel_download(self):
+        if self.transfer is not None:
+            self.transfer.cancel()
+            self.download_status.config(text="Cancelling...", foreground="black")
+
+    def load_error_logs(self):
+        """Append log lines recorded since the last refresh to the error_logs_listbox."""
+        try:
+            lines, self.log_count = self.logger.buffer.since(self.log_count)
+            for line in lines:
+                self.error_logs_listbox.insert(END, line)
+            excess = self.error_logs_listbox.size() - LOG_BUFFER_SIZE
+            if excess > 0:
+                self.error_logs_listbox.delete(0, excess - 1)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load error logs: {e}")
+
+    def searchFileName(self):
+        if not self.ftp_client.is_connected():
+            messagebox.showerror("Error", "Not connected to FTP")
+            return
+        search_value = self.search_var.get().strip()
+        if not search_value:
+            messagebox.showerror("Error", "Please enter search keyword")
+            return
+        try:
+            # Wildcards switch to glob matching, e.g. "*2024*.csv"
+            mode = "glob" if any(c in search_value for c in "*?[") else "substring"
+            found_files = self.ftp_client.search_files(search_value, mode)
+            self.file_listbox.delete(0, END)
+            for file in found_files:
+                self.file_listbox.insert(END, file)
+        except Exception as e:
+            messagebox.showerror("Error", f"Search failed: {e}")
+
+    def clearSearch(self):
+        self.search_var.set('')
+        self.list_files()
+
+    def build_gui(self):
+        self.root.title("FTP CSV Validator")
+        self.root.geometry("800x600")
+
+        main_frame = Frame(self.root)
+        main_frame.pack(padx=10, pady=10, fill="both", expand=True)
+
+        # Connection Frame
+        navbar_header = Frame(main_frame)
+        navbar_header.pack(fill="x")
+
+        # Header
+        Label(navbar_header, text="FTP Connection",
+              font=("Arial", 12, "bold")).pack(side="left")
+        navbar_frame = Frame(main_frame)
+        navbar_frame.pack(fill="x", pady=15)
+
+        # Hostname Entry
+        Label(navbar_frame, text="Hostname").pack(side="left")
+        self.host_var = StringVar()
+        self.host_entry = Entry(navbar_frame, textvariable=self.host_var)
+        self.host_entry.pack(side="left", padx=10)
+
+        # Username Entry
+        Label(navbar_frame, text="Username").pack(side="left")
+        self.user_var = StringVar()
+        self.user_entry = Entry(navbar_frame, textvariable=self.user_var)
+        self.user_entry.pack(side="left", padx=10)
+
+        # Password Entry
+        Label(navbar_frame, text="Password").pack(side="left")
+        self.pass_var = StringVar()
+        self.pass_entry = Entry(
+            navbar_frame, textvariable=self.pass_var, show='*')
+        self.pass_entry.pack(side="left", padx=10)
+
+        # FTP Server Connection Button
+        self.ftp_connect_btn = Button(
+            navbar_frame,
+            text="Connect to FTP",
+            command=self.ftp_client_connect,
+            width=20,
+            background='teal',
+            foreground='white',
+            activeforeground='teal'
+        )
+        self.ftp_connect_btn.pack(side="right")
+
+        # File List Header Frame
+        file_header_frame = Frame(main_frame)
+        file_header_frame.pack(fill="both", expand=True, pady=10)
+        Label(file_header_frame, text="Available Files",
+              font=("Arial", 12, "bold")).pack(side="left")
+        # Search Entry and Buttons
+        Button(file_header_frame, command=self.clearSearch, text="Clear Search", width=10, pady=0, foreground='teal',
+               ).pack(side="right")
+        Button(file_header_frame, command=self.searchFileName, text="Search", width=10, pady=0, foreground='teal'
+               ).pack(side="right", padx=3)
+        self.search_entry = Entry(file_header_frame, textvariable=self.search_var,
+                                  width=30)
+        self.search_entry.pack(side="right")
+
+        # Bind the <Return> key to the search function
+        self.search_entry.bind("<Return>", lambda event: self.searchFileName())
+
+        # File Lists
+        file_frame = Frame(main_frame)
+        file_frame.pack(fill="both", expand=True, pady=5)
+        self.file_listbox = Listbox(file_frame, width=60, height=10)
+        self.file_listbox.pack(side="left", fill="both", expand=True)
+
+        scrollbar = Scrollbar(file_frame)
+        scrollbar.pack(side="right", fill="y")
+        self.file_listbox.config(yscrollcommand=scrollbar.set)
+        scrollbar.config(command=self.file_listbox.yview)
+
+        # File Lists Footer
+        file_footer_frame = Frame(main_frame)
+        file_footer_frame.pack(fill="x", expand=True)
+
+        # Download Status
+        Label(file_footer_frame, text="Download Status:", font=("Arial", 10)).pack(
+            side="left")
+        self.download_status = Label(
+            file_footer_frame, text="Idle", foreground="black")
+        self.download_status.pack(side="left")
+
+        # Download Button
+        self.download_btn = Button(file_footer_frame, command=self.download_file, text="Download File", width=20, pady=3, foreground='white', background='teal',
+                                   )
+        self.download_btn.pack(side="right")
+
+        # Cancel Button
+        self.cancel_btn = Button(file_footer_frame, command=self.cancel_download, text="Cancel", width=10, pady=3,
+                                 foreground='teal', state="disabled")
+        self.cancel_btn.pack(side="right", padx=3)
+
+        # Valid Files Frame
+        valid_files_frame = Frame(main_frame)
+        valid_files_frame.pack(fill="both", expand=True, pady=5)
+        Label(valid_files_frame, text="Valid Files", font=(
+            "Arial", 12, "bold")).pack(anchor="w", pady=5)
+        self.valid_files_listbox = Listbox(
+            valid_files_frame, width=60, height=5)
+        self.valid_files_listbox.pack(side="left", fill="both", expand=True)
+
+        valid_scrollbar = Scrollbar(valid_files_frame)
+        valid_scrollbar.pack(side="right", fill="y")
+        self.valid_files_listbox.config(yscrollcommand=valid_scrollbar.set)
+        valid_scrollbar.config(command=self.valid_files_listbox.yview)
+
+        # Error Logs Frame
+        error_logs_frame = Frame(main_frame)
+        error_logs_frame.pack(fill="both", expand=True, pady=5)
+        Label(error_logs_frame, text="Error Logs", font=(
+            "Arial", 12, "bold")).pack(anchor="w", pady=5)
+        self.error_logs_listbox = Listbox(error_logs_frame, width=60, height=5)
+        self.error_logs_listbox.pack(side="left", fill="both", expand=True)
+
+        error_scrollbar = Scrollbar(error_logs_frame)
+        error_scrollbar.pack(side="right", fill="y")
+        self.error_logs_listbox.config(yscrollcommand=error_scrollbar.set)
+        error_scrollbar.config(command=self.error_logs_listbox.yview)
+
+
+def run_gui():
+    root = Tk()
+    app = App(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    run_gui()
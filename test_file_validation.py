@@ -1,4 +1,44 @@
-from ftp_csv import FTPClient, FileValidator
+import re
+import csv
+import sys
+import json
+import pickle
+import random
+import itertools
+import pytest
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor
+from ftp_csv import BatchIdSet, ColumnarValidator, FTPClient, FileValidator, StreamValidator, ValidationAborted, ValidationIssue, ValidationSchema, decimal_range_pattern
+from ftp_csv_bench import ERROR_KINDS, generate_csv
+from unittest.mock import patch
+
+
+def stream_in_chunks(content, chunk_size):
+    validator = StreamValidator()
+    data = content.encode("utf-8")
+    try:
+        for i in range(0, len(data), chunk_size):
+            validator.feed(data[i:i + chunk_size])
+    except ValidationAborted:
+        pass
+    return validator.close()
+
+
+def random_csv(rnd, rows):
+    readings = ["0", "00", "9", "09.9", "9.9", "9.900", "9.901", "8.999", "10",
+                "19", "1.2345", "1.", ".5", "-1", " 1", "", "1.2.3", "9.91"]
+    lines = [",".join(["batch_id", "timestamp"] +
+                      [f"reading{i}" for i in range(1, 11)])]
+    for i in range(rows):
+        batch_id = rnd.choice([str(i), str(i), str(rnd.randint(0, 40)),
+                               "x" * rnd.randint(9, 12) + str(rnd.randint(0, 3))])
+        cells = [batch_id, "2023-01-01"] + [
+            rnd.choice(readings) if rnd.random() < 0.03 else "1.5"
+            for _ in range(10)]
+        if rnd.random() < 0.02:
+            cells = cells[:rnd.randint(0, 11)]
+        lines.append(",".join(cells))
+    return rnd.choice(["\n", "\r\n"]).join(lines) + rnd.choice(["", "\n"])
 
 
 class TestFTP:
@@ -43,3 +83,332 @@ class TestFTP:
         is_valid, message = FileValidator.validate(exceeds_limit)
         assert is_valid == False
         assert "Value exceeds 9.9" in message
+
+    def test_stream_matches_full_validation(self):
+        invalid_rows = self.valid_csv_content + """
+                            2,2023-01-03,1.234,2.345,3.456,4.567,5.678,6.789,7.890,8.901,9.012,0.123"""
+        for content in (self.valid_csv_content, invalid_rows, ""):
+            expected = FileValidator.validate(content)
+            for chunk_size in (1, 5, 4096):
+                assert stream_in_chunks(content, chunk_size) == expected
+
+    def test_stream_handles_split_multibyte_characters(self):
+        content = self.valid_csv_content.replace("0.123", "0.12\u00e9", 1)
+        is_valid, message = stream_in_chunks(content, 1)
+        assert is_valid == False
+        assert message == "Non-numeric reading10 on row 2: 0.12\u00e9"
+
+    def test_stream_byte_fast_path_matches_full_validation(self):
+        rnd = random.Random(11)
+        contents = [random_csv(rnd, rnd.randint(0, 60)) for _ in range(100)]
+        contents += [generate_csv(300, 0.01, 0.5, (kind,), seed=4).decode()
+                     for kind in ERROR_KINDS]
+        contents.append(generate_csv(300, line_ending="\r\n").decode())
+        for content in contents:
+            expected = FileValidator.validate(content)
+            issues = FileValidator.collect_errors(content)
+            for chunk_size in (7, 300, 4096):
+                assert stream_in_chunks(content, chunk_size) == expected, content
+                validator = StreamValidator(max_errors=len(issues) + 1)
+                data = content.encode()
+                for i in range(0, len(data), chunk_size):
+                    validator.feed(data[i:i + chunk_size])
+                validator.close()
+                assert validator.issues == issues, content
+
+    def test_stream_carries_only_a_partial_line_with_cr_line_endings(self):
+        contents = [generate_csv(300, line_ending="\r"),
+                    generate_csv(300, 0.01, 0.5, ("duplicate_batch_id",), seed=5, line_ending="\r"),
+                    generate_csv(300, line_ending="\r\n")]
+        for data in contents:
+            expected = FileValidator.validate(data.decode())
+            for chunk_size in (1, 7, 300):
+                validator = StreamValidator()
+                longest_carry = 0
+                try:
+                    for i in range(0, len(data), chunk_size):
+                        validator.feed(data[i:i + chunk_size])
+                        longest_carry = max(longest_carry, len(validator._carry))
+                except ValidationAborted:
+                    pass
+                assert validator.close() == expected, data
+                assert longest_carry < 200
+
+    def test_stream_validates_part_of_a_file(self):
+        _, first_row, second_row = self.valid_csv_content.split("\n")
+        validator = StreamValidator(has_headers=False, first_row=10, seen={"batch_id": {"1"}},
+                                    record_metrics=False)
+        validator.feed(f"{second_row.strip()}\n".encode())
+        assert validator.last_row == 10
+        assert [set(values) for values in validator.unique_sets] == [{"1", "2"}]
+        try:
+            validator.feed(f"{first_row.strip()}\n".encode())
+        except ValidationAborted:
+            pass
+        assert validator.close() == (False, "Duplicate batch_id 1 on row 11")
+        assert validator.rule == "duplicate_batch_id"
+
+    def test_stream_reports_invalid_encoding(self):
+        header, first_row, _ = self.valid_csv_content.split("\n")
+        data = f"{header}\n{first_row}\n".encode() + \
+            first_row.replace("1,", "2,", 1).encode().replace(b"2023", b"20\xff3")
+        for chunk_size in (1, 4096):
+            validator = StreamValidator()
+            try:
+                for i in range(0, len(data), chunk_size):
+                    validator.feed(data[i:i + chunk_size])
+            except ValidationAborted:
+                pass
+            assert validator.close() == (False, "Invalid utf-8 data on row 3: b'\\xff'")
+
+        validator = StreamValidator(max_errors=10)
+        validator.feed(data + b"\n" + first_row.encode())
+        validator.close()
+        assert [(i.row, i.rule, i.value) for i in validator.issues] == [
+            (3, "encoding", "ff"), (4, "duplicate_batch_id", first_row.split(",")[0])]
+
+    def test_stream_aborts_on_first_invalid_row(self):
+        validator = StreamValidator()
+        header, first_row, _ = self.valid_csv_content.split("\n")
+        try:
+            validator.feed(f"{header}\n{first_row}\n{first_row}\n".encode())
+            assert False, "feed should abort on the duplicate row"
+        except ValidationAborted:
+            pass
+        try:
+            validator.feed(b"more data")
+            assert False, "feed should keep refusing data after aborting"
+        except ValidationAborted:
+            pass
+        assert validator.close() == (False, "Duplicate batch_id " +
+                                     first_row.split(",")[0] + " on row 3")
+
+    def test_fast_readings_check_matches_per_cell_rules(self):
+        def per_cell(readings, row_num):
+            for i, reading in enumerate(readings, start=1):
+                try:
+                    value = float(reading)
+                    if value > 9.9:
+                        return False, f"Value exceeds 9.9 in reading{i} on row {row_num}: {value}"
+                    if not re.match(r"^\d+(\.\d{1,3})?$", reading):
+                        return False, f"Invalid decimal format in reading{i} on row {row_num}: {reading}"
+                except ValueError:
+                    return False, f"Non-numeric reading{i} on row {row_num}: {reading}"
+            return True, None
+
+        samples = ["0", "00", "9", "09.9", "9.9", "9.90", "9.900", "9.901",
+                   "9.09", "8.999", "10", "1.2345", "1.", ".5", "-1", " 1",
+                   "1e0", "nan", "inf", "1_0", "", "abc", "\u0661.5", "5\n"]
+        for sample in samples:
+            readings = ["1.0"] * 9 + [sample]
+            assert FileValidator.validate_readings(readings, 7) == \
+                per_cell(readings, 7), sample
+
+    def test_columnar_matches_row_by_row_validation(self):
+        rnd = random.Random(7)
+        for _ in range(300):
+            content = random_csv(rnd, rnd.randint(0, 30))
+            expected = FileValidator.validate(content)
+            for block_size in (16, 256, 1024 * 1024):
+                assert ColumnarValidator.validate(content, block_size) == \
+                    expected, content
+
+    def test_columnar_reports_empty_row_after_empty_batch_id(self, tmp_path):
+        header = self.valid_csv_content.split("\n")[0]
+        content = header + "\n,2023-01-01," + ",".join(["1.0"] * 10) + "\n\n"
+        path = tmp_path / "empty_row.csv"
+        path.write_text(content)
+        expected = (False, "Row 3 has missing columns")
+        assert FileValidator.validate(content) == expected
+        assert ColumnarValidator.validate(content) == expected
+        assert FileValidator.validate_file(str(path), columnar=True) == expected
+
+    def test_columnar_finds_duplicates_across_blocks(self):
+        header, first_row, second_row = self.valid_csv_content.split("\n")
+        rows = [first_row.strip().replace("1,", f"{i},", 1) for i in range(1, 50)]
+        content = "\n".join([header] + rows + [rows[3]] + rows[10:12])
+        assert ColumnarValidator.validate(content, 64) == \
+            (False, "Duplicate batch_id 4 on row 51")
+
+    def test_columnar_hands_over_to_stream_validator(self):
+        header, first_row, _ = self.valid_csv_content.split("\n")
+        rows = [first_row.strip().replace("1,", f"{i},", 1) for i in range(1, 50)]
+        quoted = '"2,a",2023-01-01' + first_row.strip()[len("1,2023-01-01"):]
+        for content in ("\n".join([header] + rows + [quoted, rows[0]]),
+                        "\n".join([header] + rows).replace("2023", "\u00e9", 1)):
+            expected = FileValidator.validate(content)
+            assert ColumnarValidator.validate(content, 64) == expected
+            with patch.dict(sys.modules, {"numpy": None}):
+                assert ColumnarValidator.validate(content, 64) == expected
+
+    def test_collect_errors_reports_every_violation(self):
+        header, first_row, _ = self.valid_csv_content.split("\n")
+        first_row = first_row.strip()
+        content = "\n".join([
+            header, first_row,
+            first_row.replace("3.456", "10").replace("5.678", "abc"),
+            "2,2023-01-02,1.0",
+            first_row.replace("1,", "3,", 1).replace("0.123", "0.1234")])
+
+        issues = FileValidator.collect_errors(content)
+
+        assert [(i.row, i.column, i.rule) for i in issues] == [
+            (3, "batch_id", "duplicate_batch_id"),
+            (3, "reading3", "value_exceeds"),
+            (3, "reading5", "non_numeric"),
+            (4, None, "missing_columns"),
+            (5, "reading10", "decimal_format")]
+        assert issues[0].message == FileValidator.validate(content)[1]
+        assert issues[4] == ValidationIssue(
+            5, "reading10", "decimal_format", "0.1234",
+            "Invalid decimal format in reading10 on row 5: 0.1234")
+        assert len(FileValidator.collect_errors(content, max_errors=2)) == 2
+
+    def test_default_schema_matches_built_in_rules(self):
+        def built_in(content):
+            reader = csv.reader(content.splitlines())
+            if not FileValidator.validate_headers(next(reader, None)):
+                return False
+            batch_ids = set()
+            for row_num, row in enumerate(reader, start=2):
+                is_valid, msg = FileValidator.validate_row(row, row_num, batch_ids)
+                if not is_valid:
+                    return False, msg
+            return True, "Valid"
+
+        rnd = random.Random(3)
+        for _ in range(300):
+            content = random_csv(rnd, rnd.randint(1, 30))
+            assert FileValidator.validate(content) == built_in(content), content
+
+    def test_decimal_range_pattern_matches_numeric_comparison(self):
+        for maximum, decimals in ((9.9, 3), (12.5, 2), (0.5, 1), (100, 2), (10.05, 1)):
+            pattern = re.compile(decimal_range_pattern(maximum, decimals))
+            decimal_format = re.compile(rf"[0-9]+(\.[0-9]{{1,{decimals}}})?")
+            for length in range(1, 6):
+                for chars in itertools.product("0159.", repeat=length):
+                    value = "".join(chars)
+                    expected = bool(decimal_format.fullmatch(value)) and \
+                        Decimal(value) <= Decimal(str(maximum))
+                    assert bool(pattern.fullmatch(value)) == expected, (maximum, value)
+
+    def test_schema_rejects_invalid_numeric_rules(self):
+        for column, message in (
+                ({"decimals": 0}, "decimals must be a whole number"),
+                ({"decimals": 1.5}, "decimals must be a whole number"),
+                ({"max": "9.9"}, "max must be a number"),
+                ({"min": True}, "min must be a number")):
+            with pytest.raises(ValueError, match=message):
+                ValidationSchema({"columns": [{"name": "x", "type": "decimal", **column}]})
+
+    def test_custom_schema_from_file(self, tmp_path):
+        path = tmp_path / "schema.json"
+        path.write_text(json.dumps({"columns": [
+            {"name": "id", "type": "integer", "unique": True, "min": 1},
+            {"name": "site", "nullable": False, "pattern": "[A-Z]{3}"},
+            {"name": "depth", "type": "decimal", "min": 0.5, "max": 20, "decimals": 1},
+            {"name": "note"},
+            {"name": "temp", "type": "decimal", "max": 40, "decimals": 2, "nullable": True},
+        ]}))
+        schema = pickle.loads(pickle.dumps(ValidationSchema.load(str(path))))
+        header = "id,site,depth,note,temp"
+
+        cases = {
+            "1,ABC,1.5,,12.25\n2,XYZ,20,anything,": (True, "Valid"),
+            "1,ABC,1.5,,\n1,ABC,1.5,,": (False, "Duplicate id 1 on row 3"),
+            "0,ABC,1.5,,": (False, "Value below 1 in id on row 2: 0"),
+            "1,,1.5,,": (False, "Missing value in site on row 2"),
+            "1,abc,1.5,,": (False, "Invalid format in site on row 2: abc"),
+            "1,ABC,20.5,,": (False, "Value exceeds 20 in depth on row 2: 20.5"),
+            "1,ABC,0.25,,": (False, "Value below 0.5 in depth on row 2: 0.25"),
+            "1,ABC,1.5,,1.234": (False, "Invalid decimal format in temp on row 2: 1.234"),
+            "1,ABC,1.5": (False, "Row 2 has missing columns"),
+        }
+        for rows, expected in cases.items():
+            content = f"{header}\n{rows}"
+            assert FileValidator.validate(content, schema) == expected, rows
+            assert ColumnarValidator.validate(content, schema=schema) == expected, rows
+
+        issues = FileValidator.collect_errors(
+            f"{header}\n1,abc,25,,x\n1,ABC,1.5,,", schema=schema)
+        assert [(i.row, i.column, i.rule) for i in issues] == [
+            (2, "site", "pattern"), (2, "depth", "value_exceeds"),
+            (2, "temp", "non_numeric"), (3, "id", "duplicate_id")]
+        assert FileValidator.validate(self.valid_csv_content, schema)[0] is False
+
+    def test_batch_id_set_matches_set_when_spilling(self):
+        rnd = random.Random(5)
+        ids = BatchIdSet(memory_limit=1)
+        expected = set()
+        for _ in range(20000):
+            value = str(rnd.randrange(15000))
+            assert (value in ids) == (value in expected), value
+            ids.add(value)
+            expected.add(value)
+        assert len(ids) == len(expected)
+        assert ids._runs
+        ids.close()
+
+    def test_batch_id_set_merges_runs(self):
+        ids = BatchIdSet(map(str, range(0, 80000, 2)), memory_limit=1)
+        # 78 spilled tables are merged into a handful of runs, the largest
+        # of which has no room left for a Bloom filter.
+        assert len(ids._runs) <= 6
+        assert any(bloom is None for _, bloom in ids._runs)
+        assert all(str(i) in ids for i in range(0, 80000, 2))
+        assert not any(str(i) in ids for i in range(1, 80000, 2))
+        assert len(ids) == 40000
+        ids.close()
+
+    def test_batch_id_set_confirms_hash_matches(self):
+        class Colliding(BatchIdSet):
+            def _hash(self, value):
+                return 1
+
+        ids = Colliding(["a", "b"], memory_limit=1)
+        for value in "cdefgh":
+            assert value not in ids
+            ids.add(value)
+        assert all(value in ids for value in "abcdefgh")
+        assert "z" not in ids and len(ids) == 8
+
+    def test_bounded_memory_duplicate_detection(self, tmp_path):
+        header, first_row, _ = self.valid_csv_content.split("\n")
+        rows = [first_row.strip().replace("1,", f"{i},", 1) for i in range(1, 5000)]
+        path = tmp_path / "large.csv"
+        path.write_text("\n".join([header] + rows + [rows[17]]))
+        expected = (False, "Duplicate batch_id 18 on row 5001")
+        for columnar in (False, True):
+            assert FileValidator.validate_file(
+                str(path), columnar=columnar, unique_memory=1) == expected
+
+    def test_parallel_validation_matches_sequential(self, tmp_path):
+        header, first_row, _ = self.valid_csv_content.split("\n")
+        rows = [first_row.strip().replace("1,", f"{i},", 1) for i in range(1, 300)]
+        contents = [generate_csv(400, 0.01, position, (kind,), seed=6)
+                    for kind in ERROR_KINDS for position in (0.1, 0.9)]
+        contents += [generate_csv(400), generate_csv(400, line_ending="\r\n")[:-2],
+                     generate_csv(400, line_ending="\r"),
+                     "\n".join([header] + rows + [rows[3]]).encode(),
+                     "\n".join([header] + rows + ['"1",x']).encode(),
+                     "\n".join(["wrong"] + rows).encode(),
+                     "\n".join([header] + rows).encode().replace(b"2023", b"\xff", 1)]
+        path = tmp_path / "large.csv"
+        with ProcessPoolExecutor(2) as executor:
+            for content in contents:
+                path.write_bytes(content)
+                expected = FileValidator.validate_file(str(path))
+                for chunk_size in (500, 4096):
+                    assert FileValidator.validate_parallel(
+                        str(path), chunk_size=chunk_size,
+                        executor=executor) == expected, content
+
+    def test_generated_csv_errors_start_after_position(self):
+        assert FileValidator.validate(generate_csv(500).decode()) == (True, "Valid")
+        assert generate_csv(50, seed=1) == generate_csv(50, seed=1)
+        for kind in ERROR_KINDS:
+            content = generate_csv(1000, 0.01, 0.5, (kind,), seed=2).decode()
+            is_valid, msg = FileValidator.validate(content)
+            row_num = int(re.search(r"[Rr]ow (\d+)", msg).group(1))
+            assert is_valid is False and row_num > 500, msg
+            assert FileValidator.collect_errors(content)[0].rule == kind
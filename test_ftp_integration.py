@@ -1,4 +1,20 @@
-from ftp_csv import FTPClient, Logger
+import os
+import re
+import json
+import asyncio
+import sys
+import random
+import fnmatch
+import ftplib
+import pstats
+import subprocess
+import threading
+import urllib.error
+import urllib.request
+from ftp_csv import ERROR_LOG_FILE, EXPECTED_HEADERS, BatchProcessor, FTPClient, FTPConnectionPool, Logger, RemoteUUIDPool, TransferWorker, BatchResult, watch, DirectoryCache, FileIndex, RemoteEntry, parse_list_line, ProcessedLedger, BatchIdIndex, FileValidator, METRICS, RemoteCrawler, list_directory, main
+from ftp_csv_async import AsyncFTPClient
+from ftp_csv_bench import LocalFTPServer, generate_csv, run_benchmarks
+from contextlib import aclosing
 from unittest.mock import patch, Mock, MagicMock
 
 
@@ -28,6 +44,740 @@ class TestIntegration:
         assert is_valid == False
         assert message == "Disconnected from FTP server"
 
+    @patch("ftplib.FTP")
+    def test_stream_validate_aborts_transfer(self, mock_ftp_class):
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        chunks = [b"wrong,headers\n", b"1,2\n"]
+
+        def fake_retrbinary(cmd, callback):
+            for chunk in chunks:
+                callback(chunk)
+
+        mock_ftp_instance.retrbinary.side_effect = fake_retrbinary
+        self.ftp_client.connect("host", "user", "pass")
+        is_valid, message = self.ftp_client.stream_validate("data.csv")
+
+        assert is_valid is False
+        assert "Incorrect or missing headers" in message
+        mock_ftp_instance.voidresp.assert_called_once()
+
+    @patch("ftplib.FTP")
+    def test_save_valid_file_promotes_atomically(self, mock_ftp_class, tmp_path):
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        headers = ",".join(EXPECTED_HEADERS)
+        content = f"{headers}\r\n1,2023-01-01,{','.join(['1.5'] * 10)}\r\n"
+        mock_ftp_instance.retrbinary.side_effect = (
+            lambda cmd, callback, rest=None: callback(content.encode()))
+
+        self.ftp_client.connect("host", "user", "pass")
+        is_valid, message, saved = self.ftp_client.save_valid_file(
+            "data.csv", dest_dir=str(tmp_path))
+
+        assert is_valid is True
+        assert os.listdir(tmp_path) == [saved]
+        assert (tmp_path / saved).read_bytes() == content.encode()
+
+    @patch("ftplib.FTP")
+    def test_save_valid_file_discards_invalid_file(self, mock_ftp_class, tmp_path):
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        mock_ftp_instance.retrbinary.side_effect = (
+            lambda cmd, callback, rest=None: callback(b"wrong,headers\n"))
+
+        self.ftp_client.connect("host", "user", "pass")
+        is_valid, message, saved = self.ftp_client.save_valid_file(
+            "data.csv", dest_dir=str(tmp_path))
+
+        assert is_valid is False
+        assert saved is None
+        assert os.listdir(tmp_path) == []
+
+    @patch("ftplib.FTP")
+    def test_batch_processor_validates_files_concurrently(self, mock_ftp_class, tmp_path):
+        headers = ",".join(EXPECTED_HEADERS)
+        row = f"1,2023-01-01,{','.join(['1.5'] * 10)}"
+        remote = {
+            "good.csv": f"{headers}\n{row}\n".encode(),
+            "dup.csv": f"{headers}\n{row}\n{row}\n".encode(),
+            "empty.csv": b"",
+            "notes.txt": b"text",
+        }
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        mock_ftp_instance.mlsd.return_value = [
+            (name, {"type": "file", "size": str(len(data))})
+            for name, data in remote.items()]
+        mock_ftp_instance.retrbinary.side_effect = (
+            lambda cmd, callback, rest=None: callback(remote[cmd[len("RETR "):]]))
+
+        processor = BatchProcessor("host", "user", "pass", connections=2,
+                                   workers=2, dest_dir=str(tmp_path))
+        filenames = processor.resolve(["*"])
+        results = {r.filename: r for r in processor.run(filenames)}
+
+        assert set(results) == set(remote)
+        assert results["good.csv"].valid is True
+        assert os.listdir(tmp_path) == [results["good.csv"].saved_as]
+        assert results["dup.csv"].message == "Duplicate batch_id 1 on row 3"
+        assert "zero size" in results["empty.csv"].message
+        assert "Invalid file extension" in results["notes.txt"].message
+
+        good = processor.ledger.get("good.csv", len(remote["good.csv"]))
+        assert good["outcome"] == "valid"
+        assert good["output"] == results["good.csv"].saved_as
+        assert len(good["content_hash"]) == 64
+        assert processor.pending(filenames) == []
+
+    @patch("ftplib.FTP")
+    def test_batch_processor_writes_error_report(self, mock_ftp_class, tmp_path, monkeypatch):
+        headers = ",".join(EXPECTED_HEADERS)
+        rows = [f"{i},2023-01-01,{','.join(['1.5'] * 9)},{value}"
+                for i, value in ((1, "1.5"), (1, "12"), (2, "x"))]
+        content = "\n".join([headers] + rows).encode()
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        mock_ftp_instance.size.return_value = len(content)
+        mock_ftp_instance.retrbinary.side_effect = (
+            lambda cmd, callback, rest=None: callback(content))
+        monkeypatch.chdir(tmp_path)
+
+        processor = BatchProcessor("host", "user", "pass", connections=1,
+                                   workers=1, dest_dir=str(tmp_path),
+                                   report="jsonl")
+        [result] = processor.run(["data.csv"])
+
+        assert result.valid is False
+        assert result.message == "Duplicate batch_id 1 on row 3 (3 errors found)"
+        with open(result.report) as report:
+            records = [json.loads(line) for line in report]
+        assert [(r["row"], r["column"], r["rule"]) for r in records] == [
+            (3, "batch_id", "duplicate_batch_id"),
+            (3, "reading10", "value_exceeds"),
+            (4, "reading10", "non_numeric")]
+        assert records[0]["file"] == "data.csv"
+
+    @patch("ftplib.FTP")
+    def test_pool_reconnects_connection_failing_noop(self, mock_ftp_class):
+        first, second = MagicMock(), MagicMock()
+        mock_ftp_class.side_effect = [first, second]
+        pool = FTPConnectionPool("host", "user", "pass", size=1,
+                                 check_after=0, backoff=0)
+
+        with pool.connection() as ftp:
+            assert ftp is first
+        first.voidcmd.side_effect = EOFError()
+        with pool.connection() as ftp:
+            assert ftp is second
+
+        [stats] = pool.stats()
+        assert stats["lends"] == 2
+        assert stats["reconnects"] == 1
+        pool.close()
+        second.quit.assert_called_once()
+
+    @patch("ftplib.FTP")
+    def test_pool_call_retries_dropped_connection(self, mock_ftp_class):
+        first, second = MagicMock(), MagicMock()
+        mock_ftp_class.side_effect = [first, second]
+        first.nlst.side_effect = EOFError()
+        second.nlst.return_value = ["data.csv"]
+        pool = FTPConnectionPool("host", "user", "pass", size=1, backoff=0)
+
+        assert pool.call(lambda ftp: ftp.nlst()) == ["data.csv"]
+        assert pool.stats()[0]["errors"] == 1
+
+    @patch("ftplib.FTP")
+    def test_client_reconnects_after_server_disconnect(self, mock_ftp_class):
+        first, second = MagicMock(), MagicMock()
+        mock_ftp_class.side_effect = [first, second]
+        first.mlsd.side_effect = ftplib.error_temp("421 Timeout")
+        second.mlsd.return_value = [("data.csv", {"type": "file"})]
+
+        self.ftp_client.connect("host", "user", "pass")
+
+        assert self.ftp_client.get_file_list() == ["data.csv"]
+        assert self.ftp_client.ftp is second
+
+    @patch("ftplib.FTP")
+    def test_transfer_worker_reports_progress_and_result(self, mock_ftp_class, tmp_path):
+        content = (",".join(EXPECTED_HEADERS) + "\n" +
+                   f"1,2023-01-01,{','.join(['1.5'] * 10)}\n").encode()
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        mock_ftp_instance.size.return_value = len(content)
+        mock_ftp_instance.retrbinary.side_effect = (
+            lambda cmd, callback, rest=None: [callback(content[:10]), callback(content[10:])])
+        pool = FTPConnectionPool("host", "user", "pass", size=1)
+
+        worker = TransferWorker(pool, "data.csv", Mock(), str(tmp_path))
+        worker.PROGRESS_INTERVAL = 0
+        worker.run()
+
+        events = list(worker.events.queue)
+        assert [e[1] for e in events[:-1]] == [10, len(content)]
+        outcome = events[-1][1]
+        assert outcome.status == "success"
+        assert os.listdir(tmp_path) == [outcome.saved_as]
+
+    @patch("ftplib.FTP")
+    def test_transfer_worker_rejects_batch_ids_already_saved(self, mock_ftp_class, tmp_path):
+        headers = ",".join(EXPECTED_HEADERS)
+        readings = ",".join(["1.5"] * 10)
+        remote = {"a.csv": f"{headers}\n1,2023-01-01,{readings}\n".encode(),
+                  "b.csv": f"{headers}\n2,2023-01-01,{readings}\n"
+                           f"1,2023-01-02,{readings}\n".encode()}
+        mock_ftp_instance = mock_ftp_class.return_value
+        mock_ftp_instance.retrbinary.side_effect = (
+            lambda cmd, callback, rest=None: callback(remote[cmd[len("RETR "):]]))
+        pool = FTPConnectionPool("host", "user", "pass", size=1)
+        dest_dir = tmp_path / "valid"
+        dest_dir.mkdir()
+        index = BatchIdIndex(str(tmp_path / "batch_ids.db"), str(dest_dir))
+
+        outcomes = []
+        for filename in remote:
+            mock_ftp_instance.size.return_value = len(remote[filename])
+            worker = TransferWorker(pool, filename, Mock(), str(dest_dir), batch_index=index)
+            worker.run()
+            outcomes.append(worker.events.queue[-1][1])
+
+        assert outcomes[0].status == "success"
+        assert outcomes[1].status == "fail"
+        assert outcomes[1].message == (
+            f"Validation failed:\nDuplicate batch_id 1 on row 3, already in {outcomes[0].saved_as}")
+        assert os.listdir(dest_dir) == [outcomes[0].saved_as]
+        assert "1" in index
+        index.close()
+
+    @patch("ftplib.FTP")
+    def test_transfer_worker_cancel_discards_file(self, mock_ftp_class, tmp_path):
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        mock_ftp_instance.size.return_value = 100
+        pool = FTPConnectionPool("host", "user", "pass", size=1)
+        worker = TransferWorker(pool, "data.csv", Mock(), str(tmp_path))
+        mock_ftp_instance.retrbinary.side_effect = (
+            lambda cmd, callback, rest=None: [worker.cancel(), callback(b"x")])
+
+        worker.run()
+
+        assert worker.events.get_nowait()[1].status == "cancelled"
+        assert os.listdir(tmp_path) == []
+
+    @patch("ftplib.FTP")
+    def test_transfer_worker_resumes_on_fresh_connection(self, mock_ftp_class, tmp_path):
+        content = (",".join(EXPECTED_HEADERS) + "\n" +
+                   f"1,2023-01-01,{','.join(['1.5'] * 10)}\n").encode()
+        first, second, third = MagicMock(), MagicMock(), MagicMock()
+        mock_ftp_class.side_effect = [first, second, third]
+
+        def voidcmd(cmd):
+            if cmd.startswith("MDTM"):
+                raise ftplib.error_perm("502 MDTM not implemented")
+            return "200 OK"
+
+        # Without MDTM, the resume is checked against the size alone.
+        for ftp in (first, second, third):
+            ftp.size.return_value = len(content)
+            ftp.voidcmd.side_effect = voidcmd
+
+        def dropped(cmd, callback, rest=None):
+            callback(content[:40])
+            raise EOFError()
+
+        offsets = []
+        first.retrbinary.side_effect = dropped
+        second.retrbinary.side_effect = lambda cmd, callback, rest=None: [
+            offsets.append(rest), callback(content[rest:])]
+        pool = FTPConnectionPool("host", "user", "pass", size=1, backoff=0)
+
+        worker = TransferWorker(pool, "data.csv", Mock(), str(tmp_path), size=len(content))
+        worker.run()
+
+        outcome = worker.events.queue[-1][1]
+        assert outcome.status == "success", outcome.message
+        assert offsets == [40]
+        assert (tmp_path / outcome.saved_as).read_bytes() == content
+
+        second.retrbinary.side_effect = dropped
+        third.retrbinary.side_effect = dropped
+        worker = TransferWorker(pool, "data.csv", Mock(), str(tmp_path),
+                                size=len(content), retries=1)
+        worker.run()
+
+        # A transfer that keeps failing is an error that can be retried later.
+        assert worker.events.queue[-1][1].status == "error"
+        assert not ProcessedLedger(":memory:").seen("data.csv")
+
+    @patch("ftplib.FTP")
+    def test_save_valid_file_resumes_after_dropped_connection(self, mock_ftp_class, tmp_path):
+        content = (",".join(EXPECTED_HEADERS) + "\n" +
+                   f"1,2023-01-01,{','.join(['1.5'] * 10)}\n").encode()
+        first, second = MagicMock(), MagicMock()
+        mock_ftp_class.side_effect = [first, second]
+        for ftp in (first, second):
+            ftp.size.return_value = len(content)
+            ftp.voidcmd.return_value = "213 20240101000000"
+
+        def dropped(cmd, callback, rest=None):
+            callback(content[:40])
+            raise EOFError()
+
+        offsets = []
+        first.retrbinary.side_effect = dropped
+        second.retrbinary.side_effect = lambda cmd, callback, rest=None: [
+            offsets.append(rest), callback(content[rest:])]
+
+        self.ftp_client.connect("host", "user", "pass")
+        is_valid, message, saved = self.ftp_client.save_valid_file(
+            "data.csv", dest_dir=str(tmp_path))
+
+        assert is_valid is True, message
+        assert offsets == [40]
+        assert os.listdir(tmp_path) == [saved]
+        assert (tmp_path / saved).read_bytes() == content
+
+    @patch("ftplib.FTP")
+    def test_batch_download_resumes_with_list_mtimes(self, mock_ftp_class, tmp_path):
+        content = (",".join(EXPECTED_HEADERS) + "\n" +
+                   f"1,2023-01-01,{','.join(['1.5'] * 10)}\n").encode()
+        mock_ftp_instance = mock_ftp_class.return_value
+        mock_ftp_instance.mlsd.side_effect = ftplib.error_perm("500 MLSD not understood")
+        # LIST only gives the mtime to the minute, MDTM to the second.
+        mock_ftp_instance.retrlines.side_effect = lambda cmd, callback: callback(
+            f"-rw-r--r--   1 ftp ftp {len(content)} Mar 05 10:15 data.csv")
+        mock_ftp_instance.size.return_value = len(content)
+        mock_ftp_instance.voidcmd.return_value = "213 20260305101537"
+
+        def dropped(cmd, callback, rest=None):
+            callback(content[:40])
+            raise EOFError()
+
+        offsets = []
+
+        def retrbinary(cmd, callback, rest=None):
+            offsets.append(rest)
+            if len(offsets) == 1:
+                dropped(cmd, callback)
+            callback(content[rest:])
+
+        mock_ftp_instance.retrbinary.side_effect = retrbinary
+
+        processor = BatchProcessor("host", "user", "pass", connections=1,
+                                   workers=1, dest_dir=str(tmp_path))
+        [result] = processor.run(processor.resolve(["*"]))
+
+        assert result.valid is True, result.message
+        assert offsets == [None, 40]
+
+    @patch("ftplib.FTP")
+    def test_spool_file_restarts_when_remote_file_changed(self, mock_ftp_class, tmp_path):
+        content = b"new,complete,content\n"
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        mock_ftp_instance.size.return_value = len(content)
+        mock_ftp_instance.voidcmd.return_value = "213 20240101000000"
+        offsets = []
+        mock_ftp_instance.retrbinary.side_effect = lambda cmd, callback, rest=None: [
+            offsets.append(rest), callback(content[rest or 0:])]
+        # A partial download of an older version of the file
+        (tmp_path / ".data.csv.part").write_bytes(b"old,")
+        (tmp_path / ".data.csv.part.json").write_text(f"[{len(content)}, 1]")
+
+        self.ftp_client.connect("host", "user", "pass")
+        spool_path = self.ftp_client.spool_file("data.csv", str(tmp_path))
+
+        assert offsets == [None]
+        assert open(spool_path, "rb").read() == content
+        assert os.listdir(tmp_path) == [".data.csv.part"]
+
+    def test_watch_processes_only_new_files(self):
+        stop = threading.Event()
+        processor = Mock()
+        processor.resolve.side_effect = [["a.csv"], ["a.csv", "b.csv"]]
+        seen = set()
+        processor.pending.side_effect = lambda names: [n for n in names if n not in seen]
+        processor.run.side_effect = lambda names: [
+            seen.add(name) or BatchResult(name, True, "Valid", "saved.csv") for name in names]
+        stop.wait = Mock(side_effect=lambda interval: stop.set()
+                         if processor.resolve.call_count == 2 else None)
+
+        watch(processor, ["*.csv"], 0, stop)
+
+        assert [c.args[0] for c in processor.run.call_args_list] == [["a.csv"], ["b.csv"]]
+
+    @patch("ftplib.FTP")
+    def test_search_reports_errors_through_callback(self, mock_ftp_class):
+        mock_ftp_class.return_value.mlsd.return_value = [
+            ("data.csv", {"type": "file"})]
+        on_error = Mock()
+        client = FTPClient(on_error=on_error)
+        client.connect("host", "user", "pass")
+
+        assert client.search_files("missing") == []
+        on_error.assert_called_once_with(
+            "Error", "There is no file with this name!")
+
+    def test_headless_import_does_not_load_tkinter(self):
+        code = ("import sys, ftp_csv; ftp_csv.FTPClient().search_files('x'); "
+                "sys.exit('tkinter' in sys.modules or 'requests' in sys.modules)")
+        assert subprocess.run([sys.executable, "-c", code],
+                              cwd=os.path.dirname(os.path.abspath(__file__))).returncode == 0
+
+    @patch("ftplib.FTP")
+    def test_listing_cache_serves_list_search_and_size(self, mock_ftp_class):
+        mock_ftp_instance = mock_ftp_class.return_value
+        mock_ftp_instance.mlsd.return_value = [
+            (".", {"type": "cdir"}),
+            ("data.csv", {"type": "file", "size": "120", "modify": "20240102030405"}),
+            ("archive", {"type": "dir", "modify": "20240101000000"}),
+        ]
+        self.ftp_client.connect("host", "user", "pass")
+
+        assert self.ftp_client.get_file_list() == ["data.csv"]
+        assert self.ftp_client.search_files("data") == ["data.csv"]
+        assert self.ftp_client.get_size("data.csv") == 120
+        assert self.ftp_client.listing.entries["data.csv"].mtime == 1704164645
+        mock_ftp_instance.mlsd.assert_called_once()
+        mock_ftp_instance.size.assert_not_called()
+
+        self.ftp_client.listing.invalidate()
+        self.ftp_client.get_file_list()
+        assert mock_ftp_instance.mlsd.call_count == 2
+
+    def test_listing_cache_refresh_reports_changes(self):
+        ftp = MagicMock()
+        cache = DirectoryCache()
+        ftp.mlsd.return_value = [("a.csv", {"type": "file", "size": "1"}),
+                                 ("b.csv", {"type": "file", "size": "2"})]
+        assert cache.refresh(ftp) == (["a.csv", "b.csv"], [], [])
+        ftp.mlsd.return_value = [("b.csv", {"type": "file", "size": "3"}),
+                                 ("c.csv", {"type": "file", "size": "4"})]
+        assert cache.refresh(ftp) == (["c.csv"], ["a.csv"], ["b.csv"])
+        assert cache.version == 2
+        assert cache.refresh(ftp) == ([], [], [])
+        assert cache.version == 2
+
+    def test_listing_falls_back_to_list_parsing(self):
+        ftp = MagicMock()
+        ftp.mlsd.side_effect = ftplib.error_perm("500 Unknown command")
+        ftp.retrlines.side_effect = lambda cmd, callback: [callback(line) for line in [
+            "total 12",
+            "-rw-r--r--   1 ftp  ftp      2048 Mar 05  2023 data 1.csv",
+            "drwxr-xr-x   2 ftp  ftp      4096 Mar 05 10:15 archive",
+        ]]
+        cache = DirectoryCache()
+        cache.refresh(ftp)
+
+        assert cache.files() == ["data 1.csv"]
+        assert cache.size("data 1.csv") == 2048
+        ftp.nlst.assert_not_called()
+        assert parse_list_line("03-05-23  10:15PM  <DIR>  logs").type == "dir"
+        assert parse_list_line("03-05-23  10:15PM  512  a.csv").size == 512
+
+    def test_file_index_matches_linear_scan(self):
+        rng = random.Random(7)
+        names = ["".join(rng.choice("ab_1.") for _ in range(rng.randint(1, 9))) + ".csv"
+                 for _ in range(400)]
+        entries = [RemoteEntry(name, i, 1000 + i, "file") for i, name in enumerate(names)]
+        index = FileIndex(entries)
+
+        for query in ["ab", "a_1", "b.c", "1.", "zz"]:
+            assert index.search(query) == [n for n in names if query in n]
+            assert index.search(query, "prefix") == [n for n in names if n.startswith(query)]
+        for pattern in ["ab*", "*a_1*", "?b*.csv", "[ab]1*", "*1[._]a*"]:
+            assert index.search(pattern, "glob") == [
+                n for n in names if fnmatch.fnmatchcase(n, pattern)]
+        for pattern in ["ab_?1", "^b.*a\\.csv", "a|1b"]:
+            assert index.search(pattern, "regex") == [
+                n for n in names if re.search(pattern, n)]
+        assert index.search("a", min_size=10, max_size=20, modified_after=1015) == [
+            n for i, n in enumerate(names) if "a" in n and 15 <= i <= 20]
+
+    def test_ledger_persists_and_keys_on_size_and_mtime(self, tmp_path):
+        path = str(tmp_path / "ledger.db")
+        ledger = ProcessedLedger(path)
+        ledger.record("a.csv", 10, 1000, "valid", "Valid", 0.5, "MED_DATA_1.csv")
+        ledger.record("b.csv", 20, 1000, "error", "Download error: timeout")
+        ledger.close()
+
+        reopened = ProcessedLedger(path)
+        assert reopened.seen("a.csv", 10, 1000)
+        assert not reopened.seen("a.csv", 11, 1000)
+        assert not reopened.seen("b.csv", 20, 1000)
+        assert reopened.get("a.csv", 10, 1000)["duration"] == 0.5
+
+    @patch("ftplib.FTP")
+    def test_batch_index_rejects_batches_saved_before(self, mock_ftp_class, tmp_path):
+        headers = ",".join(EXPECTED_HEADERS)
+        readings = ",".join(["1.5"] * 10)
+        saved = tmp_path / "valid"
+        saved.mkdir()
+        (saved / "MED_DATA_old.csv").write_text(
+            f"{headers}\n7,2023-01-01,{readings}\n8,2023-01-01,{readings}\n")
+        remote = {
+            "new.csv": f"{headers}\n1,2023-01-02,{readings}\n2,2023-01-02,{readings}\n".encode(),
+            "repeat.csv": f"{headers}\n3,2023-01-02,{readings}\n8,2023-01-02,{readings}\n".encode(),
+        }
+        mock_ftp_instance = MagicMock()
+        mock_ftp_class.return_value = mock_ftp_instance
+        mock_ftp_instance.retrbinary.side_effect = (
+            lambda cmd, callback, rest=None: callback(remote[cmd[len("RETR "):]]))
+        index_path = str(tmp_path / "batch_ids.db")
+        index = BatchIdIndex(index_path, str(saved))
+
+        processor = BatchProcessor("host", "user", "pass", connections=1, workers=1,
+                                   dest_dir=str(saved), batch_index=index)
+        results = {r.filename: r for r in processor.run(["new.csv", "repeat.csv"])}
+
+        assert results["new.csv"].valid is True
+        assert results["repeat.csv"].message == \
+            "Duplicate batch_id 8 on row 3, already in MED_DATA_old.csv"
+        assert sorted(os.listdir(saved)) == sorted(
+            ["MED_DATA_old.csv", results["new.csv"].saved_as])
+        index.close()
+
+        (saved / "MED_DATA_old.csv").unlink()
+        reopened = BatchIdIndex(index_path, str(saved))
+        assert "1" in reopened and "2" in reopened
+        assert "8" not in reopened
+        reopened.close()
+
+    def test_local_ftp_server_serves_downloads(self, tmp_path):
+        content = generate_csv(300)
+        with LocalFTPServer({"a.csv": content, "b.txt": b"text"}) as server:
+            client = FTPClient()
+            assert client.connect(server.host, "wrong", "login", server.port)[0] is False
+            assert client.connect(
+                server.host, server.user, server.password, server.port)[0] is True
+            assert sorted(client.get_file_list()) == ["a.csv", "b.txt"]
+            assert client.get_size("a.csv") == len(content)
+            assert client.download_file("a.csv") == content.decode()
+
+            received = []
+            client.ftp.retrbinary("RETR a.csv", received.append, rest=100)
+            assert b"".join(received) == content[100:]
+
+            is_valid, _, saved = client.save_valid_file("a.csv", str(tmp_path))
+            assert is_valid is True
+            assert (tmp_path / saved).read_bytes() == content
+            client.disconnect()
+
+    def test_benchmarks_report_every_case(self):
+        report = run_benchmarks(rows=200, repeat=2, error_rate=0.01, error_position=0.5)
+
+        assert json.loads(json.dumps(report))["parameters"]["rows"] == 200
+        assert [r["name"] for r in report["results"]] == [
+            "validate_file", "validate_file_columnar", "save_valid_file",
+            "validate", "download_file"]
+        for result in report["results"]:
+            assert result["rows_per_s"] > 0 and result["mb_per_s"] > 0
+            assert result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
+        assert report["results"][0]["outcome"][0] is False
+        # Validation stops at the first invalid row, after about half the
+        # file; throughput counts only the rows up to it.
+        row_num = int(re.search(r"row (\d+)", report["results"][0]["outcome"][1]).group(1))
+        size = len(generate_csv(200, 0.01, 0.5))
+        for result in report["results"][:4]:
+            assert result["rows"] == row_num - 1 and result["bytes"] < size
+        assert report["results"][4]["rows"] == 200
+
+    def test_crawler_walks_tree_and_reuses_unchanged_listings(self):
+        files = {name: generate_csv(10) for name in (
+            "top.csv", "site/2024/01/01/a.csv", "site/2024/01/02/b.csv",
+            "site/2023/12/31/old.csv", "site/tmp/c.csv")}
+        files["site/2024/01/02/notes.txt"] = b"notes"
+        with LocalFTPServer(files) as server, \
+                patch("ftp_csv.list_directory", wraps=list_directory) as listed:
+            pool = FTPConnectionPool(server.host, server.user, server.password,
+                                     port=server.port, size=3)
+            crawler = RemoteCrawler(pool, exclude=["site/tmp"], ttl=0)
+
+            assert sorted(crawler.walk()) == [
+                "site/2023/12/31/old.csv", "site/2024/01/01/a.csv",
+                "site/2024/01/02/b.csv", "top.csv"]
+            assert listed.call_count == 9
+            assert crawler.entry("site/2024/01/01/a.csv").size == len(files["top.csv"])
+
+            # The three leaf directories, whose mtimes are unchanged, are
+            # not listed again.
+            assert len(list(crawler.walk())) == 4
+            assert listed.call_count == 15
+
+            # Only the leaf's own mtime changes when a file is added to it.
+            server.files["site/2024/01/02/e.csv"] = generate_csv(10)
+            server.mtimes["site/2024/01/02"] = server.mtime + 60
+            assert "site/2024/01/02/e.csv" in crawler.walk()
+            assert listed.call_count == 22
+
+            server.files["site/2024/01/03/d.csv"] = generate_csv(10)
+            assert "site/2024/01/03/d.csv" in crawler.walk()
+
+            assert list(RemoteCrawler(pool, max_depth=0).walk()) == ["top.csv"]
+            assert sorted(RemoteCrawler(pool, include=["site/2024/*.csv"]).walk()) == [
+                "site/2024/01/01/a.csv", "site/2024/01/02/b.csv", "site/2024/01/02/e.csv",
+                "site/2024/01/03/d.csv"]
+            missing = RemoteCrawler(pool, root="missing")
+            assert list(missing.walk()) == []
+            assert missing.errors[0][0] == "missing"
+            pool.close()
+
+    def test_crawler_records_listing_errors_and_continues(self):
+        files = {name: generate_csv(10) for name in (
+            "site/a/a.csv", "site/busy/b.csv", "site/gone/c.csv", "site/d.csv")}
+
+        def flaky_listing(ftp, path=""):
+            if path == "site/busy":
+                raise ftplib.error_temp("450 site/busy: Directory is busy")
+            if path == "site/gone":
+                raise EOFError()
+            return list_directory(ftp, path)
+
+        with LocalFTPServer(files) as server, \
+                patch("ftp_csv.list_directory", side_effect=flaky_listing):
+            pool = FTPConnectionPool(server.host, server.user, server.password,
+                                     port=server.port, size=2, backoff=0)
+            crawler = RemoteCrawler(pool)
+            assert sorted(crawler.walk()) == ["site/a/a.csv", "site/d.csv"]
+            assert sorted(crawler.errors) == [
+                ("site/busy", "450 site/busy: Directory is busy"),
+                ("site/gone", "EOFError")]
+            pool.close()
+
+    def test_ingest_recursive_streams_discovered_files(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.chdir(tmp_path)
+        files = {"site/2024/01/01/a.csv": generate_csv(20),
+                 "site/2024/01/02/b.csv": generate_csv(20, 0.1),
+                 "site/2024/01/02/skip.csv": generate_csv(20),
+                 "other/c.csv": generate_csv(20)}
+        args = ["ingest", "--recursive", "--root", "site", "--exclude", "*/skip.csv",
+                "--batch-index", "", "--workers", "1"]
+        with LocalFTPServer(files) as server:
+            args += ["--host", server.host, "--port", str(server.port),
+                     "--user", server.user, "--password", server.password]
+            assert main(args) == 1
+            first = capsys.readouterr().out.splitlines()
+            assert main(args) == 0
+            second = capsys.readouterr().out.splitlines()
+
+        assert first[-1] == "1 valid, 1 failed"
+        assert any(line.startswith("OK    site/2024/01/01/a.csv") for line in first)
+        assert any(line.startswith("FAIL  site/2024/01/02/b.csv") for line in first)
+        assert second == ["0 valid, 0 failed"]
+
+    def test_ingest_exports_metrics_and_profile(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        METRICS.reset()
+        files = {"good.csv": generate_csv(100),
+                 "bad.csv": generate_csv(100, 0.05, error_kinds=("value_exceeds",))}
+        with LocalFTPServer(files) as server:
+            exit_code = main([
+                "ingest", "--host", server.host, "--port", str(server.port),
+                "--user", server.user, "--password", server.password,
+                "--workers", "1", "--metrics-file", "metrics.prom",
+                "--profile", "ingest.prof"])
+
+        assert exit_code == 1
+        metrics = (tmp_path / "metrics.prom").read_text()
+        for line in ['ftp_csv_files_processed_total{outcome="valid"} 1',
+                     'ftp_csv_files_processed_total{outcome="invalid"} 1',
+                     'ftp_csv_validation_failures_total{rule="value_exceeds"} 1',
+                     f"ftp_csv_bytes_received_total {sum(map(len, files.values()))}",
+                     'ftp_csv_stage_seconds_count{stage="validate"} 2',
+                     'ftp_csv_stage_seconds_count{stage="download"} 2']:
+            assert line in metrics.splitlines(), line
+        for stage in ("connect", "list", "retr", "write", "hash_and_validate"):
+            assert f'stage_seconds_count{{stage="{stage}"}}' in metrics, stage
+        assert pstats.Stats(str(tmp_path / "ingest.prof")).total_calls > 0
+
+    def test_async_client_matches_blocking_client(self):
+        files = {f"{i}.csv": generate_csv(500, 0.01 if i % 3 else 0, seed=i)
+                 for i in range(12)}
+        files["notes.txt"] = "café ✓".encode() * 30000
+
+        async def run(server):
+            client = AsyncFTPClient(connections=3)
+            connected = await client.connect(
+                server.host, server.user, server.password, server.port)
+            names = await client.get_file_list()
+            text = await client.download_file("notes.txt")
+            results = await client.validate_files([n for n in names if n.endswith(".csv")])
+            idle = len(client._idle)
+            await client.disconnect()
+            return connected, names, text, results, idle
+
+        METRICS.reset()
+        with LocalFTPServer(files) as server:
+            connected, names, text, results, idle = asyncio.run(run(server))
+            blocking = FTPClient()
+            blocking.connect(server.host, server.user, server.password, server.port)
+            assert names == blocking.get_file_list()
+            assert text == blocking.download_file("notes.txt")
+            blocking.disconnect()
+
+        assert connected == (True, "Connected to FTP server")
+        assert results == {name: FileValidator.validate(data.decode())
+                           for name, data in files.items() if name.endswith(".csv")}
+        assert results["1.csv"][0] is False and results["3.csv"][0] is True
+        assert idle == 3
+        assert "ftp_csv_connections_opened_total 4" in METRICS.render().splitlines()
+
+    def test_async_client_reuses_connection_after_abandoned_transfer(self):
+        data = generate_csv(50000)
+
+        async def run(server):
+            client = AsyncFTPClient(connections=1)
+            failed = await AsyncFTPClient().connect(server.host, server.user, "wrong", server.port)
+            await client.connect(server.host, server.user, server.password, server.port)
+            async with aclosing(client.iter_file("big.csv", rest=10)) as chunks:
+                async for chunk in chunks:
+                    first = chunk
+                    break
+            missing = await client.download_file("missing.csv")
+            size = await client.get_size("big.csv")
+            content = await client.download_file("big.csv")
+            await client.disconnect()
+            return failed, first, missing, size, content
+
+        with LocalFTPServer({"big.csv": data}) as server:
+            failed, first, missing, size, content = asyncio.run(run(server))
+
+        assert failed[0] is False and "530" in failed[1]
+        assert data[10:].startswith(first)
+        assert missing == ""
+        assert size == len(data) and content == data.decode()
+
+    def test_validate_command_checks_local_files(self, tmp_path, capsys):
+        good, bad = tmp_path / "good.csv", tmp_path / "bad.csv"
+        good.write_bytes(generate_csv(2000))
+        bad.write_bytes(generate_csv(2000, 0.01, 0.8, ("duplicate_batch_id",)))
+
+        exit_code = main(["validate", str(good), str(bad), "--workers", "2",
+                          "--chunk-size", "0.01"])
+
+        assert exit_code == 1
+        out = capsys.readouterr().out.splitlines()
+        assert out[0] == f"OK    {good}"
+        assert out[1] == f"FAIL  {bad}: {FileValidator.validate_file(str(bad))[1]}"
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        METRICS.inc("test_requests", method="GET")
+        server = METRICS.serve(0, "127.0.0.1")
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            body = urllib.request.urlopen(f"{url}/metrics").read().decode()
+            assert 'ftp_csv_test_requests_total{method="GET"}' in body
+            try:
+                urllib.request.urlopen(f"{url}/other")
+                assert False, "expected 404"
+            except urllib.error.HTTPError as e:
+                assert e.code == 404
+        finally:
+            server.shutdown()
+            server.server_close()
+
     # Integration Testing
     @patch("requests.get")
     def test_get_uuid_success(self, mock_get):
@@ -50,3 +800,52 @@ class TestIntegration:
         result = client.get_uuid()
 
         assert result == "unknown_uuid"
+
+    @patch("requests.get")
+    def test_log_uses_local_uuid_without_network(self, mock_get):
+        client = Logger()
+        client.log("boom")
+
+        mock_get.assert_not_called()
+        [line], _ = client.buffer.since(0)
+        logged_uuid = line.split("[UUID: ")[1].split("]")[0]
+        assert len(logged_uuid) == 36
+
+    @patch("requests.get")
+    def test_remote_uuid_pool_serves_prefetched_uuids(self, mock_get):
+        mock_response = Mock()
+        mock_response.raise_for_status = Mock()
+        mock_response.json.return_value = ["1234-abcd", "5678-efgh"]
+        mock_get.return_value = mock_response
+
+        pool = RemoteUUIDPool(batch_size=2, low_water=0)
+        assert pool.prefetch() == 2
+
+        assert pool() == "1234-abcd"
+        assert pool() == "5678-efgh"
+        mock_get.assert_called_once()
+
+    @patch("requests.get")
+    def test_remote_uuid_pool_falls_back_when_empty(self, mock_get):
+        mock_get.side_effect = Exception("API down")
+
+        pool = RemoteUUIDPool(low_water=0)
+
+        assert len(pool()) == 36
+        mock_get.assert_not_called()
+
+    def test_log_is_written_in_background_and_buffered(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        client = Logger(uuid_provider=lambda: "fixed-uuid")
+        for i in range(5):
+            client.log(f"error {i}")
+
+        lines, count = client.buffer.since(3)
+        assert count == 5
+        assert [line.split("] ")[1] for line in lines] == ["error 3", "error 4"]
+
+        client.flush()
+        with open(ERROR_LOG_FILE) as log_file:
+            written = log_file.read().splitlines()
+        assert len(written) == 5
+        assert written[-1].endswith("[UUID: fixed-uuid] error 4")